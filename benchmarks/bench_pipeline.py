@@ -0,0 +1,378 @@
+"""Benchmark collision processing stages and helpers on synthetic data.
+
+Synthetic collision csv files and precinct and district geojson polygons within
+NYC limits are generated at each size (and reused on later runs). Each stage of
+process_data is timed, then run again to measure peak memory allocated with
+tracemalloc. Results are saved as JSON so runs on different commits can be
+compared. Results are written to benchmarks/results by default, which is
+git-ignored, so runs are not committed.
+
+Run from the repository root with python -m benchmarks.bench_pipeline
+"""
+
+import argparse
+import datetime
+import json
+import os
+import os.path
+import platform
+import subprocess
+import time
+import tracemalloc
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import process_raw_data as prd
+import src.utils
+import src.visualizations as viz
+from src.constants import (
+    NYC_WEST_LIMIT,
+    NYC_EAST_LIMIT,
+    NYC_SOUTH_LIMIT,
+    NYC_NORTH_LIMIT,
+)
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000, 5_000_000)
+DEFAULT_DATA_DIR = "data/benchmarks"
+DEFAULT_RESULTS_DIR = "benchmarks/results"
+SEED = 0
+
+# raw fields that are not read by process_data, so csv loading skips them
+EXTRA_FIELDS = {
+    "BOROUGH": ["BROOKLYN", "QUEENS", "MANHATTAN", "BRONX", "STATEN ISLAND", ""],
+    "ON STREET NAME": ["BROADWAY", "ATLANTIC AVENUE", "NORTHERN BOULEVARD", ""],
+    "CONTRIBUTING FACTOR VEHICLE 1": [
+        "Driver Inattention/Distraction",
+        "Unspecified",
+        "Failure to Yield Right-of-Way",
+    ],
+    "VEHICLE TYPE CODE 1": ["Sedan", "Station Wagon/Sport Utility Vehicle", "Taxi"],
+}
+FIRST_DATE = "2012-07-01"
+LAST_DATE = "2024-06-30"
+MISSING_LOCATION_SHARE = 0.08  # share of collisions without coordinates
+ZERO_LOCATION_SHARE = 0.01  # share of collisions at (0, 0), outside NYC
+
+# location feature name -> (geojson property, grid rows, grid columns), with
+# about as many polygons as precincts and council districts
+POLYGON_GRIDS = {
+    "precinct": ("precinct", 7, 11),
+    "district": ("coun_dist", 3, 17),
+}
+# polygon edges are split into segments of at most this length (degrees), so
+# polygons have over a hundred vertices, since nearest polygon queries take time
+# proportional to vertices (real boundaries have more)
+POLYGON_SEGMENT_LENGTH = 0.002
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark collision processing stages on synthetic data"
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_SIZES),
+        help="Numbers of synthetic collisions (default "
+        f"{' '.join(str(size) for size in DEFAULT_SIZES)})",
+        metavar="",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="JSON results path "
+        f"(default {DEFAULT_RESULTS_DIR}/pipeline-<commit>.json)",
+        metavar="",
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        default=None,
+        help="JSON results of a previous run to compare times with",
+        metavar="",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=DEFAULT_DATA_DIR,
+        help=f"Directory of generated synthetic data (default {DEFAULT_DATA_DIR})",
+        metavar="",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=1,
+        help="Number of times each stage is timed, the fastest is kept (default 1)",
+        metavar="",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Only time stages, without running them again to measure memory",
+    )
+    return parser.parse_args()
+
+
+def make_collisions(n: int, seed: int = SEED):
+    """Return DataFrame of n random raw collisions, like the raw collision csv."""
+    rng = np.random.default_rng(seed)
+    # strings are built once per unique date and time, then repeated by code
+    dates = pd.date_range(FIRST_DATE, LAST_DATE, freq="D").strftime("%m/%d/%Y")
+    times = [f"{hour}:{minute:02d}" for hour in range(24) for minute in range(60)]
+    lat = rng.uniform(NYC_SOUTH_LIMIT, NYC_NORTH_LIMIT, n)
+    long = rng.uniform(NYC_WEST_LIMIT, NYC_EAST_LIMIT, n)
+    location_kind = rng.random(n)
+    is_missing = location_kind < MISSING_LOCATION_SHARE
+    is_zero = ~is_missing & (
+        location_kind < MISSING_LOCATION_SHARE + ZERO_LOCATION_SHARE
+    )
+    lat[is_missing], long[is_missing] = np.nan, np.nan
+    lat[is_zero], long[is_zero] = 0, 0
+
+    crashes = pd.DataFrame(
+        {
+            "CRASH DATE": pd.Categorical.from_codes(
+                rng.integers(0, len(dates), n), categories=dates
+            ),
+            "CRASH TIME": pd.Categorical.from_codes(
+                rng.integers(0, len(times), n), categories=times
+            ),
+            "LATITUDE": lat.round(6),
+            "LONGITUDE": long.round(6),
+        }
+    )
+    for field, values in EXTRA_FIELDS.items():
+        crashes[field] = pd.Categorical.from_codes(
+            rng.integers(0, len(values), n), categories=values
+        )
+    for person, rate in (("PEDESTRIANS", 0.05), ("CYCLIST", 0.02), ("MOTORIST", 0.2)):
+        crashes[f"NUMBER OF {person} INJURED"] = rng.poisson(rate, n)
+        crashes[f"NUMBER OF {person} KILLED"] = rng.poisson(rate / 200, n)
+    crashes["COLLISION_ID"] = rng.permutation(n) + 3_000_000
+    return crashes
+
+
+def make_polygons(rows: int, cols: int):
+    """Return list of grid polygons covering NYC limits, with densified edges."""
+    lat_edges = np.linspace(NYC_SOUTH_LIMIT, NYC_NORTH_LIMIT, rows + 1)
+    long_edges = np.linspace(NYC_WEST_LIMIT, NYC_EAST_LIMIT, cols + 1)
+    boxes = [
+        shapely.box(long_edges[j], lat_edges[i], long_edges[j + 1], lat_edges[i + 1])
+        for i in range(rows)
+        for j in range(cols)
+    ]
+    return list(shapely.segmentize(boxes, POLYGON_SEGMENT_LENGTH))
+
+
+def write_geojson(path: str, property_name: str, rows: int, cols: int):
+    """Write geojson of grid polygons with ids "1", "2", ... in property_name."""
+    features = [
+        {
+            "type": "Feature",
+            "properties": {property_name: str(i + 1)},
+            "geometry": shapely.geometry.mapping(polygon),
+        }
+        for i, polygon in enumerate(make_polygons(rows, cols))
+    ]
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump({"type": "FeatureCollection", "features": features}, fp)
+
+
+def synthetic_data(data_dir: str, n: int):
+    """Return paths of synthetic collision csv and location geojson files.
+
+    Files are generated if they do not exist yet.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    csv_path = os.path.join(data_dir, f"collisions_{n}.csv")
+    if not os.path.exists(csv_path):
+        make_collisions(n).to_csv(csv_path, index=False)
+    geojson_paths = {}
+    for feature_name, (property_name, rows, cols) in POLYGON_GRIDS.items():
+        path = os.path.join(data_dir, f"{feature_name}.geojson")
+        if not os.path.exists(path):
+            write_geojson(path, property_name, rows, cols)
+        geojson_paths[feature_name] = path
+    return csv_path, geojson_paths
+
+
+def measure(func, *args, repeat: int = 1, memory: bool = True):
+    """Return result of func, fastest seconds of repeat calls, and peak MB.
+
+    Peak memory allocated is measured in another call, since tracing allocations slows
+    func down, and is None if memory is False. func must not modify its
+    arguments in a way that changes later calls.
+    """
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1024**2
+    return result, seconds, peak_mb
+
+
+def load_csv(path: str):
+    """Return raw collisions read and renamed as in process_data."""
+    return next(prd.parse_collisions(path))
+
+
+def make_points(crashes: pd.DataFrame):
+    """Return gpd.GeoDataFrame of collisions with Point geometry."""
+    points = src.utils.points_from_lat_long(crashes["LAT"], crashes["LONG"])
+    return gpd.GeoDataFrame(crashes, geometry=points)
+
+
+def add_features(crashes: pd.DataFrame, locations: dict):
+    """Return process_raw_data.add_features of a copy of raw collisions.
+
+    The copy keeps the raw collisions unchanged for repeated calls.
+    """
+    return prd.add_features(crashes.copy(), locations)
+
+
+def bench_size(n: int, data_dir: str, repeat: int = 1, memory: bool = True):
+    """Return list of result dictionaries of each stage for n collisions."""
+    csv_path, geojson_paths = synthetic_data(data_dir, n)
+    results = []
+
+    def run(stage, func, *args):
+        result, seconds, peak_mb = measure(func, *args, repeat=repeat, memory=memory)
+        results.append(
+            {"rows": n, "stage": stage, "seconds": seconds, "peak_memory_mb": peak_mb}
+        )
+        print(
+            f"{n:>10,} {stage:<26} {seconds:>8.3f} s"
+            + ("" if peak_mb is None else f" {peak_mb:>10.1f} MB")
+        )
+        return result
+
+    # stages of process_data, see process_raw_data.add_features
+    raw = run("load_csv", load_csv, csv_path)
+    crashes = run("parse_datetimes", prd.index_by_datetime, raw.copy())
+    crashes["season"] = run("seasons", src.utils.dates_to_seasons, crashes.index)
+    crashes = run("flags", prd.add_flags, crashes)
+    run("points", make_points, crashes)
+    features = {
+        feature_name: (path, POLYGON_GRIDS[feature_name][0])
+        for feature_name, path in geojson_paths.items()
+    }
+    locations = run("read_locations", prd.read_locations, None, features)
+    # all of the above plus the nearest precinct and district joins
+    crashes = run("add_features", add_features, raw, locations)
+
+    # helpers used to build charts and maps from processed collisions
+    years = crashes.index.year
+    run(
+        "min_max_across_crosstabs",
+        src.utils.min_max_across_crosstabs,
+        sorted(years.unique()),
+        years,
+        crashes.index.dayofweek,
+        crashes.index.hour,
+    )
+    geom_ids, geoms = src.utils.read_geojson(
+        geojson_paths["precinct"], POLYGON_GRIDS["precinct"][0]
+    )
+    geoseries = gpd.GeoSeries(
+        geoms, index=pd.Index([int(x) for x in geom_ids], name="precinct")
+    )
+    run(
+        "prep_choropleth_df",
+        viz.prep_choropleth_df,
+        crashes,
+        crashes["serious"],
+        "precinct",
+        "ID",
+        geoseries,
+        years.nunique(),
+        "count",
+        True,
+    )
+    return results
+
+
+def git_commit():
+    """Return the current git commit hash, or None outside a git repository."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: list, data_dir: str, repeat: int = 1, memory: bool = True):
+    """Return dictionary of run metadata and results of every size and stage."""
+    results = []
+    for n in sizes:
+        results.extend(bench_size(n, data_dir, repeat, memory))
+    return {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "packages": {
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "geopandas": gpd.__version__,
+            "shapely": shapely.__version__,
+        },
+        "results": results,
+    }
+
+
+def compare_results(current: dict, baseline: dict):
+    """Print the time of each stage relative to a baseline run."""
+    baseline_seconds = {
+        (result["rows"], result["stage"]): result["seconds"]
+        for result in baseline["results"]
+    }
+    print(f"\nCompared with {baseline['commit']} (ratio > 1 is slower)")
+    for result in current["results"]:
+        previous = baseline_seconds.get((result["rows"], result["stage"]))
+        if previous:
+            print(
+                f"{result['rows']:>10,} {result['stage']:<26} "
+                f"{result['seconds'] / previous:>8.2f}x"
+            )
+
+
+def main():
+    """Run benchmarks, save results, and compare with a previous run."""
+    cl_args = parse_args()
+    run_results = run_benchmarks(
+        cl_args.sizes, cl_args.data_dir, cl_args.repeat, not cl_args.no_memory
+    )
+    output = cl_args.output or os.path.join(
+        DEFAULT_RESULTS_DIR,
+        f"pipeline-{(run_results['commit'] or 'unknown')[:10]}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fp:
+        json.dump(run_results, fp, indent=2)
+    print(f"Results saved to {output}")
+    if cl_args.compare:
+        with open(cl_args.compare, encoding="utf-8") as fp:
+            compare_results(run_results, json.load(fp))
+
+
+if __name__ == "__main__":
+    main()
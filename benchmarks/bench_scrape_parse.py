@@ -0,0 +1,64 @@
+"""Benchmark full and targeted parsing of saved City Council district pages.
+
+Run from the repository root with python -m benchmarks.bench_scrape_parse
+"""
+
+import argparse
+import glob
+import os.path
+import timeit
+import src.scrape_city_council as scc
+
+FIXTURES_GLOB = "tests/fixtures/district_pages/district-*.html"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark district page parsing")
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=20,
+        help="Number of times each page is parsed (default 20)",
+        metavar="",
+    )
+    return parser.parse_args()
+
+
+def read_pages(pattern: str = FIXTURES_GLOB):
+    """Return dictionary of district number to saved page HTML."""
+    pages = {}
+    for path in sorted(glob.glob(pattern)):
+        district_num = int(os.path.basename(path)[len("district-") : -len(".html")])
+        with open(path, encoding="utf-8") as fp:
+            pages[district_num] = fp.read()
+    return pages
+
+
+def parse_pages(pages: dict, targeted: bool):
+    """Parse every page."""
+    for district_num, text in pages.items():
+        scc.parse_district_page(text, district_num, targeted)
+
+
+def bench_parse(pages: dict, number: int):
+    """Return mean seconds per page parse for full and targeted parsing."""
+    results = {}
+    for mode, targeted in (("full", False), ("targeted", True)):
+        timer = timeit.Timer(lambda targeted=targeted: parse_pages(pages, targeted))
+        results[mode] = timer.timeit(number=number) / number / len(pages)
+    return results
+
+
+def main():
+    """Run benchmarks and print mean parse times."""
+    cl_args = parse_args()
+    timings = bench_parse(read_pages(), cl_args.number)
+    for mode, mean in timings.items():
+        print(f"{mode:>8}: {mean * 1000:.2f} ms per page")
+    print(f" speedup: {timings['full'] / timings['targeted']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,641 @@
+"""Build static site charts and maps from processed collision data.
+
+Every site asset is a target with the data files and parameters it is built
+from. Only targets that are missing or whose files or parameters changed since
+they were last built are rebuilt, and targets are built in a process pool.
+"""
+
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import os.path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import folium
+import pandas as pd
+from matplotlib.ticker import StrMethodFormatter
+
+import process_raw_data
+import src.cache
+import src.cube
+import src.hotspots
+import src.storage
+import src.tiles
+import src.utils
+import src.visualizations as viz
+from src.constants import (
+    DAY_OF_WEEK_MAP,
+    MONTHS_MAP,
+    NYC_MAP_CENTER,
+)
+
+SITE_CONTENT_DIR = "docs/content"
+SITE_MANIFEST_LOC = os.path.join(src.cache.DEFAULT_CACHE_DIR, "site_manifest.json")
+
+# code that every target is built with
+CODE_DEPS = [
+    __file__,
+    process_raw_data.__file__,
+    viz.__file__,
+    src.cube.__file__,
+    src.hotspots.__file__,
+    src.storage.__file__,
+    src.tiles.__file__,
+    src.utils.__file__,
+]
+
+# trends and choropleths cover whole years, see docs/_includes/analysis_data_range
+ANALYSIS_START = "2013-01-01"
+ANALYSIS_END = "2024-01-01"  # exclusive
+
+# cube dimension -> labels of its values
+DIM_LABELS = {"dayofweek": DAY_OF_WEEK_MAP, "month": MONTHS_MAP}
+# flag -> legend label of average bar charts, unless a chart sets its own
+FLAG_LABELS = {
+    "serious": "Serious\nCollisions",
+    "non-motorist": "Collisions with\nPedestrians and Cyclists",
+}
+BOXED_BAR_LABEL = {"facecolor": "white", "edgecolor": "none", "alpha": 0.8}
+MARKER_MAP_FIELDS = ["LAT", "LONG", "DATE", "TIME", "INJURED", "KILLED"]
+# tile pyramids of tiled marker maps are in directories named after the map
+MARKER_TILES_SUFFIX = "_tiles"
+MARKER_POPUP_FORMAT = (
+    "'DATE: ' + row[2] + '<br>' +"
+    "'TIME: ' + row[3] + '<br>' +"
+    "'PEOPLE INJURED: ' + row[4] + '<br>' +"
+    "'PEOPLE KILLED: ' + row[5]};"
+)
+CHOROPLETH_FLAGS = {
+    "serious": "Serious Collisions",
+    "pedestrian": "Collisions with Pedestrians",
+    "cyclist": "Collisions with Cyclists",
+    "fatal": "Fatal Collisions",
+}
+# location feature -> (site directory, label)
+CHOROPLETH_FEATURES = {
+    "precinct": ("police", "Precinct"),
+    "district": ("citycouncil", "District"),
+}
+# flag -> hotspot neighborhood radius in meters and collisions within it,
+# fewer for the rarer pedestrian and cyclist collisions
+HOTSPOT_PARAMS = {
+    "serious": (100, 150),
+    "pedestrian": (100, 40),
+    "cyclist": (100, 20),
+}
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build site charts and maps")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes that build targets (default number of CPUs)",
+        metavar="",
+    )
+    parser.add_argument(
+        "-t",
+        "--targets",
+        default="*",
+        help="Only build targets with paths matching this glob pattern",
+        metavar="",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Build targets even if they are up to date",
+    )
+    parser.add_argument(
+        "--tiled-maps",
+        action="store_true",
+        help="Build marker maps that load pre-clustered tiles as they are viewed",
+    )
+    return parser.parse_args()
+
+
+def path_digest(path: str):
+    """Return digest of file, or of all files in directory."""
+    if not os.path.isdir(path):
+        return src.cache.file_digest(path)
+    paths = sorted(
+        p
+        for p in glob.glob(os.path.join(path, "**", "*"), recursive=True)
+        if os.path.isfile(p)
+    )
+    return src.cache.make_key(
+        "directory",
+        *[(os.path.relpath(p, path), src.cache.file_digest(p)) for p in paths],
+    )
+
+
+def target_stamp(target: dict):
+    """Return key identifying the build function, dependencies, and parameters."""
+    return src.cache.make_key(
+        "site",
+        target["build"].__name__,
+        [path_digest(dep) for dep in target["deps"]],
+        target["params"],
+    )
+
+
+def read_manifest(path: str):
+    """Return dictionary of target path to stamp it was last built with."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def write_manifest(manifest: dict, path: str):
+    """Write dictionary of target path to stamp it was last built with."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+
+
+def build_target(path: str, target: dict):
+    """Build target at path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    target["build"](path, **target["params"])
+
+
+def build_site(
+    targets: dict,
+    workers: int = 1,
+    force: bool = False,
+    manifest_path: str = SITE_MANIFEST_LOC,
+):
+    """Build targets that are missing or out of date and return their paths.
+
+    Args:
+        targets (dict): Target path to dictionary with "build", a module-level
+            function called with the path and params, "deps", a list of files
+            or directories the target is built from, and "params", a dictionary
+            of build function keyword arguments with a stable repr. An optional
+            "prepare" list of (function, *args) tuples is called once in this
+            process before targets are built, e.g. to cache shared inputs.
+        workers (int): Number of processes that build targets.
+        force (bool): Whether to build all targets.
+        manifest_path (str): JSON file recording the stamp of each built target.
+
+    Returns:
+        list: Paths of built targets.
+
+    """
+    manifest = read_manifest(manifest_path)
+    stamps = {path: target_stamp(target) for path, target in targets.items()}
+    stale = [
+        path
+        for path in targets
+        if force or manifest.get(path) != stamps[path] or not os.path.exists(path)
+    ]
+    if not stale:
+        return stale
+
+    # shared inputs are computed once here, instead of by racing workers
+    prepare = dict.fromkeys(
+        step for path in stale for step in targets[path].get("prepare", [])
+    )
+    for func, *args in prepare:
+        func(*args)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(stale))) as executor:
+        futures = {
+            executor.submit(build_target, path, targets[path]): path for path in stale
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            future.result()
+            # recorded as each target is built so a failure doesn't rebuild others
+            manifest[path] = stamps[path]
+            write_manifest(manifest, manifest_path)
+            print(f"Built {path}")
+    return stale
+
+
+def days_of_week(start: str, end: str):
+    """Return Series of number of each day of week from start to end (exclusive)."""
+    dates = pd.date_range(start, end, inclusive="left")
+    return pd.Series(dates.dayofweek).value_counts().sort_index()
+
+
+def analysis_years():
+    """Return list of years in the analysis period."""
+    return list(
+        range(pd.Timestamp(ANALYSIS_START).year, pd.Timestamp(ANALYSIS_END).year)
+    )
+
+
+def average_totals(cube: pd.DataFrame, dims, flag: str, average: str = None):
+    """Return collisions with flag in the analysis period summed over dims.
+
+    Sums are averaged per year if average is "years", or per day of week if
+    average is "days", in which case the first of dims must be "dayofweek".
+    """
+    years = analysis_years()
+    totals = src.cube.totals(cube, dims, flag, year=years)
+    if average is None:
+        return totals
+    if average == "years":
+        return totals / len(years)
+    if average == "days":
+        days = days_of_week(ANALYSIS_START, ANALYSIS_END)
+        return totals / days.reindex(totals.index.get_level_values(0)).to_numpy()
+    raise ValueError(f"Unknown average {average!r}")
+
+
+def chart_args(args: dict):
+    """Return chart function arguments with format strings made into formatters."""
+    args = dict(args)
+    if "yaxis_format" in args:
+        args["yaxis_format"] = StrMethodFormatter(args["yaxis_format"])
+    return args
+
+
+def build_average_bar_chart(
+    path: str,
+    dim: str,
+    average: str = None,
+    flag_labels: dict = None,
+    **bar_chart_args,
+):
+    """Build grouped bar chart of average serious and non-motorist collisions.
+
+    Flag_labels is a dictionary of flag to legend label, default FLAG_LABELS.
+    """
+    flag_labels = FLAG_LABELS if flag_labels is None else flag_labels
+    cube = src.cube.read_cube(process_raw_data.PROCESSED_CUBE_LOC)
+    df = pd.DataFrame(
+        {flag: average_totals(cube, dim, flag, average) for flag in flag_labels}
+    )
+    if dim in DIM_LABELS:
+        df.index = df.index.map(DIM_LABELS[dim])
+    spec = {
+        "kind": "grouped_bar_chart",
+        "df": df,
+        "legend_labels": list(flag_labels.values()),
+        "save": path,
+    }
+    viz.render_charts([{**spec, **chart_args(bar_chart_args)}])
+
+
+def build_yearly_injuries_deaths(path: str, **bar_chart_args):
+    """Build grouped bar chart of annual injuries and deaths."""
+    fields = ["INJURED", "KILLED"]
+    non_motorist_fields = {
+        field: [f"PEDESTRIAN {field}", f"CYCLIST {field}"] for field in fields
+    }
+    crashes = src.storage.read_crashes(
+        process_raw_data.PROCESSED_DATA_LOC,
+        columns=fields + sum(non_motorist_fields.values(), []),
+        start=pd.Timestamp(ANALYSIS_START),
+        end=pd.Timestamp(ANALYSIS_END),
+        geometry=False,
+    )
+    yearly = crashes.groupby(crashes.index.year).sum()
+    df = pd.DataFrame(index=yearly.index)
+    for field in fields:
+        df[f"Total {field}"] = yearly[field]
+        df[f"Non-motorist {field}"] = yearly[non_motorist_fields[field]].sum(axis=1)
+    spec = {
+        "kind": "grouped_bar_chart",
+        "df": df,
+        "legend_labels": [
+            "Total\nInjured",
+            "Pedestrians and\nCyclists Injured",
+            "Total\nKilled",
+            "Pedestrians and\nCyclists Killed",
+        ],
+        "save": path,
+    }
+    viz.render_charts([{**spec, **chart_args(bar_chart_args)}])
+
+
+def build_hour_of_week_heat_map(path: str, flag: str, labels: dict):
+    """Build heat map of average collisions per hour of week."""
+    cube = src.cube.read_cube(process_raw_data.PROCESSED_CUBE_LOC)
+    averages = average_totals(cube, ["dayofweek", "hour"], flag, "days")
+    crosstab = averages.unstack("hour", fill_value=0)
+    crosstab.index = crosstab.index.map(DAY_OF_WEEK_MAP)
+    spec = {
+        "kind": "heat_map",
+        "pd_ct": crosstab,
+        "labels": labels,
+        "interpolation": "bicubic",
+        "save": path,
+    }
+    viz.render_charts([spec])
+
+
+def read_flagged_crashes(columns: list, flag: str, start=None, end=None):
+    """Return collisions with valid coordinates and flag, which may be "fatal"."""
+    flags = ["valid_lat_long"] if flag == "fatal" else ["valid_lat_long", flag]
+    read_columns = list(dict.fromkeys([*columns, "KILLED"]))
+    crashes = src.storage.read_crashes(
+        process_raw_data.PROCESSED_DATA_LOC,
+        columns=read_columns,
+        start=None if start is None else pd.Timestamp(start),
+        end=None if end is None else pd.Timestamp(end),
+        flags=flags,
+        geometry=False,
+    )
+    if flag == "fatal":
+        crashes = crashes[crashes["KILLED"] > 0]
+    return crashes[columns]
+
+
+def build_marker_map(
+    path: str, flag: str, start: str = None, end: str = None, tiled: bool = False
+):
+    """Build marker cluster map of collisions with flag from start to end.
+
+    If tiled, the map loads a tile pyramid written next to it to a directory
+    named after the map with MARKER_TILES_SUFFIX.
+    """
+    map_data = read_flagged_crashes(MARKER_MAP_FIELDS, flag, start, end)
+    if tiled:
+        tiles_dir = os.path.splitext(path)[0] + MARKER_TILES_SUFFIX
+        src.tiles.write_tile_pyramid(map_data, tiles_dir)
+        fmap = viz.make_marker_map(
+            None, MARKER_POPUP_FORMAT, tiles_url=os.path.basename(tiles_dir)
+        )
+    else:
+        fmap = viz.make_marker_map(map_data, MARKER_POPUP_FORMAT, compact=True)
+    fmap.save(path)
+
+
+def build_cluster_map(
+    path: str,
+    flag: str,
+    eps: float,
+    min_samples: float,
+    start: str = None,
+    end: str = None,
+    top: int = src.hotspots.DEFAULT_TOP_CLUSTERS,
+):
+    """Build map of collisions with flag in the top hotspot clusters."""
+    crashes = read_flagged_crashes(
+        src.hotspots.CLUSTER_MAP_FIELDS[:-1], flag, start, end
+    )
+    labels = src.hotspots.find_hotspots(crashes, eps, min_samples)
+    clusters = src.hotspots.rank_clusters(crashes, labels, top=top)
+    map_data = src.hotspots.cluster_map_data(crashes, labels, clusters)
+    viz.make_marker_map(
+        map_data,
+        src.hotspots.CLUSTER_POPUP_FORMAT,
+        compact=True,
+        color_field=src.hotspots.CLUSTER_MAP_FIELDS.index("CLUSTER"),
+    ).save(path)
+
+
+def build_point_map(
+    path: str,
+    flag: str,
+    start: str = None,
+    end: str = None,
+    top: int = src.hotspots.DEFAULT_TOP_POINTS,
+):
+    """Build map of the top locations of collisions with flag."""
+    crashes = read_flagged_crashes(
+        ["LAT", "LONG", "INJURED", "KILLED"], flag, start, end
+    )
+    points = src.hotspots.rank_points(crashes, top=top)
+    viz.make_marker_map(
+        points[src.hotspots.POINT_MAP_FIELDS],
+        src.hotspots.POINT_POPUP_FORMAT,
+        compact=True,
+    ).save(path)
+
+
+def read_region_totals(region: str):
+    """Return src.cube.region_totals of collisions with valid coordinates.
+
+    Totals are cached, so that they are computed once for every choropleth of
+    region. Choropleth targets prepare the cache before they are built.
+    """
+    key = src.cache.make_key(
+        "region totals", path_digest(process_raw_data.PROCESSED_DATA_LOC), region
+    )
+
+    def compute():
+        crashes = src.storage.read_crashes(
+            process_raw_data.PROCESSED_DATA_LOC,
+            columns=[
+                region,
+                "INJURED",
+                "KILLED",
+                "serious",
+                "non-motorist",
+                "cyclist",
+                "pedestrian",
+            ],
+            flags=["valid_lat_long"],
+            geometry=False,
+        )
+        return src.cube.region_totals(crashes, region)
+
+    return src.cache.cached(key, compute, src.cache.DEFAULT_CACHE_DIR)
+
+
+def build_choropleth(
+    path: str,
+    feature: str,
+    flag: str,
+    geojson_path: str,
+    geojson_property: str,
+    label: str,
+    legend_name: str,
+):
+    """Build choropleth map of average annual collisions with flag by feature."""
+    years = analysis_years()
+    gdf = viz.choropleth_gdf(
+        read_region_totals(feature),
+        viz.simplified_geometry(
+            geojson_path,
+            geojson_property,
+            feature,
+            cache_dir=src.cache.DEFAULT_CACHE_DIR,
+        ),
+        flag,
+        years=years,
+        divisor=len(years),
+        round_decimal=1,
+        value_col="ID",
+    )
+    choro_map = folium.Map(
+        location=NYC_MAP_CENTER, zoom_start=10, tiles="OpenStreetMap"
+    )
+    viz.add_choropleth(
+        choro_map,
+        gdf,
+        feature,
+        "ID",
+        tooltip_cols=[feature, "ID"],
+        tooltip_aliases=[label, "Average Annual Collisions"],
+        legend_name=legend_name,
+    )
+    choro_map.save(path)
+
+
+def site_targets(content_dir: str = SITE_CONTENT_DIR, tiled_maps: bool = False):
+    """Return dictionary of every site target path to target, see build_site.
+
+    If tiled_maps, marker maps load pre-clustered tiles, see build_marker_map.
+    """
+    cube_deps = [process_raw_data.PROCESSED_CUBE_LOC, *CODE_DEPS]
+    data_deps = [process_raw_data.PROCESSED_DATA_LOC, *CODE_DEPS]
+    bar_args = {
+        "ylabel_pad": 10,
+        "yaxis_format": "{x:,.0f}",
+        "legend_args": {"loc": "upper left", "legend_bbox": (0.9, 0.89)},
+    }
+    trends = os.path.join(content_dir, "trends", "images")
+    targets = {
+        os.path.join(trends, "weekly.png"): {
+            "build": build_average_bar_chart,
+            "deps": cube_deps,
+            "params": {
+                "dim": "dayofweek",
+                "average": "days",
+                "title": "Average Daily Collisions",
+                "xlabel": "Day of Week",
+                "bar_digits": 1,
+                **bar_args,
+            },
+        },
+        os.path.join(trends, "monthly.png"): {
+            "build": build_average_bar_chart,
+            "deps": cube_deps,
+            "params": {
+                "dim": "month",
+                "average": "years",
+                "title": "Average Monthly Collisions",
+                "xlabel": "Month",
+                **bar_args,
+            },
+        },
+        os.path.join(trends, "seasonal.png"): {
+            "build": build_average_bar_chart,
+            "deps": cube_deps,
+            "params": {
+                "dim": "season",
+                "average": "years",
+                "title": "Average Number of Collision per Season",
+                "xlabel": "Season",
+                **bar_args,
+            },
+        },
+        os.path.join(trends, "yearly_collisions.png"): {
+            "build": build_average_bar_chart,
+            "deps": cube_deps,
+            "params": {
+                "dim": "year",
+                "title": "Collisions With Injuries or Deaths",
+                "xlabel": "Year",
+                "flag_labels": {
+                    **FLAG_LABELS,
+                    "serious": "Collisions with Injuries\nor Deaths",
+                },
+                "bar_label_bbox": BOXED_BAR_LABEL,
+                **bar_args,
+            },
+        },
+        os.path.join(trends, "yearly_injuries_deaths.png"): {
+            "build": build_yearly_injuries_deaths,
+            "deps": data_deps,
+            "params": {
+                "title": "Annual Injuries and Deaths",
+                "xlabel": "Year",
+                "ylabel": "(log scale)",
+                "ylabel_rotation": "vertical",
+                "ylogscale": True,
+                "bar_label_bbox": BOXED_BAR_LABEL,
+                **bar_args,
+            },
+        },
+    }
+    heat_maps = {
+        "fatal_heat.png": ("fatal", "Fatal Collisions"),
+        "serious_heat.png": ("serious", "Serious Collisions"),
+        "non_motor_heat.png": (
+            "non-motorist",
+            "Collisions with Pedestrians and Cyclists",
+        ),
+    }
+    for name, (flag, title) in heat_maps.items():
+        targets[os.path.join(trends, name)] = {
+            "build": build_hour_of_week_heat_map,
+            "deps": cube_deps,
+            "params": {
+                "flag": flag,
+                "labels": {
+                    "title": f"Average Number of {title} per Hour of Week",
+                    "x_label": "Hour of Day",
+                    "y_label": "",
+                    "cbar_label": "Number of Collisions per Hour",
+                },
+            },
+        }
+
+    marker_maps = {
+        "fatal_map.html": ("fatal", None, None),
+        "serious_map_18_19.html": ("serious", "2018-01-01", "2020-01-01"),
+        "serious_map_20_21.html": ("serious", "2020-01-01", "2022-01-01"),
+        "serious_map_22_23.html": ("serious", "2022-01-01", "2024-01-01"),
+        "pedestrian_map_18_23.html": ("pedestrian", "2018-01-01", "2024-01-01"),
+        "cyclist_map_18_23.html": ("cyclist", "2018-01-01", "2024-01-01"),
+    }
+    for name, (flag, start, end) in marker_maps.items():
+        targets[os.path.join(content_dir, "maps", name)] = {
+            "build": build_marker_map,
+            "deps": data_deps,
+            "params": {"flag": flag, "start": start, "end": end, "tiled": tiled_maps},
+        }
+
+    hotspots = os.path.join(content_dir, "hotspots")
+    for flag, (eps, min_samples) in HOTSPOT_PARAMS.items():
+        targets[os.path.join(hotspots, f"clusters_{flag}_map.html")] = {
+            "build": build_cluster_map,
+            "deps": data_deps,
+            "params": {"flag": flag, "eps": eps, "min_samples": min_samples},
+        }
+        targets[os.path.join(hotspots, f"points_{flag}_map.html")] = {
+            "build": build_point_map,
+            "deps": data_deps,
+            "params": {"flag": flag},
+        }
+
+    for feature, (site_dir, label) in CHOROPLETH_FEATURES.items():
+        geojson_path, geojson_property = process_raw_data.LOCATION_FEATURES[feature]
+        for flag, flag_label in CHOROPLETH_FLAGS.items():
+            path = os.path.join(content_dir, site_dir, f"{feature}_{flag}_map.html")
+            targets[path] = {
+                "build": build_choropleth,
+                "deps": [*data_deps, geojson_path],
+                "prepare": [(read_region_totals, feature)],
+                "params": {
+                    "feature": feature,
+                    "flag": flag,
+                    "geojson_path": geojson_path,
+                    "geojson_property": geojson_property,
+                    "label": label,
+                    "legend_name": f"Average Annual {flag_label}",
+                },
+            }
+    return targets
+
+
+if __name__ == "__main__":
+    cl_args = parse_args()
+    site = {
+        path: target
+        for path, target in site_targets(tiled_maps=cl_args.tiled_maps).items()
+        if fnmatch.fnmatch(path, cl_args.targets)
+    }
+    built = build_site(site, cl_args.workers, cl_args.force)
+    print(f"Built {len(built)} of {len(site)} targets")
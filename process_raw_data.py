@@ -1,18 +1,33 @@
 """Module to process raw collision data into analysis-ready dataset."""
 
+import argparse
+import functools
+import hashlib
+import logging
+import os.path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
+from shapely.strtree import STRtree
 
+import src.cache
+import src.cube
+import src.storage
 import src.utils
 from src.constants import (
     NYC_WEST_LIMIT,
     NYC_EAST_LIMIT,
     NYC_SOUTH_LIMIT,
     NYC_NORTH_LIMIT,
+    SEASONS,
 )
 
-PROCESSED_DATA_LOC = "data/processed/crashes.pkl"
+# processed data is saved as a Parquet dataset partitioned by year
+PROCESSED_DATA_LOC = "data/processed/crashes"
+PROCESSED_PICKLE_LOC = "data/processed/crashes.pkl"
+# precomputed counts and sums for crosstabs, see src.cube
+PROCESSED_CUBE_LOC = "data/processed/cube.parquet"
 
 # downloaded June 2024
 # https://data.cityofnewyork.us/Public-Safety/Motor-Vehicle-Collisions-Crashes/h9gi-nx95
@@ -26,13 +41,178 @@ POLICE_PRECINCT_GEOMS_LOC = "data/raw/police/nyc_police_precincts_geoms.geojson"
 # https://data.cityofnewyork.us/City-Government/City-Council-Districts/yusd-j4xi
 DISTRICT_GEO_LOC = "data/raw/citycouncil/City Council Districts.geojson"
 
+# only the raw fields that are used are read, with compact dtypes
+# person counts are never null in raw data and individual crashes are well under
+# the int16 limit, even after summing pedestrian, cyclist, and motorist counts
+COLLISION_DTYPES = {
+    "COLLISION_ID": "int32",
+    "CRASH DATE": "object",
+    "CRASH TIME": "object",
+    "LATITUDE": "float64",
+    "LONGITUDE": "float64",
+    "NUMBER OF PEDESTRIANS INJURED": "int16",
+    "NUMBER OF CYCLIST INJURED": "int16",
+    "NUMBER OF MOTORIST INJURED": "int16",
+    "NUMBER OF PEDESTRIANS KILLED": "int16",
+    "NUMBER OF CYCLIST KILLED": "int16",
+    "NUMBER OF MOTORIST KILLED": "int16",
+}
 
-def process_data():
-    """Script to process raw collision data into analysis-ready dataset."""
-    # loading downloaded and locally-saved collision data
-    crashes = pd.read_csv(
-        COLLISION_DATA_LOC, dtype={"ZIP CODE": "object"}, low_memory=False
+# fields kept from raw data, after renaming and recalculating injured and killed
+FIELDS_TO_KEEP = [
+    "ID",
+    "DATE",
+    "TIME",
+    "LAT",
+    "LONG",
+    "INJURED",
+    "PEDESTRIAN INJURED",
+    "CYCLIST INJURED",
+    "KILLED",
+    "PEDESTRIAN KILLED",
+    "CYCLIST KILLED",
+]
+
+# version of the code that produces cached parsed collisions, geometries, and
+# location features, part of every cache key. Increase it when that code changes
+# (e.g. prep_collisions or src.utils.ids_nearest_shapes), so stale cache entries
+# are not used
+CACHE_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+# location features: feature name -> (geojson path, geojson property)
+LOCATION_FEATURES = {
+    "precinct": (POLICE_PRECINCT_GEOMS_LOC, "precinct"),
+    "district": (DISTRICT_GEO_LOC, "coun_dist"),
+}
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Process raw collision data into analysis-ready dataset"
+    )
+    parser.add_argument(
+        "-c",
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Number of raw collision rows to process at a time. Bounds peak "
+        "memory use. If not provided, all rows are processed at once",
+        metavar="",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Only process collisions that are new or changed since the previous "
+        "run and merge them into the previously processed data",
+    )
+    parser.add_argument(
+        "-p",
+        "--pickle",
+        action="store_true",
+        help="Also save processed data as a single pickled GeoDataFrame",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to assign precincts and districts",
+        metavar="",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=src.cache.DEFAULT_CACHE_DIR,
+        help="Directory where results of expensive processing stages are cached",
+        metavar="",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=src.cache.DEFAULT_MAX_BYTES / 1024**3,
+        help="Maximum size of cache in GB. Least recently used entries are evicted",
+        metavar="",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read from or write to the cache",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Delete all cache entries before processing",
+    )
+    return parser.parse_args()
+
+
+def read_collisions(path: str, chunksize: int = None, cache_dir: str = None):
+    """Yield renamed collision data with recalculated injured and killed numbers.
+
+    Yields a single DataFrame if chunksize is None, otherwise yields DataFrames
+    with at most chunksize rows. If cache_dir is provided, parsed chunks are read
+    from and saved to the cache.
+    """
+    if cache_dir is None:
+        yield from parse_collisions(path, chunksize)
+        return
+
+    params = (
+        CACHE_VERSION,
+        src.cache.file_digest(path),
+        chunksize,
+        COLLISION_DTYPES,
+        FIELDS_TO_KEEP,
+    )
+    count_key = src.cache.make_key("collision chunk count", *params)
+    num_cached = src.cache.load(count_key, cache_dir)
+    start = 0
+    if num_cached is not None:
+        for i in range(num_cached):
+            chunk = src.cache.load(
+                src.cache.make_key("collisions", *params, i), cache_dir
+            )
+            if chunk is None:  # chunk was evicted
+                break
+            start += 1
+            yield chunk
+        if start == num_cached:
+            return
+
+    num_chunks = 0
+    for i, chunk in enumerate(parse_collisions(path, chunksize)):
+        num_chunks += 1
+        if i >= start:
+            src.cache.store(
+                src.cache.make_key("collisions", *params, i), chunk, cache_dir
+            )
+            yield chunk
+    src.cache.store(count_key, num_chunks, cache_dir)
+
+
+def parse_collisions(path: str, chunksize: int = None):
+    """Yield collision data parsed from raw csv. See read_collisions."""
+    reader = pd.read_csv(
+        path,
+        usecols=list(COLLISION_DTYPES),
+        dtype=COLLISION_DTYPES,
+        chunksize=chunksize,
     )
+    if chunksize is None:
+        reader = [reader]
+    for chunk in reader:
+        yield prep_collisions(chunk)
+
+
+def prep_collisions(crashes: pd.DataFrame):
+    """Return collision data with renamed fields and recalculated totals.
+
+    Injured and killed numbers are the sums of the pedestrian, cyclist, and
+    motorist numbers.
+    """
     # renaming fields
     new_col_names = {
         "COLLISION_ID": "ID",
@@ -40,10 +220,8 @@ def process_data():
         "CRASH TIME": "TIME",
         "LATITUDE": "LAT",
         "LONGITUDE": "LONG",
-        "NUMBER OF PERSONS INJURED": "INJURED",
         "NUMBER OF PEDESTRIANS INJURED": "PEDESTRIAN INJURED",
         "NUMBER OF CYCLIST INJURED": "CYCLIST INJURED",
-        "NUMBER OF PERSONS KILLED": "KILLED",
         "NUMBER OF PEDESTRIANS KILLED": "PEDESTRIAN KILLED",
         "NUMBER OF CYCLIST KILLED": "CYCLIST KILLED",
     }
@@ -62,29 +240,52 @@ def process_data():
     )
 
     # selecting the fields to keep
-    fields_to_keep = [
-        "ID",
-        "DATE",
-        "TIME",
-        "LAT",
-        "LONG",
-        "INJURED",
-        "PEDESTRIAN INJURED",
-        "CYCLIST INJURED",
-        "KILLED",
-        "PEDESTRIAN KILLED",
-        "CYCLIST KILLED",
-    ]
-    crashes = crashes[fields_to_keep]
+    return crashes[FIELDS_TO_KEEP]
+
+
+def read_locations(cache_dir: str = None, features: dict = None):
+    """Return dictionary of location feature name to (STRtree, ids, source key).
 
-    # creating datetime index
+    Features is a dictionary of feature name to (geojson path, geojson property),
+    default LOCATION_FEATURES. The source key identifies the geojson contents and
+    property. If cache_dir is provided, parsed geometries are read from and saved
+    to the cache.
+    """
+    features = LOCATION_FEATURES if features is None else features
+    locations = {}
+    for feature_name, (geojson_path, geojson_property) in features.items():
+        source_key = src.cache.make_key(
+            "geojson",
+            CACHE_VERSION,
+            src.cache.file_digest(geojson_path),
+            geojson_property,
+        )
+        geom_ids, geoms = src.cache.cached(
+            source_key,
+            functools.partial(src.utils.read_geojson, geojson_path, geojson_property),
+            cache_dir,
+        )
+        locations[feature_name] = (STRtree(geoms), geom_ids, source_key)
+    return locations
+
+
+def category_levels(locations: dict):
+    """Return dictionary of categorical field name to all possible categories."""
+    levels = {"season": list(SEASONS)}
+    for feature_name, (_, geom_ids, _) in locations.items():
+        levels[feature_name] = sorted(set(geom_ids))
+    return levels
+
+
+def index_by_datetime(crashes: pd.DataFrame):
+    """Return collision data with a datetime index parsed from DATE and TIME."""
     dt_str = crashes["DATE"] + " " + crashes["TIME"]
     crashes["datetime"] = pd.to_datetime(dt_str, format="%m/%d/%Y %H:%M")
-    crashes = crashes.set_index("datetime")
+    return crashes.set_index("datetime")
 
-    # creating season field
-    crashes["season"] = pd.Categorical(crashes.index.map(src.utils.date_to_season))
 
+def add_flags(crashes: pd.DataFrame):
+    """Return collision data with valid location and collision type flags added."""
     # creating  valid location coordinate flags
     crashes["valid_lat_long"] = (
         crashes["LONG"].between(NYC_WEST_LIMIT, NYC_EAST_LIMIT)
@@ -104,23 +305,167 @@ def process_data():
     crashes["pedestrian"] = (crashes["PEDESTRIAN INJURED"] > 0) | (
         crashes["PEDESTRIAN KILLED"] > 0
     )
+    return crashes
+
+
+def add_features(
+    crashes: pd.DataFrame,
+    locations: dict,
+    cache_dir: str = None,
+    executor: ProcessPoolExecutor = None,
+):
+    """Return gpd.GeoDataFrame of collisions with features added.
+
+    Features are the datetime index, season, flags, geometry, and location
+    features. Location features are assigned in the executor processes from
+    src.utils.nearest_shapes_pool, if provided. If cache_dir is provided,
+    location features are read from and saved to the cache, keyed on the
+    collision coordinates and location source.
+    """
+    crashes = index_by_datetime(crashes)
+
+    # creating season field
+    levels = category_levels(locations)
+    crashes["season"] = src.utils.dates_to_seasons(crashes.index)
+    crashes = add_flags(crashes)
 
     # creating GeoDataFrame with Shapely Point corresponding to lat-long coordinates
     # empty lat-longs (np.nan) will be represented in GeoDataFrame as empty Point()
-    points = [Point(x, y) for x, y in zip(crashes["LONG"].array, crashes["LAT"].array)]
+    points = src.utils.points_from_lat_long(crashes["LAT"], crashes["LONG"])
     crashes = gpd.GeoDataFrame(crashes, geometry=points)
-    crashes = src.utils.add_location_feature(
-        crashes, POLICE_PRECINCT_GEOMS_LOC, "precinct"
-    )
-    crashes["precinct"] = pd.Categorical(crashes["precinct"])
-    crashes = src.utils.add_location_feature(
-        crashes, DISTRICT_GEO_LOC, "coun_dist", feature_name="district"
-    )
-    crashes["district"] = pd.Categorical(crashes["district"])
 
-    # save processed data
-    crashes.to_pickle(PROCESSED_DATA_LOC)
+    # categories are set to all geometry ids so that chunks can be concatenated
+    coords_hash = pd.util.hash_pandas_object(crashes[["LAT", "LONG"]], index=False)
+    coords_digest = hashlib.blake2b(coords_hash.to_numpy().tobytes()).hexdigest()
+    for feature_name, (tree, geom_ids, source_key) in locations.items():
+        ids = src.cache.cached(
+            src.cache.make_key("location", CACHE_VERSION, coords_digest, source_key),
+            functools.partial(
+                src.utils.ids_nearest_shapes,
+                crashes.geometry.array,
+                tree,
+                geom_ids,
+                executor,
+                feature_name,
+            ),
+            cache_dir,
+        )
+        crashes[feature_name] = pd.Categorical(ids, categories=levels[feature_name])
+    return crashes
+
+
+def combine_chunks(chunks: list, locations: dict):
+    """Return single gpd.GeoDataFrame from processed collision chunks.
+
+    Categorical fields only keep the categories that are present in the data.
+    """
+    levels = category_levels(locations)
+    for chunk in chunks:
+        for col, categories in levels.items():
+            chunk[col] = chunk[col].cat.set_categories(categories)
+    crashes = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    for col in levels:
+        crashes[col] = crashes[col].cat.remove_unused_categories()
+    return crashes
+
+
+def row_hashes(crashes: pd.DataFrame):
+    """Return pd.MultiIndex of collision ID and content hash of the kept fields."""
+    hashes = pd.util.hash_pandas_object(crashes[FIELDS_TO_KEEP], index=False)
+    return pd.MultiIndex.from_arrays([crashes["ID"].array, hashes.array])
+
+
+def merge_collisions(
+    previous: gpd.GeoDataFrame,
+    chunksize: int,
+    locations: dict,
+    cache_dir: str = None,
+    executor: ProcessPoolExecutor = None,
+):
+    """Return previously processed collisions merged with new or changed collisions.
+
+    Collisions are matched on ID (assumed unique) and a content hash of the kept
+    fields. Only collisions that are new or changed are processed. Collisions that
+    are no longer in the raw data are dropped. Rows are returned in raw data order.
+    """
+    raw = pd.concat(read_collisions(COLLISION_DATA_LOC, chunksize, cache_dir))
+    raw = raw.reset_index(drop=True)
+    # previous data may have been saved with different dtypes
+    previous_fields = previous[FIELDS_TO_KEEP].astype(raw.dtypes.to_dict())
+    raw_keys = row_hashes(raw)
+    previous_keys = row_hashes(previous_fields)
+
+    is_unchanged = raw_keys.isin(previous_keys)
+    kept = previous[previous_keys.isin(raw_keys)].copy()
+    delta = raw[~is_unchanged]
+    logger.info("Processing %s new or changed collisions", f"{len(delta):,}")
+
+    step = chunksize if chunksize else max(len(delta), 1)
+    chunks = [kept] + [
+        add_features(
+            delta.iloc[start : start + step].copy(), locations, cache_dir, executor
+        )
+        for start in range(0, len(delta), step)
+    ]
+    crashes = combine_chunks(chunks, locations)
+    raw_order = pd.Index(raw["ID"]).get_indexer(crashes["ID"])
+    return crashes.iloc[np.argsort(raw_order, kind="stable")]
+
+
+def process_data(
+    chunksize: int = None,
+    incremental: bool = False,
+    save_pickle: bool = False,
+    cache_dir: str = None,
+    cache_max_bytes: int = src.cache.DEFAULT_MAX_BYTES,
+    workers: int = 1,
+):
+    """Script to process raw collision data into analysis-ready dataset.
+
+    If chunksize is provided, raw collision data is read and processed chunksize
+    rows at a time to bound peak memory use. If incremental is True, only new or
+    changed collisions are processed and merged into previously processed data.
+    If save_pickle is True, processed data is also saved as a pickle. If cache_dir
+    is provided, parsed raw data, geometries, and location features are cached
+    and the cache is limited to cache_max_bytes. Precincts and districts are
+    assigned using workers processes.
+    """
+    locations = read_locations(cache_dir)
+    # worker processes are started once and build their trees once, for all chunks
+    trees = {feature_name: tree for feature_name, (tree, _, _) in locations.items()}
+    with src.utils.nearest_shapes_pool(trees, workers) as executor:
+        if incremental and os.path.exists(PROCESSED_DATA_LOC):
+            previous = src.storage.read_crashes(PROCESSED_DATA_LOC)
+            crashes = merge_collisions(
+                previous, chunksize, locations, cache_dir, executor
+            )
+        else:
+            chunks = [
+                add_features(chunk, locations, cache_dir, executor)
+                for chunk in read_collisions(COLLISION_DATA_LOC, chunksize, cache_dir)
+            ]
+            crashes = combine_chunks(chunks, locations)
+            del chunks
+
+    # save processed data and aggregation cube
+    src.storage.write_crashes(crashes, PROCESSED_DATA_LOC)
+    src.cube.write_cube(src.cube.build_cube(crashes), PROCESSED_CUBE_LOC)
+    if save_pickle:
+        crashes.to_pickle(PROCESSED_PICKLE_LOC)
+    if cache_dir is not None:
+        src.cache.evict(cache_dir, cache_max_bytes)
 
 
 if __name__ == "__main__":
-    process_data()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cl_args = parse_args()
+    if cl_args.clear_cache:
+        src.cache.clear(cl_args.cache_dir)
+    process_data(
+        cl_args.chunksize,
+        cl_args.incremental,
+        cl_args.pickle,
+        cache_dir=None if cl_args.no_cache else cl_args.cache_dir,
+        cache_max_bytes=int(cl_args.cache_size * 1024**3),
+        workers=cl_args.workers,
+    )
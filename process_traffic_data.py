@@ -0,0 +1,157 @@
+"""Module to process raw MTA bridge and tunnel traffic data into a dataset."""
+
+import argparse
+import os.path
+import shutil
+import warnings
+import numpy as np
+import pandas as pd
+
+import src.storage
+
+# processed data is saved as a Parquet dataset partitioned by year
+PROCESSED_TRAFFIC_LOC = "data/processed/traffic"
+# not traffic_index.pkl, which 1b-profiling-mta-traffic-index.ipynb writes with
+# its own fields
+PROCESSED_TRAFFIC_PICKLE_LOC = "data/processed/traffic.pkl"
+
+# https://data.ny.gov/Transportation/Hourly-Traffic-on-Metropolitan-Transportation-Auth/qzve-kjga/about_data
+TRAFFIC_DATA_LOC = "data/raw/mta/Hourly_Traffic_MTA.csv"
+# plaza ids mapped to bridges and tunnels using the MTA data dictionary
+PLAZA_MAPPING_LOC = "data/Plaza ID Mapping.csv"
+
+DEFAULT_CHUNKSIZE = 500_000
+
+# raw fields with compact dtypes, dates are repeated for every plaza and hour so
+# they are read as categories and each unique date is parsed once
+# vehicle counts per plaza, direction, and hour are well under the int32 limit
+TRAFFIC_DTYPES = {
+    "Plaza ID": "int16",
+    "Date": "category",
+    "Hour": "int8",
+    "Direction": pd.CategoricalDtype(["I", "O"]),
+    "# Vehicles - E-ZPass": "int32",
+    "# Vehicles - VToll": "int32",
+}
+DATE_FORMAT = "%m/%d/%Y"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Process raw MTA traffic data into analysis-ready dataset"
+    )
+    parser.add_argument(
+        "-c",
+        "--chunksize",
+        type=int,
+        default=DEFAULT_CHUNKSIZE,
+        help=f"Number of raw traffic rows to process at a time (default "
+        f"{DEFAULT_CHUNKSIZE:,})",
+        metavar="",
+    )
+    parser.add_argument(
+        "-p",
+        "--pickle",
+        action="store_true",
+        help="Also save processed data as a single pickled DataFrame",
+    )
+    return parser.parse_args()
+
+
+def read_plazas(path: str):
+    """Return DataFrame of bridge or tunnel name, latitude, and longitude by plaza."""
+    plazas = pd.read_csv(path, encoding="utf-8-sig", index_col="Plaza ID")
+    return plazas.sort_index().rename(
+        columns={"Bridge / Tunnel": "LOCATION", "Latitude": "LAT", "Longitude": "LONG"}
+    )
+
+
+def read_traffic(path: str, plazas: pd.DataFrame, chunksize: int = None):
+    """Yield processed traffic counts read from raw csv.
+
+    Yields a single DataFrame if chunksize is None, otherwise yields DataFrames
+    with at most chunksize rows. See prep_traffic.
+    """
+    reader = pd.read_csv(
+        path, usecols=list(TRAFFIC_DTYPES), dtype=TRAFFIC_DTYPES, chunksize=chunksize
+    )
+    if chunksize is None:
+        reader = [reader]
+    for chunk in reader:
+        yield prep_traffic(chunk, plazas)
+
+
+def plaza_categories(plaza_ids, plazas: pd.DataFrame):
+    """Return plaza ids in plazas, then any other plaza ids, as strings."""
+    mapped = plazas.index.astype(str).to_list()
+    unmapped = np.setdiff1d(np.unique(plaza_ids), plazas.index.to_numpy())
+    return mapped + unmapped.astype(str).tolist()
+
+
+def prep_traffic(traffic: pd.DataFrame, plazas: pd.DataFrame):
+    """Return traffic counts with a datetime index, plazas, and locations.
+
+    Direction and vehicle counts are also kept. Plaza (as a string, like
+    precincts) and location are categoricals with every plaza and location in
+    plazas, so that chunks can be concatenated without converting them to
+    objects. Plazas that are not in plazas are kept, added to the plaza
+    categories of the chunk, with a missing location and a warning.
+    """
+    # datetimes from the parsed unique dates plus the hour, without string building
+    dates = pd.to_datetime(traffic["Date"].cat.categories, format=DATE_FORMAT)
+    date_values = dates.to_numpy()[traffic["Date"].cat.codes.to_numpy()]
+    hours = traffic["Hour"].to_numpy().astype("timedelta64[h]")
+    index = pd.DatetimeIndex(date_values + hours, name="datetime")
+
+    plaza_ids = traffic["Plaza ID"].to_numpy()
+    locations = plazas["LOCATION"].reindex(plaza_ids).to_numpy()
+    num_unmapped = pd.isna(locations).sum()
+    if num_unmapped:
+        warnings.warn(
+            f"{num_unmapped:,} traffic rows have plaza ids that are not in the plaza "
+            "mapping and have no location",
+            stacklevel=2,
+        )
+    ezpass = traffic["# Vehicles - E-ZPass"].to_numpy()
+    vtoll = traffic["# Vehicles - VToll"].to_numpy()
+    return pd.DataFrame(
+        {
+            "PLAZA": pd.Categorical(
+                plaza_ids.astype(str), categories=plaza_categories(plaza_ids, plazas)
+            ),
+            "LOCATION": pd.Categorical(
+                locations, categories=plazas["LOCATION"].unique()
+            ),
+            "DIRECTION": traffic["Direction"].array,
+            "EZPASS": ezpass,
+            "VTOLL": vtoll,
+            "VEHICLES": (ezpass + vtoll).astype(np.int32),
+        },
+        index=index,
+    )
+
+
+def process_traffic(chunksize: int = DEFAULT_CHUNKSIZE, save_pickle: bool = False):
+    """Script to process raw MTA traffic data into analysis-ready dataset.
+
+    Raw data is read, processed, and written to the dataset chunksize rows at a
+    time, then each year of the dataset is sorted, so at most one chunk or year
+    is in memory. If save_pickle is True, processed data is also saved as a
+    pickle, which needs the whole dataset in memory.
+    """
+    plazas = read_plazas(PLAZA_MAPPING_LOC)
+    if os.path.exists(PROCESSED_TRAFFIC_LOC):
+        shutil.rmtree(PROCESSED_TRAFFIC_LOC)
+    for part, chunk in enumerate(read_traffic(TRAFFIC_DATA_LOC, plazas, chunksize)):
+        src.storage.append_traffic(chunk, PROCESSED_TRAFFIC_LOC, part)
+    src.storage.sort_traffic_partitions(PROCESSED_TRAFFIC_LOC)
+    if save_pickle:
+        src.storage.read_traffic(PROCESSED_TRAFFIC_LOC).to_pickle(
+            PROCESSED_TRAFFIC_PICKLE_LOC
+        )
+
+
+if __name__ == "__main__":
+    cl_args = parse_args()
+    process_traffic(cl_args.chunksize, cl_args.pickle)
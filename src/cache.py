@@ -0,0 +1,90 @@
+"""Content-addressed on-disk cache for expensive data processing stages."""
+
+import glob
+import hashlib
+import os
+import os.path
+import pickle
+import tempfile
+
+DEFAULT_CACHE_DIR = "data/cache"
+DEFAULT_MAX_BYTES = 4 * 1024**3
+CACHE_EXT = ".pkl"
+
+# file digests already computed in this process: (path, size, mtime) -> digest
+_file_digests = {}
+
+
+def file_digest(path: str):
+    """Return hex digest of file contents."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        with open(path, "rb") as fp:
+            _file_digests[memo_key] = hashlib.file_digest(fp, "blake2b").hexdigest()
+    return _file_digests[memo_key]
+
+
+def make_key(stage: str, *params):
+    """Return cache key for a processing stage and its parameters.
+
+    Parameters should have a stable repr, e.g. strings, numbers, file digests,
+    and tuples or dictionaries of these.
+    """
+    return hashlib.blake2b(repr((stage, params)).encode("utf-8")).hexdigest()
+
+
+def load(key: str, cache_dir: str):
+    """Return cached value for key, or None if key is not cached."""
+    path = os.path.join(cache_dir, key + CACHE_EXT)
+    try:
+        with open(path, "rb") as fp:
+            value = pickle.load(fp)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(path)  # mark as recently used for eviction
+    return value
+
+
+def store(key: str, value, cache_dir: str):
+    """Cache value for key."""
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to temporary file first so partially written entries are never read
+    with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as fp:
+        pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fp.name, os.path.join(cache_dir, key + CACHE_EXT))
+
+
+def cached(key: str, compute, cache_dir: str = None):
+    """Return cached value for key, or compute, cache, and return value.
+
+    If cache_dir is None, value is computed and not cached. Computed values
+    should not be None.
+    """
+    if cache_dir is None:
+        return compute()
+    value = load(key, cache_dir)
+    if value is None:
+        value = compute()
+        store(key, value, cache_dir)
+    return value
+
+
+def evict(cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+    """Delete least recently used cache entries until cache is at most max_bytes."""
+    entries = [
+        (os.path.getmtime(path), os.path.getsize(path), path)
+        for path in glob.glob(os.path.join(cache_dir, "*" + CACHE_EXT))
+    ]
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def clear(cache_dir: str):
+    """Delete all cache entries."""
+    for path in glob.glob(os.path.join(cache_dir, "*" + CACHE_EXT)):
+        os.remove(path)
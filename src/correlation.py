@@ -0,0 +1,120 @@
+"""Streaming correlation of pivoted time series, such as hourly traffic by location.
+
+The correlation matrix of a pivot table (one row per time, one column per
+location) is computed from its count, means, and centered cross-products,
+which are accumulated chunk by chunk and merged with Chan's parallel update.
+Memory is bounded by the number of locations squared and the chunk size,
+rather than the number of times.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def pivot_sums(chunk: pd.DataFrame, values: str, columns: str, categories: list):
+    """Return (times, categories) array of values summed at each time of chunk.
+
+    Like pd.pivot_table with aggfunc="sum" and fill_value=0, with a row for each
+    unique time in the sorted chunk index and a column for each of categories.
+    """
+    codes = pd.Categorical(chunk[columns], categories=categories).codes
+    known = codes >= 0
+    # times are sorted, so rows are numbered by runs of equal times
+    times = chunk.index.to_numpy()[known]
+    rows = np.zeros(len(times), dtype=np.int64)
+    rows[1:] = np.cumsum(times[1:] != times[:-1])
+    n_rows = rows[-1] + 1 if len(times) else 0
+    sums = np.bincount(
+        rows * len(categories) + codes[known],
+        weights=chunk[values].to_numpy(float)[known],
+        minlength=n_rows * len(categories),
+    )
+    return sums.reshape(n_rows, len(categories))
+
+
+def pivot_moments(table: np.ndarray):
+    """Return count, column means, and centered cross-products of a table."""
+    n = len(table)
+    means = table.mean(axis=0) if n else np.zeros(table.shape[1])
+    centered = table - means
+    return n, means, centered.T @ centered
+
+
+def merge_moments(first: tuple, second: tuple):
+    """Return moments of two tables combined, from their pivot_moments."""
+    n_a, means_a, cross_a = first
+    n_b, means_b, cross_b = second
+    n = n_a + n_b
+    if n == 0:
+        return first
+    delta = means_b - means_a
+    means = means_a + delta * n_b / n
+    cross = cross_a + cross_b + np.outer(delta, delta) * n_a * n_b / n
+    return n, means, cross
+
+
+def _pad_moments(moments: tuple, size: int):
+    """Return moments with zero columns added up to size columns.
+
+    Zeros are exact for new categories, since the pivot table is 0 where a
+    category had no values.
+    """
+    n, means, cross = moments
+    pad = size - len(means)
+    return n, np.pad(means, (0, pad)), np.pad(cross, ((0, pad), (0, pad)))
+
+
+def _add_chunk(moments: tuple, chunk: pd.DataFrame, values, columns, categories):
+    """Return moments merged with a chunk, adding its new categories in place."""
+    new = pd.unique(chunk[columns].dropna())
+    categories.extend(category for category in new if category not in categories)
+    moments = _pad_moments(moments, len(categories))
+    table = pivot_sums(chunk, values, columns, categories)
+    return merge_moments(moments, pivot_moments(table))
+
+
+def streaming_corr(chunks, values: str = "VEHICLES", columns: str = "LOCATION"):
+    """Return correlation matrix of a pivot table of chunks, without building it.
+
+    Equal to pd.pivot_table(data, values=values, index=data.index,
+    columns=columns, aggfunc="sum", fill_value=0).corr() of the chunks combined.
+    Rows of the last time of each chunk are carried over to the next chunk, so
+    a time split across chunks is summed once.
+
+    Args:
+        chunks (iterable): DataFrames with a datetime index, sorted by time
+            across chunks, e.g. from src.storage.iter_traffic.
+        values (str): Field summed in the pivot table.
+        columns (str): Field of pivot table columns.
+
+    Returns:
+        pd.DataFrame: Correlation matrix of the columns field, sorted.
+
+    """
+    categories = []
+    moments = (0, np.zeros(0), np.zeros((0, 0)))
+    carried = None
+    last_time = None
+    for chunk in chunks:
+        chunk = chunk[[values, columns]]
+        if len(chunk) == 0:
+            continue
+        if last_time is not None and chunk.index[0] < last_time:
+            raise ValueError("Chunks must be sorted by time")
+        last_time = chunk.index[-1]
+        if carried is not None:
+            chunk = pd.concat([carried, chunk])
+        is_last = chunk.index == last_time
+        carried, chunk = chunk[is_last], chunk[~is_last]
+        moments = _add_chunk(moments, chunk, values, columns, categories)
+    if carried is not None:
+        moments = _add_chunk(moments, carried, values, columns, categories)
+
+    _, _, cross = moments
+    std = np.sqrt(np.diag(cross))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cross / np.outer(std, std)
+    index = pd.Index(categories, name=columns)
+    return (
+        pd.DataFrame(corr, index=index, columns=index).sort_index().sort_index(axis=1)
+    )
@@ -0,0 +1,207 @@
+"""Precomputed collision counts and sums for fast crosstabs of processed data."""
+
+import numpy as np
+import pandas as pd
+
+# dimensions of the cube, in groupby order
+CUBE_DIMS = (
+    "year",
+    "month",
+    "season",
+    "dayofweek",
+    "hour",
+    "precinct",
+    "district",
+)
+# part of the cube -> its dimensions. Each region is a separate breakdown by
+# month, since a joint key with regions and hours has about one collision per
+# row. Season is kept because seasons start on the 21st, though it only splits
+# 4 of the 12 months in two
+CUBE_PARTS = {
+    "time": ("year", "month", "season", "dayofweek", "hour"),
+    "precinct": ("year", "month", "season", "precinct"),
+    "district": ("year", "month", "season", "district"),
+}
+# "all" is every collision, "fatal" is collisions with at least one death
+CUBE_FLAGS = ("all", "serious", "non-motorist", "cyclist", "pedestrian", "fatal")
+# measure name -> processed field summed, None for collision counts
+CUBE_MEASURES = {"count": None, "injured": "INJURED", "killed": "KILLED"}
+
+
+def flag_masks(crashes: pd.DataFrame):
+    """Return dictionary of CUBE_FLAGS to boolean Series, None for "all"."""
+    return {
+        "all": None,
+        "serious": crashes["serious"],
+        "non-motorist": crashes["non-motorist"],
+        "cyclist": crashes["cyclist"],
+        "pedestrian": crashes["pedestrian"],
+        "fatal": crashes["KILLED"] > 0,
+    }
+
+
+def build_cube(crashes: pd.DataFrame):
+    """Return aggregation cube of processed collisions.
+
+    The cube has one row per part (see CUBE_PARTS), flag, and combination of
+    the part dimensions that has at least one collision, holding the collision
+    count and injured and killed sums. Dimensions that are not in a part are
+    missing in its rows. Collisions without a precinct or district are kept
+    with missing values.
+
+    Args:
+        crashes (pd.DataFrame): Processed collisions with a datetime index.
+
+    Returns:
+        pd.DataFrame: Cube with "part", CUBE_DIMS, "flag", and CUBE_MEASURES
+            columns.
+
+    """
+    index = crashes.index
+    # nullable dimensions, since they are missing in parts without them
+    frame = pd.DataFrame(
+        {
+            "year": index.year.astype("Int16"),
+            "month": index.month.astype("Int8"),
+            "season": crashes["season"].array,
+            "dayofweek": index.dayofweek.astype("Int8"),
+            "hour": index.hour.astype("Int8"),
+            "precinct": crashes["precinct"].astype("category").array,
+            "district": crashes["district"].astype("category").array,
+        }
+    )
+    for measure, field in CUBE_MEASURES.items():
+        values = 1 if field is None else crashes[field].to_numpy()
+        frame[measure] = pd.Series(values, index=frame.index, dtype="int32")
+
+    parts = []
+    for flag, mask in flag_masks(crashes).items():
+        flagged = frame if mask is None else frame.loc[mask.to_numpy()]
+        for part_name, dims in CUBE_PARTS.items():
+            grouped = flagged.groupby(
+                list(dims), observed=True, dropna=False, sort=False
+            )
+            part = grouped[list(CUBE_MEASURES)].sum().reset_index()
+            part = part.reindex(columns=[*CUBE_DIMS, *CUBE_MEASURES])
+            part = part.astype({dim: frame[dim].dtype for dim in CUBE_DIMS})
+            part.insert(0, "flag", flag)
+            part.insert(0, "part", part_name)
+            parts.append(part)
+    cube = pd.concat(parts, ignore_index=True)
+    cube["part"] = pd.Categorical(cube["part"], categories=list(CUBE_PARTS))
+    cube["flag"] = pd.Categorical(cube["flag"], categories=CUBE_FLAGS)
+    return cube
+
+
+def region_totals(crashes: pd.DataFrame, region: str):
+    """Return every cube measure and flag of collisions by region and year.
+
+    All flags and measures are summed in one grouped pass, so that choropleths
+    of any flag, measure, and years can be made from the result.
+
+    Args:
+        crashes (pd.DataFrame): Processed collisions with a datetime index.
+        region (str): Location feature, e.g. "precinct" or "district".
+
+    Returns:
+        pd.DataFrame: (region, "year") index, and ("flag", "measure") columns
+            for every combination of CUBE_FLAGS and CUBE_MEASURES.
+
+    """
+    columns = {}
+    for flag, mask in flag_masks(crashes).items():
+        for measure, field in CUBE_MEASURES.items():
+            values = np.ones(len(crashes)) if field is None else crashes[field]
+            if mask is not None:
+                values = np.where(mask.to_numpy(), values, 0)
+            columns[(flag, measure)] = np.asarray(values, dtype="int32")
+    frame = pd.DataFrame(columns, index=crashes.index)
+    frame.columns.names = ["flag", "measure"]
+    keys = [
+        pd.Index(crashes[region].array, name=region),
+        pd.Index(crashes.index.year, name="year"),
+    ]
+    return frame.groupby(keys, observed=True).sum()
+
+
+def write_cube(cube: pd.DataFrame, path: str):
+    """Write aggregation cube to a Parquet file."""
+    cube.to_parquet(path, engine="pyarrow", index=False)
+
+
+def read_cube(path: str):
+    """Return aggregation cube read from a Parquet file."""
+    return pd.read_parquet(path, engine="pyarrow")
+
+
+def totals(
+    cube: pd.DataFrame,
+    dims,
+    flag: str = "all",
+    value: str = "count",
+    **filters,
+):
+    """Return Series of a cube measure summed over dimension(s).
+
+    See crosstab for flag, value, and filters. Collisions without a value for
+    dims are not counted. The smallest cube part with all dims and filters is
+    used.
+    """
+    if flag not in CUBE_FLAGS:
+        raise ValueError(f"Unknown flag {flag!r}, expected one of {CUBE_FLAGS}")
+    if value not in CUBE_MEASURES:
+        raise ValueError(f"Unknown value {value!r}, expected one of {CUBE_MEASURES}")
+    dims = [dims] if isinstance(dims, str) else list(dims)
+    for dim in [*dims, *filters]:
+        if dim not in CUBE_DIMS:
+            raise ValueError(f"Unknown dimension {dim!r}, expected one of {CUBE_DIMS}")
+    parts = [
+        part
+        for part, part_dims in CUBE_PARTS.items()
+        if set(dims).union(filters) <= set(part_dims)
+    ]
+    if not parts:
+        raise ValueError(
+            f"No cube part has all of {[*dims, *filters]}, parts are {CUBE_PARTS}"
+        )
+
+    mask = (cube["part"] == min(parts, key=lambda part: len(CUBE_PARTS[part]))) & (
+        cube["flag"] == flag
+    )
+    for dim, selection in filters.items():
+        if isinstance(selection, (list, tuple, set, range)):
+            mask &= cube[dim].isin(selection)
+        else:
+            mask &= cube[dim] == selection
+    return cube.loc[mask].groupby(dims, observed=True)[value].sum()
+
+
+def crosstab(
+    cube: pd.DataFrame,
+    index,
+    columns,
+    flag: str = "all",
+    value: str = "count",
+    **filters,
+):
+    """Return crosstab of a cube measure, like pd.crosstab of processed data.
+
+    Args:
+        cube (pd.DataFrame): Aggregation cube from build_cube.
+        index (str or list): Cube dimension(s) for the crosstab rows.
+        columns (str or list): Cube dimension(s) for the crosstab columns.
+        flag (str): Only collisions with this flag (see CUBE_FLAGS) are counted.
+        value (str): Measure to sum (see CUBE_MEASURES).
+        **filters: Cube dimension to a value or list of values that collisions
+            must have, e.g. year=2023 or precinct=["1", "5"]. Index, columns,
+            and filters must all be dimensions of one cube part, see CUBE_PARTS.
+
+    Returns:
+        pd.DataFrame: Crosstab with 0 for combinations without collisions.
+            Collisions without a value for index or columns are not counted.
+
+    """
+    index = [index] if isinstance(index, str) else list(index)
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    sums = totals(cube, index + columns, flag, value, **filters)
+    return sums.unstack(columns, fill_value=0)
@@ -0,0 +1,136 @@
+"""Collision rates normalized by traffic volume at MTA bridges and tunnels.
+
+Collisions are matched to the nearest bridge or tunnel toll plaza within a
+radius and counted in the hours that the plaza has traffic counts, so that
+gaps in the traffic data don't inflate rates. Hours are matched with a sorted
+merge of integer (location, hour) keys.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from src.hotspots import project_meters
+
+DEFAULT_RADIUS = 500  # meters from a bridge or tunnel plaza
+RATE_SCALE = 1_000_000  # collisions per million vehicles
+TIME_FIELDS = ("year", "month", "dayofweek", "hour")
+
+
+def plaza_locations(plazas: pd.DataFrame):
+    """Return DataFrame of "LAT" and "LONG" of each bridge or tunnel in plazas.
+
+    Plazas are from process_traffic_data.read_plazas. Plazas of the same bridge
+    or tunnel share a location.
+    """
+    return plazas.groupby("LOCATION", sort=True)[["LAT", "LONG"]].first()
+
+
+def nearest_locations(
+    crashes: pd.DataFrame, locations: pd.DataFrame, radius: float = DEFAULT_RADIUS
+):
+    """Return pd.Categorical of the nearest location of each collision.
+
+    Collisions more than radius meters from every location, or without
+    coordinates, are missing.
+    """
+    tree = cKDTree(project_meters(locations["LAT"], locations["LONG"]))
+    xy = project_meters(crashes["LAT"], crashes["LONG"])
+    valid = np.isfinite(xy).all(axis=1)
+    codes = np.full(len(crashes), -1)
+    distances, nearest = tree.query(xy[valid], distance_upper_bound=radius)
+    codes[valid] = np.where(np.isfinite(distances), nearest, -1)
+    return pd.Categorical.from_codes(codes, categories=locations.index)
+
+
+def hour_keys(locations: pd.Categorical, times):
+    """Return int64 keys of location codes and hours, which sort by both."""
+    hours = np.asarray(times, dtype="datetime64[h]").astype(np.int64)
+    return (locations.codes.astype(np.int64) << 32) + hours
+
+
+def align_hourly(
+    crashes: pd.DataFrame,
+    traffic: pd.DataFrame,
+    plazas: pd.DataFrame,
+    radius: float = DEFAULT_RADIUS,
+):
+    """Return vehicles and nearby collisions of every bridge or tunnel and hour.
+
+    Args:
+        crashes (pd.DataFrame): Collisions with a datetime index, "LAT", and "LONG".
+        traffic (pd.DataFrame): Processed traffic counts with a datetime index,
+            "LOCATION", and "VEHICLES", see process_traffic_data.
+        plazas (pd.DataFrame): Plaza "LOCATION", "LAT", and "LONG".
+        radius (float): Distance in meters that collisions are matched within.
+
+    Returns:
+        pd.DataFrame: ("LOCATION", "datetime") index of every hour with traffic
+            counts, in order, with "VEHICLES" and "COLLISIONS".
+
+    """
+    locations = plaza_locations(plazas)
+    traffic_locations = pd.Categorical(traffic["LOCATION"], categories=locations.index)
+    known = traffic_locations.codes >= 0
+    keys, inverse = np.unique(
+        hour_keys(traffic_locations[known], traffic.index[known]),
+        return_inverse=True,
+    )
+    vehicles = np.bincount(
+        inverse, weights=traffic["VEHICLES"].to_numpy()[known], minlength=len(keys)
+    )
+
+    crash_locations = nearest_locations(crashes, locations, radius)
+    near = crash_locations.codes >= 0
+    crash_keys = hour_keys(crash_locations[near], crashes.index[near])
+    positions = np.searchsorted(keys, crash_keys)
+    # collisions in hours without traffic counts are not matched
+    matched = positions < len(keys)
+    matched[matched] = keys[positions[matched]] == crash_keys[matched]
+    collisions = np.bincount(positions[matched], minlength=len(keys))
+
+    index = pd.MultiIndex.from_arrays(
+        [
+            pd.Categorical.from_codes(keys >> 32, categories=locations.index),
+            pd.DatetimeIndex(
+                (keys & 0xFFFFFFFF).astype("datetime64[h]").astype("datetime64[ns]")
+            ),
+        ],
+        names=["LOCATION", "datetime"],
+    )
+    return pd.DataFrame(
+        {"VEHICLES": vehicles.astype(np.int64), "COLLISIONS": collisions},
+        index=index,
+    )
+
+
+def rate_table(
+    aligned: pd.DataFrame,
+    index: str = "dayofweek",
+    columns: str = "hour",
+    location: str = None,
+    scale: float = RATE_SCALE,
+):
+    """Return crosstab of collisions per scale vehicles, e.g. for heat_map.
+
+    Args:
+        aligned (pd.DataFrame): Hourly vehicles and collisions from align_hourly.
+        index (str): Time field of the crosstab rows, see TIME_FIELDS.
+        columns (str): Time field of the crosstab columns, see TIME_FIELDS.
+        location (str): Only this bridge or tunnel, default all combined.
+        scale (float): Number of vehicles that rates are per.
+
+    Returns:
+        pd.DataFrame: Collision rates, missing where there were no vehicles.
+
+    """
+    for field in (index, columns):
+        if field not in TIME_FIELDS:
+            raise ValueError(f"Unknown field {field!r}, expected one of {TIME_FIELDS}")
+    if location is not None:
+        aligned = aligned.xs(location, level="LOCATION")
+    times = aligned.index.get_level_values("datetime")
+    sums = aligned.groupby(
+        [getattr(times, index).rename(index), getattr(times, columns).rename(columns)]
+    ).sum()
+    vehicles = sums["VEHICLES"].where(sums["VEHICLES"] > 0)
+    return (sums["COLLISIONS"] / vehicles * scale).unstack(columns)
@@ -0,0 +1,217 @@
+"""Gaps and coverage of time series, such as hourly traffic counts by plaza.
+
+Times are floored to periods of a fixed frequency and sorted by group and
+period once, so the gaps of every group are found together instead of in a
+loop per group. A gap is a run of periods without observations, given as a
+half-open [start, end) interval. For regular series like hourly traffic
+counts, the periods are the expected observations. For irregular series like
+collisions, a gap is a run of periods (e.g. days) without any.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_FREQ = pd.Timedelta(hours=1)
+
+
+def _group_codes(groups, n: int):
+    """Return group code of each row and index of groups in code order."""
+    if groups is None:
+        return np.zeros(n, dtype=np.int64), None
+    frame = groups.to_frame() if isinstance(groups, pd.Series) else groups
+    # one integer per combination of factorized columns, faster than groupby
+    keys = np.zeros(n, dtype=np.int64)
+    levels = []
+    for _, column in frame.items():
+        codes, uniques = pd.factorize(column, sort=True, use_na_sentinel=False)
+        keys = keys * len(uniques) + codes
+        levels.append(uniques)
+    keys, codes = np.unique(keys, return_inverse=True)
+    arrays = []
+    for level in reversed(levels):
+        arrays.append(pd.Index(level).take(keys % len(level)))
+        keys = keys // len(level)
+    group_index = pd.MultiIndex.from_arrays(arrays[::-1], names=frame.columns)
+    if group_index.nlevels == 1:
+        group_index = group_index.get_level_values(0)
+    return codes, group_index
+
+
+def _sorted_periods(times, freq, groups):
+    """Return sorted group codes and periods of valid times, and group index."""
+    times = pd.DatetimeIndex(times).as_unit("ns")
+    # missing times are dropped first, so groups without times have no code
+    valid = np.asarray(~times.isna())
+    times = times[valid]
+    if groups is not None:
+        groups = groups[valid]
+    codes, group_index = _group_codes(groups, len(times))
+    periods = times.asi8 // pd.Timedelta(freq).value
+    order = np.lexsort((periods, codes))
+    return codes[order], periods[order], group_index
+
+
+def _to_period(time, freq):
+    """Return the period of a time, or None."""
+    if time is None:
+        return None
+    return pd.Timestamp(time).as_unit("ns").value // pd.Timedelta(freq).value
+
+
+def _gap_periods(codes, periods, start_period=None, end_period=None):
+    """Return group codes, first periods, and end periods of gaps, in order."""
+    same = codes[1:] == codes[:-1]
+    inner = same & (periods[1:] - periods[:-1] > 1)
+    gap_codes = [codes[1:][inner]]
+    gap_starts = [periods[:-1][inner] + 1]
+    gap_ends = [periods[1:][inner]]
+    if start_period is not None and len(codes):
+        first = np.r_[True, ~same]
+        lead = periods[first] > start_period
+        gap_codes.append(codes[first][lead])
+        gap_starts.append(np.full(lead.sum(), start_period))
+        gap_ends.append(periods[first][lead])
+    if end_period is not None and len(codes):
+        last = np.r_[~same, True]
+        trail = periods[last] < end_period
+        gap_codes.append(codes[last][trail])
+        gap_starts.append(periods[last][trail] + 1)
+        gap_ends.append(np.full(trail.sum(), end_period + 1))
+
+    gap_codes = np.concatenate(gap_codes)
+    gap_starts = np.concatenate(gap_starts)
+    gap_ends = np.concatenate(gap_ends)
+    order = np.lexsort((gap_starts, gap_codes))
+    return gap_codes[order], gap_starts[order], gap_ends[order]
+
+
+def find_gaps(times, freq=DEFAULT_FREQ, groups=None, start=None, end=None):
+    """Return DataFrame of gaps in times of each group.
+
+    Args:
+        times (array-like): Datetimes, e.g. a DatetimeIndex.
+        freq (str or pd.Timedelta): Fixed period length, e.g. "1h" or "1D".
+        groups (pd.Series or pd.DataFrame): Group of each time, e.g. plaza and
+            direction columns, default one group. Only groups with times are
+            included.
+        start (datetime-like): Start of the expected span, so periods before
+            the first time of a group are a gap, default none.
+        end (datetime-like): End of the expected span (inclusive), so periods
+            after the last time of a group are a gap, default none.
+
+    Returns:
+        pd.DataFrame: Group columns and "start", "end", and "missing" number of
+            periods of each gap, sorted by group and start.
+
+    """
+    codes, periods, group_index = _sorted_periods(times, freq, groups)
+    gap_codes, gap_starts, gap_ends = _gap_periods(
+        codes, periods, _to_period(start, freq), _to_period(end, freq)
+    )
+    if group_index is None:
+        gaps = pd.DataFrame(index=pd.RangeIndex(len(gap_codes)))
+    else:
+        gaps = group_index.take(gap_codes).to_frame(index=False)
+    freq_ns = pd.Timedelta(freq).value
+    gaps["start"] = (gap_starts * freq_ns).astype("datetime64[ns]")
+    gaps["end"] = (gap_ends * freq_ns).astype("datetime64[ns]")
+    gaps["missing"] = gap_ends - gap_starts
+    return gaps
+
+
+def coverage(times, freq=DEFAULT_FREQ, groups=None, start=None, end=None):
+    """Return DataFrame of observed and missing periods of each group.
+
+    See find_gaps for arguments.
+
+    Returns:
+        pd.DataFrame: Group index with "first" and "last" periods with times,
+            number of "observed" and "missing" periods, and "coverage", the
+            fraction of periods observed. Groups with only missing times are
+            not included.
+
+    """
+    codes, periods, group_index = _sorted_periods(times, freq, groups)
+    if group_index is None:
+        group_index = pd.RangeIndex(1 if len(codes) else 0)
+    n_groups = len(group_index)
+    gap_codes, gap_starts, gap_ends = _gap_periods(
+        codes, periods, _to_period(start, freq), _to_period(end, freq)
+    )
+    new_period = np.ones(len(codes), dtype=bool)
+    new_period[1:] = (codes[1:] != codes[:-1]) | (periods[1:] != periods[:-1])
+    # every group has at least one time
+    bounds = np.searchsorted(codes, np.arange(n_groups + 1))
+    freq_ns = pd.Timedelta(freq).value
+    table = pd.DataFrame(
+        {
+            "first": (periods[bounds[:-1]] * freq_ns).astype("datetime64[ns]"),
+            "last": (periods[bounds[1:] - 1] * freq_ns).astype("datetime64[ns]"),
+            "observed": np.bincount(codes[new_period], minlength=n_groups),
+            "missing": np.bincount(
+                gap_codes, weights=gap_ends - gap_starts, minlength=n_groups
+            ).astype(np.int64),
+        },
+        index=group_index,
+    )
+    table["coverage"] = table["observed"] / (table["observed"] + table["missing"])
+    return table
+
+
+def fill_gaps(
+    data: pd.DataFrame,
+    freq=DEFAULT_FREQ,
+    groups=None,
+    start=None,
+    end=None,
+    fill_value=np.nan,
+    flag: str = "GAP",
+):
+    """Return data with a row for every missing period of each group.
+
+    Args:
+        data (pd.DataFrame): Data with a datetime index, e.g. processed traffic.
+        freq (str or pd.Timedelta): Fixed period length, e.g. "1h".
+        groups (str or list): Group columns, e.g. ["PLAZA", "DIRECTION"],
+            default one group.
+        start (datetime-like): Start of the expected span, see find_gaps.
+        end (datetime-like): End of the expected span, see find_gaps.
+        fill_value: Value of the other columns of added rows.
+        flag (str): Boolean column that is True for added rows, or None.
+
+    Returns:
+        pd.DataFrame: Data and added rows at the start of each missing period,
+            sorted by time. Group columns of added rows are set.
+
+    """
+    groups = [groups] if isinstance(groups, str) else groups
+    gaps = find_gaps(
+        data.index, freq, None if groups is None else data[groups], start, end
+    )
+    # one row per missing period, offset from the start of its gap
+    missing = gaps["missing"].to_numpy()
+    gap_rows = np.repeat(np.arange(len(gaps)), missing)
+    offsets = np.arange(len(gap_rows)) - np.repeat(
+        np.cumsum(missing) - missing, missing
+    )
+    times = gaps["start"].to_numpy()[gap_rows] + offsets * pd.Timedelta(freq)
+
+    # added rows are reindexed from a missing label, upcasting columns as needed
+    n_rows = len(data)
+    filled = data.reset_index(drop=True).reindex(
+        np.r_[np.arange(n_rows), np.full(len(gap_rows), -1)]
+    )
+    for column in data.columns:
+        values = (
+            gaps[column].to_numpy()[gap_rows]
+            if column in (groups or [])
+            else fill_value
+        )
+        if column in (groups or []) or not pd.isna(fill_value):
+            filled.iloc[n_rows:, filled.columns.get_loc(column)] = values
+    filled.index = pd.DatetimeIndex(
+        np.r_[data.index.to_numpy(), times], name=data.index.name
+    )
+    if flag is not None:
+        filled[flag] = np.arange(len(filled)) >= n_rows
+    return filled.sort_index(kind="stable")
@@ -0,0 +1,220 @@
+"""Density-based hotspots of collisions for dangerous area and point maps.
+
+Hotspots are found with DBSCAN over collision locations projected to meters.
+Collisions at the same location (rounded to about 1 m) are clustered once as a
+weighted point, and neighbors are found with a KD-tree, so millions of
+collisions at the repeated locations of intersections cluster in seconds.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from src.constants import NYC_MAP_CENTER
+
+EARTH_RADIUS = 6_371_008.8  # meters
+LOCATION_DECIMALS = 5  # about 1 m
+NOISE = -1  # label of collisions not in a cluster
+
+DEFAULT_EPS = 100  # meters
+DEFAULT_MIN_SAMPLES = 50
+DEFAULT_RANK_BY = ("INJURED", "KILLED")
+DEFAULT_TOP_CLUSTERS = 50
+DEFAULT_TOP_POINTS = 100
+
+CLUSTER_MAP_FIELDS = ["LAT", "LONG", "DATE", "TIME", "INJURED", "KILLED", "CLUSTER"]
+CLUSTER_POPUP_FORMAT = (
+    "'CLUSTER: ' + row[6] + '<br>' +"
+    "'DATE: ' + row[2] + '<br>' +"
+    "'TIME: ' + row[3] + '<br>' +"
+    "'INJURED: ' + row[4] + '<br>' +"
+    "'KILLED: ' + row[5]};"
+)
+POINT_MAP_FIELDS = ["LAT", "LONG", "INJURED", "KILLED", "COLLISIONS"]
+POINT_POPUP_FORMAT = (
+    "'INJURED: ' + row[2] + '<br>' +"
+    "'KILLED: ' + row[3] + '<br>' +"
+    "'COLLISIONS: ' + row[4]};"
+)
+
+
+def project_meters(lat, long, origin_lat: float = NYC_MAP_CENTER[0]):
+    """Return (n, 2) array of equirectangular x and y in meters.
+
+    Distances are accurate to well under 1% within a city around origin_lat.
+    """
+    lat_rad = np.radians(np.asarray(lat, dtype=float))
+    long_rad = np.radians(np.asarray(long, dtype=float))
+    x = EARTH_RADIUS * long_rad * np.cos(np.radians(origin_lat))
+    return np.column_stack([x, EARTH_RADIUS * lat_rad])
+
+
+def location_codes(lat, long, decimals: int = LOCATION_DECIMALS):
+    """Return codes of rounded locations and the unique latitudes and longitudes.
+
+    Returns:
+        tuple: Array of location code of each point, and arrays of latitude
+            and longitude of each unique location.
+
+    """
+    scale = 10**decimals
+    lat_int = np.round(np.asarray(lat, dtype=float) * scale).astype(np.int64)
+    long_int = np.round(np.asarray(long, dtype=float) * scale).astype(np.int64)
+    # one integer per location, |long_int| < 2**31 for any longitude
+    _, first, codes = np.unique(
+        (lat_int << 32) + long_int, return_index=True, return_inverse=True
+    )
+    return codes, lat_int[first] / scale, long_int[first] / scale
+
+
+def density_clusters(xy, eps: float, min_samples: float, weights=None):
+    """Return DBSCAN cluster labels of weighted points.
+
+    A point is a core point if the weights of points within eps of it,
+    including itself, sum to at least min_samples. Clusters are connected core
+    points and the other points within eps of them. Unlike sklearn's DBSCAN,
+    labels do not depend on the order of points, except for which cluster
+    gets a point within eps of core points of several clusters.
+
+    Args:
+        xy (np.ndarray): (n, 2) array of projected point coordinates.
+        eps (float): Neighborhood radius, in xy units.
+        min_samples (float): Neighborhood weight of core points.
+        weights (np.ndarray): Weight of each point, default 1.
+
+    Returns:
+        np.ndarray: Cluster label of each point, NOISE if not in a cluster.
+
+    """
+    n = len(xy)
+    weights = np.ones(n) if weights is None else np.asarray(weights, dtype=float)
+    pairs = cKDTree(xy).query_pairs(eps, output_type="ndarray")
+    first, second = pairs[:, 0], pairs[:, 1]
+    neighborhood = (
+        weights
+        + np.bincount(first, weights=weights[second], minlength=n)
+        + np.bincount(second, weights=weights[first], minlength=n)
+    )
+    core = neighborhood >= min_samples
+
+    labels = np.full(n, NOISE, dtype=np.int64)
+    core_ids = np.flatnonzero(core)
+    core_index = np.full(n, -1, dtype=np.int64)
+    core_index[core_ids] = np.arange(len(core_ids))
+    linked = core[first] & core[second]
+    graph = coo_matrix(
+        (
+            np.ones(linked.sum(), dtype=np.int8),
+            (core_index[first[linked]], core_index[second[linked]]),
+        ),
+        shape=(len(core_ids), len(core_ids)),
+    )
+    _, labels[core_ids] = connected_components(graph, directed=False)
+
+    # border points join the cluster of a core point within eps
+    for border, neighbor in ((first, second), (second, first)):
+        joins = ~core[border] & core[neighbor]
+        labels[border[joins]] = labels[neighbor[joins]]
+    return labels
+
+
+def find_hotspots(
+    crashes: pd.DataFrame,
+    eps: float = DEFAULT_EPS,
+    min_samples: float = DEFAULT_MIN_SAMPLES,
+    decimals: int = LOCATION_DECIMALS,
+):
+    """Return Series of hotspot cluster label of each collision.
+
+    Args:
+        crashes (pd.DataFrame): Collisions with valid "LAT" and "LONG".
+        eps (float): Neighborhood radius in meters.
+        min_samples (float): Number of collisions within eps of core collisions.
+        decimals (int): Decimal places that locations are rounded to.
+
+    Returns:
+        pd.Series: Cluster label of each collision, NOISE if not in a cluster.
+
+    """
+    codes, lat, long = location_codes(crashes["LAT"], crashes["LONG"], decimals)
+    labels = density_clusters(
+        project_meters(lat, long),
+        eps,
+        min_samples,
+        weights=np.bincount(codes, minlength=len(lat)),
+    )
+    return pd.Series(labels[codes], index=crashes.index, name="CLUSTER")
+
+
+def rank_clusters(
+    crashes: pd.DataFrame,
+    labels: pd.Series,
+    rank_by=DEFAULT_RANK_BY,
+    top: int = DEFAULT_TOP_CLUSTERS,
+):
+    """Return DataFrame of the top clusters with the most people hurt.
+
+    Args:
+        crashes (pd.DataFrame): Collisions with "LAT", "LONG", and rank_by fields.
+        labels (pd.Series): Cluster label of each collision, from find_hotspots.
+        rank_by (list): Fields summed and sorted by, in order of priority.
+        top (int): Number of clusters.
+
+    Returns:
+        pd.DataFrame: Cluster label index, with "COLLISIONS", rank_by sums,
+            "LAT" and "LONG" of the cluster center, and "RANK" starting at 1.
+
+    """
+    rank_by = list(rank_by)
+    clustered = crashes.loc[labels.to_numpy() != NOISE, ["LAT", "LONG", *rank_by]]
+    groups = clustered.groupby(labels[labels != NOISE].to_numpy())
+    clusters = groups[rank_by].sum()
+    clusters.insert(0, "COLLISIONS", groups.size())
+    clusters[["LAT", "LONG"]] = groups[["LAT", "LONG"]].mean()
+    clusters = clusters.sort_values([*rank_by, "COLLISIONS"], ascending=False)
+    clusters = clusters.head(top)
+    clusters["RANK"] = np.arange(1, len(clusters) + 1)
+    clusters.index.name = "CLUSTER"
+    return clusters
+
+
+def rank_points(
+    crashes: pd.DataFrame,
+    rank_by=DEFAULT_RANK_BY,
+    top: int = DEFAULT_TOP_POINTS,
+    decimals: int = LOCATION_DECIMALS,
+):
+    """Return DataFrame of the top locations with the most people hurt.
+
+    Args:
+        crashes (pd.DataFrame): Collisions with "LAT", "LONG", and rank_by fields.
+        rank_by (list): Fields summed and sorted by, in order of priority.
+        top (int): Number of locations.
+        decimals (int): Decimal places that locations are rounded to.
+
+    Returns:
+        pd.DataFrame: "LAT", "LONG", rank_by sums, and "COLLISIONS" of each
+            location, in order of rank.
+
+    """
+    rank_by = list(rank_by)
+    codes, lat, long = location_codes(crashes["LAT"], crashes["LONG"], decimals)
+    points = crashes[rank_by].groupby(codes).sum()
+    points["COLLISIONS"] = np.bincount(codes)[points.index]
+    points.insert(0, "LAT", lat[points.index])
+    points.insert(1, "LONG", long[points.index])
+    points = points.sort_values([*rank_by, "COLLISIONS"], ascending=False)
+    return points.head(top).reset_index(drop=True)
+
+
+def cluster_map_data(crashes: pd.DataFrame, labels: pd.Series, clusters: pd.DataFrame):
+    """Return make_marker_map data of collisions in ranked clusters.
+
+    Collisions need CLUSTER_MAP_FIELDS other than "CLUSTER", which is set to
+    the cluster rank. Use with CLUSTER_POPUP_FORMAT.
+    """
+    in_top = labels.isin(clusters.index).to_numpy()
+    map_data = crashes.loc[in_top, CLUSTER_MAP_FIELDS[:-1]].copy()
+    map_data["CLUSTER"] = clusters["RANK"].reindex(labels[in_top]).to_numpy()
+    return map_data
@@ -2,10 +2,16 @@
 
 import argparse
 import csv
+import hashlib
 import os.path
 import re
+from concurrent.futures import ThreadPoolExecutor
 import bs4
+import pandas as pd
 import requests
+import requests.adapters
+import urllib3.util
+import src.cache
 import src.utils
 
 BASE_DISTRICTS_URL = "https://council.nyc.gov/district-"
@@ -15,6 +21,45 @@ SAVE_NAME = "City Council POCs.csv"
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:47.0) Gecko/20100101 Firefox/47.0"
 )
+FIELDNAMES = [
+    "District Number",
+    "Council Member",
+    "District Office Address",
+    "District Office Phone",
+    "District Email",
+]
+DEFAULT_WORKERS = 8
+HTTP_CACHE_DIR = os.path.join(src.cache.DEFAULT_CACHE_DIR, "http")
+ADDRESS_PHONE_LABEL = "District office contact information"
+# only tags that district info is parsed from are built, see is_district_info_tag,
+# which is looked up when pages are parsed since it is defined below
+DISTRICT_INFO_STRAINER = bs4.SoupStrainer(
+    # pylint: disable-next=unnecessary-lambda
+    lambda name, attrs: is_district_info_tag(name, attrs)
+)
+REQUEST_TIMEOUT = 60
+RETRIES = 3
+RETRY_BACKOFF = 0.5  # seconds, see make_session
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# version of the district page parser, part of the cached page key. Increase it
+# when parsing changes, so pages cached with info from an old parser are parsed
+# again
+PARSER_VERSION = 1
+
+MEMBER_NAME_RE = re.compile("(-{1}\\ +)(.*)")  # 1 hyphen, 1+ spaces, any non-newline
+_PHONE_SPACE = "(\\ *-*\\ *)"  # 0+ spaces, 0+ hyphens, 0+ spaces
+PHONE_NUMBER_RE = re.compile(
+    "(([(]*)([0-9]{3})([)]*)"
+    + _PHONE_SPACE
+    + "([0-9]{3})"
+    + _PHONE_SPACE
+    + "([0-9]{4}))"
+)
+_NEWLINE = "(\n|\r\n)+"
+ADDRESS_RE = re.compile(
+    "(.+)" + _NEWLINE + "(.+)" + _NEWLINE + "(.+)"  # optional third line
+)
+EMAIL_RE = re.compile("(mailto:)(.+@council.nyc.gov)")
 
 
 def parse_args():
@@ -36,13 +81,36 @@ def parse_args():
         help="Path to city council geojson",
         metavar="",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of district pages to request at once (default {DEFAULT_WORKERS})",
+        metavar="",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=HTTP_CACHE_DIR,
+        help=f"Directory of cached district pages (default {HTTP_CACHE_DIR})",
+        metavar="",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Request and parse all district pages without using the cache",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Build point of contact data from cached district pages only",
+    )
     return parser.parse_args()
 
 
 def parse_cc_member_name(text):
     """Parse text for City Council member name."""
-    title_name_re = "(-{1}\\ +)(.*)"  # 1 hyphen, 1+ spaces, any non-newline
-    match = re.search(title_name_re, text)
+    match = MEMBER_NAME_RE.search(text)
     if match:
         return match.group(2)
     return None
@@ -61,16 +129,8 @@ def format_phone_number(area_code, first, second):
 
 def parse_phone_number(text):
     """Parse text for phone number and perform basic validation."""
-    phone_space = "(\\ *-*\\ *)"  # 0+ spaces, 0+ hyphens, 0+ spaces
-    phone_pattern = (
-        "(([(]*)([0-9]{3})([)]*)"
-        + phone_space
-        + "([0-9]{3})"
-        + phone_space
-        + "([0-9]{4}))"
-    )
     phone_number = None
-    match = re.search(phone_pattern, text)
+    match = PHONE_NUMBER_RE.search(text)
     if match:
         area_code = match.group(3)
         first_three = match.group(6)
@@ -82,11 +142,7 @@ def parse_phone_number(text):
 def parse_address(text):
     """Parse text for district office address."""
     address = None
-    newline = "(\n|\r\n)+"
-    address_pattern = (
-        "(.+)" + newline + "(.+)" + newline + "(.+)"  # optional third line
-    )
-    match = re.search(address_pattern, text)
+    match = ADDRESS_RE.search(text)
     if match:
         address = match.group(1).strip()
         if len(match.group(3)) > 0:
@@ -103,22 +159,144 @@ def parse_cc_email(email_tag, district_num):
     if email_tag is None:
         return email
     text = email_tag["href"]
-    email_pattern = "(mailto:)(.+@council.nyc.gov)"
-    match = re.search(email_pattern, text)
+    match = EMAIL_RE.search(text)
     if match:
         email = match.group(2)
     return email
 
 
-def request_district_page(district_num, headers):
-    """Request and return district page."""
+def _as_strings(texts, index=None):
+    """Return texts as a string Series, with missing texts as NA.
+
+    If index is provided, texts are aligned with it by position.
+    """
+    if isinstance(texts, pd.Series):
+        index = texts.index if index is None else index
+        texts = texts.to_numpy()
+    return pd.Series(texts, index=index, dtype="string")
+
+
+def _parse_unique(texts, parse):
+    """Return object Series of parse applied once to each unique text.
+
+    Archived pages repeat the same texts many times, so each distinct text is
+    only parsed once. Missing texts are parsed as None.
+    """
+    texts = _as_strings(texts)
+    codes, uniques = pd.factorize(texts)
+    parsed = [parse(text) for text in uniques] + [None]  # code -1 is missing
+    return pd.Series([parsed[code] for code in codes], index=texts.index, dtype=object)
+
+
+def parse_cc_member_names(texts):
+    """Return Series of City Council member names parsed from many texts."""
+    return _parse_unique(texts, parse_cc_member_name)
+
+
+def parse_phone_numbers(texts):
+    """Return Series of phone numbers parsed from many texts."""
+    return _parse_unique(texts, parse_phone_number)
+
+
+def parse_addresses(texts):
+    """Return Series of district office addresses parsed from many texts."""
+    return _parse_unique(texts, parse_address)
+
+
+def parse_cc_emails(hrefs, district_nums):
+    """Return Series of district emails parsed from many email link hrefs.
+
+    Missing hrefs and hrefs without a council email get the default district
+    email address.
+    """
+
+    def parse_href(href):
+        match = EMAIL_RE.search(href)
+        return match.group(2) if match else None
+
+    emails = _parse_unique(hrefs, parse_href)
+    default = [f"district{num}@council.nyc.gov" for num in district_nums]
+    return emails.fillna(pd.Series(default, index=emails.index))
+
+
+def parse_district_texts(district_nums, titles, contact_texts, email_hrefs):
+    """Return DataFrame of district info parsed from many district page texts.
+
+    Args:
+        district_nums (array-like): District number of each page.
+        titles (array-like): Page title texts.
+        contact_texts (array-like): District office contact paragraph texts.
+        email_hrefs (array-like): Email link hrefs.
+
+    Returns:
+        pd.DataFrame: District info with FIELDNAMES columns and the index of
+            titles if it is a Series.
+
+    """
+    titles = _as_strings(titles)
+    index = titles.index
+    contact_texts = _as_strings(contact_texts, index)
+    district_nums = list(district_nums)
+    return pd.DataFrame(
+        {
+            "District Number": pd.Series(district_nums, index=index),
+            "Council Member": parse_cc_member_names(titles),
+            "District Office Address": parse_addresses(contact_texts),
+            "District Office Phone": parse_phone_numbers(contact_texts),
+            "District Email": parse_cc_emails(
+                _as_strings(email_hrefs, index), district_nums
+            ),
+        },
+        columns=FIELDNAMES,
+    )
+
+
+def make_session(
+    pool_size: int = DEFAULT_WORKERS,
+    retries: int = RETRIES,
+    backoff: float = RETRY_BACKOFF,
+):
+    """Return session that reuses connections and retries failed requests.
+
+    Args:
+        pool_size (int): Maximum number of connections kept open to the host.
+        retries (int): Maximum number of retries after connection errors or
+            responses with a status in RETRY_STATUSES.
+        backoff (float): Backoff factor in seconds. The first retry is immediate
+            and later retries wait backoff * 2, backoff * 4, ... seconds.
+
+    Returns:
+        requests.Session: Session with a user agent that avoids 403 responses.
+
+    """
+    retry = urllib3.util.Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET"],
+        raise_on_status=False,  # return the last response once retries run out
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["user-agent"] = USER_AGENT
+    return session
+
+
+def request_district_page(district_num, headers, session=None):
+    """Request and return district page, using session if provided."""
     url = BASE_DISTRICTS_URL + str(district_num)
-    return requests.request("get", url, headers=headers, timeout=60)
+    if session is None:
+        return requests.request("get", url, headers=headers, timeout=REQUEST_TIMEOUT)
+    return session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
 
 
-def scrape_district_info(district_num: int, districts_info: dict):
-    """Query City Council District page and parse info."""
-    district_info = {
+def empty_district_info(district_num: int):
+    """Return district info with only the district number filled in."""
+    return {
         "District Number": district_num,
         "Council Member": None,
         "District Office Address": None,
@@ -126,52 +304,198 @@ def scrape_district_info(district_num: int, districts_info: dict):
         "District Email": None,
     }
 
+
+def is_district_info_tag(name: str, attrs: dict):
+    """Return whether tag is one that district info is parsed from."""
+    if name == "title":
+        return True
+    if name == "div":
+        return attrs.get("aria-label") == ADDRESS_PHONE_LABEL
+    return name == "a" and "aria-label" in attrs and "href" in attrs
+
+
+def extract_district_texts(text: str, targeted: bool = True):
+    """Return title, district office contact, and email href texts of page.
+
+    If targeted, only the title, district office contact, and email tags are
+    built into the parse tree, which is faster than building the full tree.
+    Texts that are not found are None.
+    """
+    parse_only = DISTRICT_INFO_STRAINER if targeted else None
+    soup = bs4.BeautifulSoup(text, "html.parser", parse_only=parse_only)
+    title = None if soup.title is None else soup.title.text
+
+    address_phone_tag_attrs = {"aria-label": ADDRESS_PHONE_LABEL}
+    address_phone_div = soup.find(name="div", attrs=address_phone_tag_attrs)
+    contact = None
+    if address_phone_div is not None and address_phone_div.p is not None:
+        contact = address_phone_div.p.text
+
+    email_tag = soup.find("a", attrs={"aria-label": True, "href": True})
+    email_href = None if email_tag is None else email_tag["href"]
+    return title, contact, email_href
+
+
+def parse_district_page(text: str, district_num: int, targeted: bool = True):
+    """Parse district page HTML and return district info.
+
+    See extract_district_texts for targeted.
+    """
+    title, contact, email_href = extract_district_texts(text, targeted)
+    district_info = empty_district_info(district_num)
+
+    # council member name
+    if title is not None:
+        district_info["Council Member"] = parse_cc_member_name(title)
+
+    # get phone number and address for district office
+    if contact is not None:
+        district_info["District Office Address"] = parse_address(contact)
+        district_info["District Office Phone"] = parse_phone_number(contact)
+
+    # district email
+    email_tag = None if email_href is None else {"href": email_href}
+    district_info["District Email"] = parse_cc_email(email_tag, district_num)
+    return district_info
+
+
+def parse_district_pages(pages, district_nums, targeted: bool = True):
+    """Return DataFrame of district info parsed from many district pages.
+
+    Args:
+        pages (pd.Series): District page HTML texts, e.g. archived pages.
+        district_nums (array-like): District number of each page.
+        targeted (bool): See extract_district_texts.
+
+    Returns:
+        pd.DataFrame: District info with FIELDNAMES columns and the index of
+            pages.
+
+    """
+    pages = pd.Series(pages)
+    texts = [extract_district_texts(text, targeted) for text in pages]
+    titles, contacts, email_hrefs = zip(*texts) if texts else ([], [], [])
+    return parse_district_texts(
+        district_nums, pd.Series(titles, index=pages.index), contacts, email_hrefs
+    )
+
+
+def conditional_headers(entry: dict):
+    """Return request headers that validate a cached page entry."""
+    headers = {}
+    if entry is not None and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def scrape_district_info(
+    district_num: int,
+    districts_info: dict,
+    session=None,
+    cache_dir: str = None,
+    offline: bool = False,
+):
+    """Query City Council District page and parse info.
+
+    Args:
+        district_num (int): City Council district number.
+        districts_info (dict): Parsed district info is saved here by district
+            number.
+        session (requests.Session): Session used to request page. If None, a
+            new connection is made.
+        cache_dir (str): Directory of cached pages. If provided, the page is
+            requested only if it changed since it was cached, and is not parsed
+            again if it is unchanged. Pages are not cached if None.
+        offline (bool): Whether to use the cached page without a request.
+
+    """
+    key = src.cache.make_key(
+        "district_page", PARSER_VERSION, BASE_DISTRICTS_URL, district_num
+    )
+    entry = None if cache_dir is None else src.cache.load(key, cache_dir)
+    if offline:
+        if entry is None:
+            raise FileNotFoundError(f"District {district_num} page is not cached")
+        districts_info[district_num] = entry["district_info"]
+        return
+
     # Not including user-agent led to 403 response
-    headers_dict = {"user-agent": USER_AGENT}
-    response = request_district_page(district_num, headers_dict)
-    if response.status_code == 200:
-        soup = bs4.BeautifulSoup(response.text, "html.parser")
-
-        # council member name
-        district_info["Council Member"] = parse_cc_member_name(soup.title.text)
-
-        # get phone number and address for district office
-        address_phone_tag_attrs = {"aria-label": "District office contact information"}
-        address_phone_div = soup.find(name="div", attrs=address_phone_tag_attrs)
-        district_info["District Office Address"] = parse_address(
-            address_phone_div.p.text
-        )
-        district_info["District Office Phone"] = parse_phone_number(
-            address_phone_div.p.text
-        )
-
-        # district email
-        email_tag = soup.find("a", attrs={"aria-label": True, "href": True})
-        district_info["District Email"] = parse_cc_email(email_tag, district_num)
+    headers_dict = {"user-agent": USER_AGENT, **conditional_headers(entry)}
+    response = request_district_page(district_num, headers_dict, session)
+    if response.status_code == 304 and entry is not None:
+        district_info = entry["district_info"]
+    elif response.status_code == 200:
+        digest = hashlib.blake2b(response.content).hexdigest()
+        if entry is not None and entry["digest"] == digest:
+            district_info = entry["district_info"]  # unchanged, skip parsing
+        else:
+            district_info = parse_district_page(response.text, district_num)
+        if cache_dir is not None:
+            entry = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "digest": digest,
+                "text": response.text,
+                "district_info": district_info,
+            }
+            src.cache.store(key, entry, cache_dir)
+    else:
+        district_info = empty_district_info(district_num)
 
     districts_info[district_num] = district_info
 
 
+def scrape_districts_info(
+    district_nums,
+    workers: int = DEFAULT_WORKERS,
+    cache_dir: str = None,
+    offline: bool = False,
+):
+    """Return dictionary of district number to info, requesting pages concurrently.
+
+    At most workers pages are requested at once over a shared pool of
+    keep-alive connections. Failed requests are retried with backoff. See
+    scrape_district_info for cache_dir and offline.
+    """
+    districts_info = {}  # key is district number
+    if offline:
+        for num in district_nums:
+            scrape_district_info(num, districts_info, None, cache_dir, offline=True)
+        return districts_info
+
+    with make_session(pool_size=workers) as session:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    scrape_district_info, num, districts_info, session, cache_dir
+                )
+                for num in district_nums
+            ]
+            for future in futures:
+                future.result()  # raise any request exception
+    return districts_info
+
+
+def write_districts_info(districts_info: dict, path: str):
+    """Write district info to CSV in district number order."""
+    with open(path, "w+", encoding="utf-8") as fp:
+        writer = csv.DictWriter(fp, fieldnames=FIELDNAMES, dialect="unix")
+        writer.writeheader()
+        for _, rowdict in sorted(districts_info.items()):
+            writer.writerow(rowdict)
+
+
 def scrape_cc_districts_info(args):
     """Script driver."""
     district_nums, _ = src.utils.read_geojson(args.geojson, "coun_dist")
-    district_nums = [int(x) for x in district_nums]
-    districts_contact_info = {}  # key is district number
-    for district_num in sorted(district_nums):
-        scrape_district_info(district_num, districts_contact_info)
-
-    with open(os.path.join(args.save, SAVE_NAME), "w+", encoding="utf-8") as fp:
-        fieldnames = [
-            "District Number",
-            "Council Member",
-            "District Office Address",
-            "District Office Phone",
-            "District Email",
-        ]
-        writer = csv.DictWriter(fp, fieldnames=fieldnames, dialect="unix")
-        writer.writeheader()
-        for _, rowdict in sorted(districts_contact_info.items()):
-            writer.writerow(rowdict)
+    district_nums = sorted(int(x) for x in district_nums)
+    cache_dir = None if args.no_cache else args.cache_dir
+    districts_contact_info = scrape_districts_info(
+        district_nums, args.workers, cache_dir, args.offline
+    )
+    write_districts_info(districts_contact_info, os.path.join(args.save, SAVE_NAME))
 
 
 if __name__ == "__main__":
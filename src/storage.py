@@ -0,0 +1,191 @@
+"""Read and write processed collision and traffic data as columnar (Parquet) data."""
+
+import os.path
+import shutil
+import geopandas as gpd
+import pandas as pd
+import pyarrow
+import pyarrow.dataset
+import src.utils
+
+PARTITION_COL = "year"
+DEFAULT_BATCH_SIZE = 500_000
+
+
+def write_crashes(crashes: pd.DataFrame, path: str):
+    """Write processed collisions to a Parquet dataset partitioned by year.
+
+    Geometry is not stored since it can be rebuilt from the LAT and LONG fields.
+    Categorical and boolean fields are stored in compact Parquet encodings.
+    Any existing dataset at path is replaced.
+    """
+    df = pd.DataFrame(crashes.drop(columns="geometry", errors="ignore"))
+    df[PARTITION_COL] = df.index.year
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    df.to_parquet(path, engine="pyarrow", partition_cols=[PARTITION_COL], index=True)
+
+
+def read_crashes(
+    path: str,
+    columns: list = None,
+    start: pd.Timestamp = None,
+    end: pd.Timestamp = None,
+    precincts: list = None,
+    districts: list = None,
+    flags: list = None,
+    geometry: bool = True,
+):
+    """Return processed collisions read from a Parquet dataset.
+
+    Args:
+        path (str): Location of Parquet dataset written by write_crashes.
+        columns (list): Fields to read. All fields are read if None. The datetime
+            index is always read.
+        start (pd.Timestamp): Only collisions at or after start are read.
+        end (pd.Timestamp): Only collisions before end are read.
+        precincts (list): Only collisions in the listed precincts are read.
+        districts (list): Only collisions in the listed districts are read.
+        flags (list): Only collisions where all listed boolean flag fields
+            (e.g. "serious", "valid_lat_long") are True are read.
+        geometry (bool): Whether to return a gpd.GeoDataFrame with Point geometry
+            built from the LAT and LONG fields.
+
+    Returns:
+        pd.DataFrame or gpd.GeoDataFrame: Collisions with a datetime index.
+
+    """
+    filters = []
+    if start is not None:
+        filters.append((PARTITION_COL, ">=", start.year))
+        filters.append(("datetime", ">=", start))
+    if end is not None:
+        filters.append((PARTITION_COL, "<=", end.year))
+        filters.append(("datetime", "<", end))
+    if precincts is not None:
+        filters.append(("precinct", "in", [str(x) for x in precincts]))
+    if districts is not None:
+        filters.append(("district", "in", [str(x) for x in districts]))
+    for flag in flags or []:
+        filters.append((flag, "==", True))
+
+    read_columns = columns
+    if columns is not None and geometry:
+        read_columns = list(dict.fromkeys([*columns, "LAT", "LONG"]))
+    df = pd.read_parquet(
+        path, engine="pyarrow", columns=read_columns, filters=filters or None
+    )
+    df = df.drop(columns=PARTITION_COL, errors="ignore")
+    if not geometry:
+        return df
+
+    points = src.utils.points_from_lat_long(df["LAT"], df["LONG"])
+    if columns is not None:
+        df = df[columns]
+    return gpd.GeoDataFrame(df, geometry=points)
+
+
+def write_traffic(traffic: pd.DataFrame, path: str):
+    """Write processed traffic counts to a Parquet dataset partitioned by year.
+
+    Rows are sorted by datetime and plaza, so that every partition is ordered
+    for joins on the hour. Any existing dataset at path is replaced.
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    append_traffic(traffic, path, 0)
+    sort_traffic_partitions(path)
+
+
+def append_traffic(traffic: pd.DataFrame, path: str, part: int):
+    """Add a chunk of processed traffic counts to a Parquet dataset.
+
+    Each year of the chunk is written to a new file named by part, which must
+    be unique to the chunk. Use sort_traffic_partitions after the last chunk.
+    """
+    df = traffic.copy()
+    df[PARTITION_COL] = df.index.year.astype("int32")
+    pyarrow.dataset.write_dataset(
+        pyarrow.Table.from_pandas(df, preserve_index=True),
+        path,
+        format="parquet",
+        partitioning=[PARTITION_COL],
+        partitioning_flavor="hive",
+        basename_template=f"chunk-{part}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def sort_traffic_partitions(path: str):
+    """Replace the chunk files of each year partition with one sorted file.
+
+    Rows are sorted by datetime and plaza. Only one year is in memory at a time.
+    """
+    for name in sorted(os.listdir(path)):
+        partition = os.path.join(path, name)
+        chunk_files = sorted(os.listdir(partition))
+        df = pd.read_parquet(partition, engine="pyarrow")
+        df = df.sort_values(["datetime", "PLAZA"], kind="stable")
+        df.to_parquet(os.path.join(partition, "part-0.parquet"), engine="pyarrow")
+        for chunk_file in chunk_files:
+            os.remove(os.path.join(partition, chunk_file))
+
+
+def read_traffic(
+    path: str,
+    columns: list = None,
+    start: pd.Timestamp = None,
+    end: pd.Timestamp = None,
+    plazas: list = None,
+):
+    """Return processed traffic counts read from a Parquet dataset.
+
+    Args:
+        path (str): Location of Parquet dataset written by write_traffic.
+        columns (list): Fields to read. All fields are read if None. The datetime
+            index is always read.
+        start (pd.Timestamp): Only counts at or after start are read.
+        end (pd.Timestamp): Only counts before end are read.
+        plazas (list): Only counts at the listed plaza ids are read.
+
+    Returns:
+        pd.DataFrame: Traffic counts with a datetime index, sorted by datetime
+            and plaza.
+
+    """
+    filters = []
+    if start is not None:
+        filters.append((PARTITION_COL, ">=", start.year))
+        filters.append(("datetime", ">=", start))
+    if end is not None:
+        filters.append((PARTITION_COL, "<=", end.year))
+        filters.append(("datetime", "<", end))
+    if plazas is not None:
+        filters.append(("PLAZA", "in", [str(x) for x in plazas]))
+    df = pd.read_parquet(
+        path, engine="pyarrow", columns=columns, filters=filters or None
+    )
+    return df.drop(columns=PARTITION_COL, errors="ignore")
+
+
+def iter_traffic(path: str, columns: list = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Yield processed traffic counts read from a Parquet dataset in batches.
+
+    Batches are read in order, so they are sorted by datetime and plaza like
+    read_traffic, and at most batch_size rows are in memory at a time.
+
+    Args:
+        path (str): Location of Parquet dataset written by write_traffic.
+        columns (list): Fields to read. All fields are read if None. The datetime
+            index is always read.
+        batch_size (int): Maximum number of rows of each DataFrame.
+
+    Yields:
+        pd.DataFrame: Traffic counts with a datetime index.
+
+    """
+    dataset = pyarrow.dataset.dataset(path, format="parquet", partitioning="hive")
+    if columns is not None:
+        columns = [*columns, "datetime"]
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield batch.to_pandas().drop(columns=PARTITION_COL, errors="ignore")
@@ -0,0 +1,176 @@
+"""Pre-clustered tile pyramids of collision points for marker maps.
+
+A pyramid has a tile of clusters for every map tile with points at each zoom
+from min_zoom to leaf_zoom - 1, and a tile of the points themselves at
+leaf_zoom. Clusters are points merged on a grid of CELL_SIZE pixel cells, which
+nest in the cells and tiles of lower zooms, so each zoom is aggregated from the
+clusters of the next.
+"""
+
+import json
+import os
+import os.path
+import shutil
+import numpy as np
+import pandas as pd
+
+TILE_SIZE = 256  # pixels, as in Leaflet
+CELL_SIZE = 64  # pixels, must divide TILE_SIZE
+MIN_ZOOM = 10
+LEAF_ZOOM = 16
+COORD_DECIMALS = 5  # about 1 m
+PYRAMID_FILENAME = "pyramid.json"
+
+
+def mercator_xy(lat, long):
+    """Return arrays of Web Mercator x and y in [0, 1) of latitudes and longitudes."""
+    lat_rad = np.radians(np.asarray(lat, dtype=float))
+    x = (np.asarray(long, dtype=float) + 180) / 360
+    y = (1 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2
+    return x, y
+
+
+def _group_tiles(zoom: int, tile_x, tile_y, rows: list, kind: str, tiles: dict):
+    """Add rows to the kind list of their tiles at zoom."""
+    for x, y, row in zip(tile_x.tolist(), tile_y.tolist(), rows):
+        tile = tiles.setdefault((zoom, x, y), {"clusters": [], "points": []})
+        tile[kind].append(row)
+
+
+def build_tile_pyramid(
+    map_data: pd.DataFrame,
+    min_zoom: int = MIN_ZOOM,
+    leaf_zoom: int = LEAF_ZOOM,
+    decimals: int = COORD_DECIMALS,
+):
+    """Return tile pyramid of map data points and clusters.
+
+    Args:
+        map_data (pd.DataFrame): Latitude, longitude, and popup field columns,
+            like make_marker_map data.
+        min_zoom (int): Lowest zoom with tiles.
+        leaf_zoom (int): Zoom with tiles of points, higher than min_zoom.
+        decimals (int): Decimal places of coordinates.
+
+    Returns:
+        dict: (zoom, x, y) of each tile with points to dictionary with
+            "clusters", a list of [lat, long, count] of clusters of more than
+            one point, and "points", a list of [lat, long, *fields] rows of
+            single points.
+
+    """
+    lat = map_data.iloc[:, 0].to_numpy(float)
+    long = map_data.iloc[:, 1].to_numpy(float)
+    x, y = mercator_xy(lat, long)
+    # rows as native Python values so tiles can be written as JSON
+    rows = [
+        list(row)
+        for row in zip(
+            np.round(lat, decimals).tolist(),
+            np.round(long, decimals).tolist(),
+            *[field.tolist() for _, field in map_data.iloc[:, 2:].items()],
+        )
+    ]
+
+    tiles = {}
+    _group_tiles(
+        leaf_zoom,
+        (x * 2**leaf_zoom).astype(np.int64),
+        (y * 2**leaf_zoom).astype(np.int64),
+        rows,
+        "points",
+        tiles,
+    )
+
+    # cells of the highest clustered zoom, each zoom below halves the cell indices
+    cells_per_tile = TILE_SIZE // CELL_SIZE
+    scale = 2 ** (leaf_zoom - 1) * cells_per_tile
+    cells = pd.DataFrame(
+        {
+            "cell_x": (x * scale).astype(np.int64),
+            "cell_y": (y * scale).astype(np.int64),
+            "lat": lat,
+            "long": long,
+            "count": 1,
+            "first": np.arange(len(rows)),
+        }
+    )
+    for zoom in range(leaf_zoom - 1, min_zoom - 1, -1):
+        cells = cells.groupby(["cell_x", "cell_y"], as_index=False, sort=False).agg(
+            lat=("lat", "sum"),
+            long=("long", "sum"),
+            count=("count", "sum"),
+            first=("first", "min"),
+        )
+        tile_x = cells["cell_x"].to_numpy() // cells_per_tile
+        tile_y = cells["cell_y"].to_numpy() // cells_per_tile
+        single = cells["count"].to_numpy() == 1
+        _group_tiles(
+            zoom,
+            tile_x[single],
+            tile_y[single],
+            [rows[i] for i in cells.loc[single, "first"]],
+            "points",
+            tiles,
+        )
+        clusters = cells.loc[~single]
+        _group_tiles(
+            zoom,
+            tile_x[~single],
+            tile_y[~single],
+            [
+                [
+                    round(lat_sum / count, decimals),
+                    round(long_sum / count, decimals),
+                    count,
+                ]
+                for lat_sum, long_sum, count in zip(
+                    clusters["lat"].tolist(),
+                    clusters["long"].tolist(),
+                    clusters["count"].tolist(),
+                )
+            ],
+            "clusters",
+            tiles,
+        )
+        cells["cell_x"] //= 2
+        cells["cell_y"] //= 2
+    return tiles
+
+
+def pyramid_metadata(tiles: dict, min_zoom: int, leaf_zoom: int):
+    """Return dictionary of zooms and [x_min, y_min, x_max, y_max] of tiles."""
+    bounds = {}
+    for zoom, x, y in tiles:
+        x_min, y_min, x_max, y_max = bounds.get(zoom, (x, y, x, y))
+        bounds[zoom] = [min(x_min, x), min(y_min, y), max(x_max, x), max(y_max, y)]
+    return {
+        "min_zoom": min_zoom,
+        "leaf_zoom": leaf_zoom,
+        "bounds": {str(zoom): bounds[zoom] for zoom in sorted(bounds)},
+    }
+
+
+def write_tile_pyramid(
+    map_data: pd.DataFrame,
+    path: str,
+    min_zoom: int = MIN_ZOOM,
+    leaf_zoom: int = LEAF_ZOOM,
+    decimals: int = COORD_DECIMALS,
+):
+    """Write tile pyramid of map data to a directory, replacing any existing one.
+
+    Tiles are written to {path}/{zoom}/{x}/{y}.json and pyramid metadata to
+    {path}/PYRAMID_FILENAME. See build_tile_pyramid for arguments.
+    """
+    tiles = build_tile_pyramid(map_data, min_zoom, leaf_zoom, decimals)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    for (zoom, x, y), tile in tiles.items():
+        tile_dir = os.path.join(path, str(zoom), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        with open(os.path.join(tile_dir, f"{y}.json"), "w", encoding="utf-8") as fp:
+            json.dump(tile, fp, separators=(",", ":"))
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, PYRAMID_FILENAME), "w", encoding="utf-8") as fp:
+        json.dump(pyramid_metadata(tiles, min_zoom, leaf_zoom), fp)
@@ -2,14 +2,25 @@
 
 import bisect
 import calendar
+import contextlib
 import datetime
 import json
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import shapely
 from shapely.geometry import shape
 from shapely.strtree import STRtree
 from sklearn import model_selection
+from src.constants import SEASONS
+
+
+# aggregations supported by the single-pass crosstab engine
+CROSSTAB_AGGFUNCS = ("sum", "mean", "count", "min", "max")
+
+# geometries per nearest-shape query sent to a worker process
+NEAREST_PARTITION_SIZE = 100_000
 
 
 def min_max_across_crosstabs(
@@ -26,25 +37,141 @@ def min_max_across_crosstabs(
     Categories should be an iterable. Used to ensure that different heatmaps
     have the same scale.
     """
+    min_val, max_val, _ = crosstabs_across_categories(
+        categories,
+        cat_series,
+        idx_series,
+        col_series,
+        value_series=value_series,
+        aggfunc=aggfunc,
+        divisor=divisor,
+    )
+    return min_val, max_val
+
+
+def crosstabs_across_categories(
+    categories,
+    cat_series,
+    idx_series,
+    col_series,
+    value_series=None,
+    aggfunc=None,
+    divisor=1,
+):
+    """Return min and max across crosstabs of all categories, and the crosstabs.
+
+    Crosstabs are a dictionary of category to crosstab. Each crosstab matches
+    pd.crosstab of the rows belonging to a category. Inputs are aligned by
+    position. Crosstabs without values and crosstabs with an aggfunc in
+    CROSSTAB_AGGFUNCS are built for all categories in one pass over the data as a
+    3D (category x index x column) array. Other aggfuncs fall back to one
+    pd.crosstab per category.
+    """
     if value_series is not None and aggfunc is None:
         raise TypeError("'value_series' requires 'aggfunc' to be specified.")
+    categories = list(dict.fromkeys(categories))
+    if aggfunc is None or aggfunc in CROSSTAB_AGGFUNCS:
+        tables = _crosstabs_single_pass(
+            categories, cat_series, idx_series, col_series, value_series, aggfunc
+        )
+    else:
+        tables = _crosstabs_per_category(
+            categories, cat_series, idx_series, col_series, value_series, aggfunc
+        )
+
     max_val = float("-inf")
     min_val = float("inf")
+    for cat, ct in tables.items():
+        tables[cat] = ct / divisor
+        if ct.size:
+            min_val = min(min_val, np.nanmin(tables[cat].to_numpy()))
+            max_val = max(max_val, np.nanmax(tables[cat].to_numpy()))
+    return min_val, max_val, tables
+
+
+def _crosstabs_per_category(
+    categories, cat_series, idx_series, col_series, value_series, aggfunc
+):
+    """Return dictionary of category to pd.crosstab, built one category at a time."""
+    cat_values = pd.Series(np.asarray(cat_series))
+    tables = {}
     for cat in categories:
-        is_true = cat_series.isin([cat])
-        idx = idx_series[is_true]
-        cols = col_series[is_true]
+        is_true = cat_values.isin([cat]).to_numpy()
         values = None
         if aggfunc:
-            values = value_series[is_true]
-        ct = (
-            pd.crosstab(index=idx, columns=cols, values=values, aggfunc=aggfunc)
-            / divisor
+            values = np.asarray(value_series)[is_true]
+        tables[cat] = pd.crosstab(
+            index=np.asarray(idx_series)[is_true],
+            columns=np.asarray(col_series)[is_true],
+            values=values,
+            aggfunc=aggfunc,
+            rownames=[_crosstab_name(idx_series, "row_0")],
+            colnames=[_crosstab_name(col_series, "col_0")],
         )
+    return tables
 
-        min_val = min(min_val, min(ct.min()))  # ct.min() / max() return pd.Series
-        max_val = max(max_val, max(ct.max()))
-    return min_val, max_val
+
+def _crosstabs_single_pass(
+    categories, cat_series, idx_series, col_series, value_series, aggfunc
+):
+    """Return dictionary of category to crosstab, built for all categories at once."""
+    cat_codes = pd.Index(categories).get_indexer(np.asarray(cat_series))
+    idx_codes, idx_levels = pd.factorize(np.asarray(idx_series), sort=True)
+    col_codes, col_levels = pd.factorize(np.asarray(col_series), sort=True)
+    shape_3d = (len(categories), len(idx_levels), len(col_levels))
+
+    # flattened position of each valid row in category x index x column array
+    is_valid = (cat_codes >= 0) & (idx_codes >= 0) & (col_codes >= 0)
+    flat = np.ravel_multi_index(
+        (cat_codes[is_valid], idx_codes[is_valid], col_codes[is_valid]), shape_3d
+    )
+    size = int(np.prod(shape_3d))
+    counts = np.bincount(flat, minlength=size).reshape(shape_3d)
+
+    if aggfunc is None:
+        cube = counts
+    else:
+        values = np.asarray(value_series, dtype="float64")[is_valid]
+        has_value = ~np.isnan(values)
+        flat, values = flat[has_value], values[has_value]
+        value_counts = np.bincount(flat, minlength=size).astype("float64")
+        if aggfunc in ("sum", "mean"):
+            cube = np.bincount(flat, weights=values, minlength=size)
+        elif aggfunc == "count":
+            cube = value_counts
+        else:
+            ufunc = np.minimum if aggfunc == "min" else np.maximum
+            cube = np.full(size, np.inf if aggfunc == "min" else -np.inf)
+            ufunc.at(cube, flat, values)
+        if aggfunc in ("mean", "min", "max"):
+            # as in pd.crosstab, cells without any non-missing values are missing,
+            # and rows and columns of only missing cells are dropped
+            counts = value_counts.reshape(shape_3d)
+            if aggfunc == "mean":
+                cube = cube / np.where(value_counts > 0, value_counts, np.nan)
+        # cells without any rows are missing, as in pd.crosstab
+        cube = np.where(counts.ravel() > 0, cube, np.nan).reshape(shape_3d)
+
+    # crosstab rows and columns are the index and column values in each category
+    has_rows = counts.sum(axis=2) > 0
+    has_cols = counts.sum(axis=1) > 0
+
+    idx_name = _crosstab_name(idx_series, "row_0")
+    col_name = _crosstab_name(col_series, "col_0")
+    tables = {}
+    for i, cat in enumerate(categories):
+        tables[cat] = pd.DataFrame(
+            cube[i][np.ix_(has_rows[i], has_cols[i])],
+            index=pd.Index(idx_levels[has_rows[i]], name=idx_name),
+            columns=pd.Index(col_levels[has_cols[i]], name=col_name),
+        )
+    return tables
+
+
+def _crosstab_name(arr, default):
+    """Return name of input array, or default name used by pd.crosstab."""
+    name = getattr(arr, "name", None)
+    return default if name is None else name
 
 
 def make_heatmap_labels(
@@ -60,21 +187,39 @@ def make_heatmap_labels(
     return ct_labels
 
 
+# day of year corresponding to following dates:
+# 1-Jan, 21-Mar, 21-Jun, 21-Sep, 21-Dec, 31-Dec
+# day of year can be obtained using datetime_obj.timetuple().tm_yday
+# 21-March is considered first day of Spring, etc.
+SEASON_BINS = (1, 80, 172, 264, 355, 365)
+LEAP_YEAR_SEASON_BINS = (1, 81, 173, 265, 356, 366)
+SEASON_LABELS = ("Winter", "Spring", "Summer", "Fall", "Winter")
+
+
 def date_to_season(dt: datetime.datetime | pd.Timestamp):
     """Convert individual datetime or pd.Timestamp to season of year."""
-    # day of year corresponding to following dates:
-    # 1-Jan, 21-Mar, 21-Jun, 21-Sep, 21-Dec, 31-Dec
-    # day of year can be obtained using datetime_obj.timetuple().tm_yday
-    # 21-March is considered first day of Spring, etc.
-    season_bins = (1, 80, 172, 264, 355, 365)
-    leap_year_season_bins = (1, 81, 173, 265, 356, 366)
-    season_labels = ("Winter", "Spring", "Summer", "Fall", "Winter")
-
-    bins = season_bins
+    bins = SEASON_BINS
     if calendar.isleap(dt.year):
-        bins = leap_year_season_bins
-    idx = (bisect.bisect(bins, dt.timetuple().tm_yday) - 1) % len(season_labels)
-    return season_labels[idx]
+        bins = LEAP_YEAR_SEASON_BINS
+    idx = (bisect.bisect(bins, dt.timetuple().tm_yday) - 1) % len(SEASON_LABELS)
+    return SEASON_LABELS[idx]
+
+
+def dates_to_seasons(dates):
+    """Convert pd.DatetimeIndex or datetime64 array to pd.Categorical of season.
+
+    Categories are ordered as in SEASONS. Missing dates (NaT) are missing values.
+    """
+    dates = pd.DatetimeIndex(dates)
+    is_missing = np.asarray(dates.isna())
+    # leap year bins are shifted by one day after 1-Jan
+    day_of_year = np.where(is_missing, 1, dates.dayofyear).astype("int64")
+    day_of_year = np.maximum(day_of_year - dates.is_leap_year, 1)
+    bin_idx = np.searchsorted(SEASON_BINS, day_of_year, side="right") - 1
+    idx = bin_idx % len(SEASON_LABELS)
+    label_codes = np.array([SEASONS.index(label) for label in SEASON_LABELS])
+    codes = np.where(is_missing, -1, label_codes[idx])
+    return pd.Categorical.from_codes(codes, categories=SEASONS)
 
 
 def read_geojson(shape_file_loc: str, property_name: str):
@@ -89,6 +234,18 @@ def read_geojson(shape_file_loc: str, property_name: str):
     return geom_ids, geoms
 
 
+def points_from_lat_long(lat, long):
+    """Return gpd.GeometryArray of Points built in bulk from lat and long arrays.
+
+    Points with a missing (np.nan) latitude or longitude are empty Point().
+    """
+    lat = np.asarray(lat, dtype="float64")
+    long = np.asarray(long, dtype="float64")
+    points = gpd.points_from_xy(long, lat)
+    points[np.isnan(lat) | np.isnan(long)] = shapely.Point()
+    return points
+
+
 def id_nearest_shape(geometry: shapely.Point, r_tree: shapely.STRtree, shape_ids: list):
     """Return the id (from list of shape_ids) of the nearest shape to input geometry.
 
@@ -100,23 +257,120 @@ def id_nearest_shape(geometry: shapely.Point, r_tree: shapely.STRtree, shape_ids
     return sid
 
 
+def ids_nearest_shapes(
+    geometries,
+    r_tree: shapely.STRtree,
+    shape_ids: list,
+    executor: ProcessPoolExecutor = None,
+    tree_name: str = None,
+):
+    """Return array of ids (from shape_ids) of the nearest shape to each geometry.
+
+    All geometries are sent to the Shapely STRtree in a single bulk query. If an
+    executor from nearest_shapes_pool is provided, geometries are partitioned and
+    queried in its worker processes using their copy of the tree_name tree.
+    Invalid or empty geometries are assigned None.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    sids = np.full(len(geometries), None, dtype=object)
+    is_valid = shapely.is_valid(geometries) & ~shapely.is_empty(geometries)
+    valid_idx = np.flatnonzero(is_valid)
+    if len(valid_idx) == 0 or len(shape_ids) == 0:
+        return sids
+    if executor is not None:
+        # geometries are sent to workers as WKB, which is faster than pickling
+        wkb = shapely.to_wkb(geometries[valid_idx])
+        partitions = np.array_split(
+            wkb, -(-len(wkb) // NEAREST_PARTITION_SIZE)  # ceiling division
+        )
+        tree_idx = np.concatenate(
+            list(
+                executor.map(
+                    _worker_nearest_tree_indices,
+                    [tree_name] * len(partitions),
+                    partitions,
+                )
+            )
+        )
+    else:
+        tree_idx = nearest_tree_indices(geometries[valid_idx], r_tree)
+    shape_ids = np.asarray(shape_ids, dtype=object)
+    sids[valid_idx] = shape_ids[tree_idx]
+    return sids
+
+
+def nearest_tree_indices(geometries, r_tree: shapely.STRtree):
+    """Return array of the tree index of the nearest tree geometry to each geometry.
+
+    Geometries must be valid and non-empty.
+    """
+    # query_nearest returns [[input indices], [tree indices]]
+    input_idx, tree_idx = r_tree.query_nearest(geometries, all_matches=False)
+    nearest = np.empty(len(geometries), dtype="int64")
+    nearest[input_idx] = tree_idx
+    return nearest
+
+
+def nearest_shapes_pool(trees: dict, workers: int):
+    """Return a pool of workers processes for ids_nearest_shapes lookups.
+
+    Each worker process builds its own copy of the trees (a dictionary of tree
+    name to STRtree) once when it starts. If workers <= 1, a context manager that
+    returns None is returned, so lookups run in the calling process.
+    """
+    if workers <= 1:
+        return contextlib.nullcontext()
+    trees_wkb = {name: shapely.to_wkb(tree.geometries) for name, tree in trees.items()}
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_nearest_worker,
+        initargs=(trees_wkb,),
+    )
+
+
+# STRtrees held by each nearest-shape worker process, by tree name
+_WORKER_TREES = {}
+
+
+def _init_nearest_worker(trees_wkb: dict):
+    """Build the worker process copies of the STRtrees from WKB geometries."""
+    for name, tree_wkb in trees_wkb.items():
+        _WORKER_TREES[name] = STRtree(shapely.from_wkb(tree_wkb))
+
+
+def _worker_nearest_tree_indices(tree_name: str, wkb):
+    """Return nearest_tree_indices of WKB geometries using a worker STRtree."""
+    return nearest_tree_indices(shapely.from_wkb(wkb), _WORKER_TREES[tree_name])
+
+
 def add_location_feature(
     gdf: gpd.GeoDataFrame,
     geojson_path: str,
     geojson_property: str,
     feature_name: str = None,
+    bulk: bool = True,
+    workers: int = 1,
 ):
     """Return a GeoPandas.Dataframe with added location-related feature.
 
     Feature value is set to identifier of the nearest geometry in the read geojson.
+    If bulk is True, all geometries are matched in vectorized tree queries, split
+    across worker processes if workers > 1. Otherwise each row is matched
+    individually.
     """
     geom_ids, geoms = read_geojson(geojson_path, geojson_property)
     tree = STRtree(geoms)
     if not feature_name:
         feature_name = geojson_property
-    gdf[feature_name] = gdf.apply(
-        lambda x: id_nearest_shape(x.geometry, tree, geom_ids), axis=1
-    )
+    if bulk:
+        with nearest_shapes_pool({feature_name: tree}, workers) as executor:
+            gdf[feature_name] = ids_nearest_shapes(
+                gdf.geometry.array, tree, geom_ids, executor, feature_name
+            )
+    else:
+        gdf[feature_name] = gdf.apply(
+            lambda x: id_nearest_shape(x.geometry, tree, geom_ids), axis=1
+        )
     return gdf
 
 
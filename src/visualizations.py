@@ -1,14 +1,22 @@
 """Helper functions for project visualizations."""
 
+import json
 import folium
 import folium.plugins
 import geopandas as gpd
+import jinja2
 import numpy as np
 import matplotlib as mpl
+import matplotlib.figure
 import pandas as pd
+import shapely
 from matplotlib.colors import ListedColormap
+from matplotlib.ticker import FuncFormatter
 import matplotlib.pyplot as plt
-from src.constants import NYC_MAP_CENTER
+from src.constants import COORD_REF_SYSTEM, NYC_MAP_CENTER
+import src.cache
+import src.tiles
+import src.utils
 
 
 HEATMAP_COLORS = (
@@ -30,6 +38,13 @@ CYCLE_COLORS = (
     "#7F7F7F",  # gray
 )
 
+# degrees, about 10 m, that choropleth geometry is simplified to
+CHOROPLETH_SIMPLIFY_TOLERANCE = 0.0001
+# marker colors of make_marker_map color_field values
+MARKER_COLORS = ("red", "blue", "gray", "orange", "black")
+# decimal places of packed marker coordinates, 5 is about 1 m
+MARKER_COORD_DECIMALS = 5
+
 
 def setup_chart(
     figsize=(18, 10),
@@ -58,9 +73,15 @@ def setup_chart(
     text=None,
     textfontsize=16,
     textfontstyle="normal",  # italic, bold
+    *,
+    fig=None,
 ):
-    """Setup common parameters for Matplotlib charts."""
-    fig, ax = plt.subplots()
+    """Setup common parameters for Matplotlib charts.
+
+    A new pyplot figure is made unless an existing figure is provided as fig,
+    which is cleared and reused.
+    """
+    fig, ax = new_figure(fig)
     fig.set_size_inches(figsize)  # width, height
     ax.set_title(title, fontsize=titlesize, pad=titlepad)
     # y axis
@@ -112,6 +133,28 @@ def setup_chart(
     return fig, ax
 
 
+def new_figure(fig=None):
+    """Return new pyplot figure and axes, or cleared fig and new axes."""
+    if fig is None:
+        return plt.subplots()
+    fig.clear()
+    fig.set_facecolor(mpl.rcParams["figure.facecolor"])  # may differ by style
+    return fig, fig.subplots()
+
+
+def finish_figure(fig, save="", show=True, reused=False):
+    """Save figure if save is a path, then show or close it.
+
+    Reused figures are left open for the caller to reuse.
+    """
+    if save:
+        fig.savefig(save, bbox_inches="tight")
+    if show:
+        plt.show()
+    elif not reused:
+        plt.close(fig)
+
+
 def annotate_axis(
     ax,
     x_arr,
@@ -168,13 +211,19 @@ def grouped_bar_chart(
     bar_label_bbox=None,
     bar_digits=0,
     legend_args=None,
+    show=True,
+    fig=None,
     **setup_args,
 ):
     """Make a grouped vertical bar chart from a pd.DataFrame where the DataFrame index
     represents the groupings and columns represent the individual bar heights.
+
+    If show is False, the chart is not displayed and its figure is closed. An
+    existing figure can be reused by providing it as fig.
     """
     with plt.style.context(style):
-        fig, ax = setup_chart(**setup_args)
+        reused = fig is not None
+        fig, ax = setup_chart(fig=fig, **setup_args)
 
         # bar and bar group sizes
         bar_group_width = fig.get_size_inches()[0] / len(df.index)
@@ -182,29 +231,26 @@ def grouped_bar_chart(
         bar_width = (bar_group_width / len(df.columns)) * (1 - relative_gap)
 
         # x labels and location
-        x_labels = df.index
-        x_label_locs = []
-        for x in range(len(x_labels)):
-            x_loc = -bar_width + (bars_no_space_width / 2) + (bar_group_width * x)
-            x_label_locs.append(x_loc)
-        ax.set_xticks(x_label_locs, x_labels)
+        group_locs = bar_group_width * np.arange(len(df.index))
+        x_label_locs = group_locs - bar_width + (bars_no_space_width / 2)
+        ax.set_xticks(x_label_locs, df.index)
         ax.set_axisbelow(True)
         ax.grid(which="major", axis="y", linewidth=0.9)
 
         # bars and bar labels
-        bars = []
-        for i in range(len(df.columns)):
-            col_name = df.columns[i]
-            offset = (bar_width * i) - (bar_width / 2)
-            x = [offset + (bar_group_width * j) for j in range(len(df.index))]
-            y = df[col_name].values
-            bars.append(ax.bar(x, height=y, width=bar_width, label=col_name))
-        for bar in bars:
-            if bar_label_bbox is None:
-                bar_label_bbox = {"facecolor": "none", "edgecolor": "none"}
+        if bar_label_bbox is None:
+            bar_label_bbox = {"facecolor": "none", "edgecolor": "none"}
+        offsets = (bar_width * np.arange(len(df.columns))) - (bar_width / 2)
+        for offset, col_name in zip(offsets, df.columns):
+            bar = ax.bar(
+                group_locs + offset,
+                height=df[col_name].values,
+                width=bar_width,
+                label=col_name,
+            )
             ax.bar_label(
                 bar,
-                labels=[f"{val:,.{bar_digits}f}" for val in bar.datavalues],
+                fmt=f"{{:,.{bar_digits}f}}",
                 fontsize=bar_fontsize,
                 padding=bar_padding,
                 bbox=bar_label_bbox,
@@ -217,9 +263,7 @@ def grouped_bar_chart(
             fig_legend(
                 fig, legend_labels, **legend_kwargs
             )  # legend labels are sensitive to order
-    if save:
-        plt.savefig(save, bbox_inches="tight")
-    plt.show()
+    finish_figure(fig, save, show, reused)
 
 
 def horizontal_bar_chart(
@@ -229,11 +273,17 @@ def horizontal_bar_chart(
     style="default",
     save="",
     reverse=False,
+    show=True,
+    fig=None,
     **setup_args,
 ):
-    """Make a horizontal bar chart from input bar labels and respective values."""
+    """Make a horizontal bar chart from input bar labels and respective values.
+
+    See grouped_bar_chart for show and fig.
+    """
     with plt.style.context(style):
-        fig, ax = setup_chart(**setup_args)
+        reused = fig is not None
+        fig, ax = setup_chart(fig=fig, **setup_args)
         # horizontal bars
         y = list(range(len(bar_values)))
         if reverse:
@@ -241,9 +291,7 @@ def horizontal_bar_chart(
         bars = ax.barh(y, bar_values)
         ax.set_yticks(y, bar_labels, va="center")
         ax.bar_label(bars, padding=5, fontsize=bar_fontsize)
-    if save:
-        plt.savefig(save, bbox_inches="tight")
-    plt.show()
+    finish_figure(fig, save, show, reused)
 
 
 def line_chart(
@@ -257,11 +305,17 @@ def line_chart(
     legend_labels=None,
     legend_args=None,
     save="",
+    show=True,
+    fig=None,
     **setup_args,
 ):
-    """Make a line chart."""
+    """Make a line chart.
+
+    See grouped_bar_chart for show and fig.
+    """
     with plt.style.context(style):
-        fig, ax = setup_chart(**setup_args)
+        reused = fig is not None
+        fig, ax = setup_chart(fig=fig, **setup_args)
         # plot lines
         for tup in list_x_y_tuples:
             x_arr, y_arr = tup
@@ -283,9 +337,7 @@ def line_chart(
             fig_legend(
                 fig, legend_labels, **legend_kwargs
             )  # legend labels are sensitive to order
-    if save:
-        plt.savefig(save, bbox_inches="tight")
-    plt.show()
+    finish_figure(fig, save, show, reused)
 
 
 def format_cbar_default(tick):
@@ -302,6 +354,8 @@ def heat_map(
     min_max=None,
     save="",
     cbar_format=format_cbar_default,
+    show=True,
+    fig=None,
 ):
     """Make a 2D heatmap from a pd.crosstab.
 
@@ -309,9 +363,11 @@ def heat_map(
         "title", "x_label", "y_label", "cbar_label"
     - interpolation is the interpolation technique to smooth the heatmap boxes
     - min_max is a tuple of the min/max values for the color graduations
+    - see grouped_bar_chart for show and fig
     """
     # figure and title
-    fig, ax = plt.subplots()
+    reused = fig is not None
+    fig, ax = new_figure(fig)
     fig.set_size_inches(fig_size)  # width, height
     ax.set_title(labels["title"], fontsize=22, pad=50)
 
@@ -356,12 +412,12 @@ def heat_map(
     cbar = fig.colorbar(
         im,
         ticks=np.arange(min_val, max_val + step, step),
+        format=FuncFormatter(lambda tick, _: cbar_format(tick)),
         orientation="horizontal",
         aspect=50,
         pad=0.1,
     )  # aspect is ratio of x to y
     cbar.ax.set_xlabel(labels["cbar_label"], rotation=0, fontsize=16)
-    cbar.ax.set_xticklabels([cbar_format(tick) for tick in cbar.get_ticks()])
     cbar.ax.tick_params(labelsize=14)
 
     # gridlines
@@ -383,33 +439,316 @@ def heat_map(
         colors="gray",
         linewidth=0.3,
     )
-    if save:
-        plt.savefig(save, bbox_inches="tight")
-    plt.show()
+    finish_figure(fig, save, show, reused)
+
+
+CHART_FUNCTIONS = {
+    "grouped_bar_chart": grouped_bar_chart,
+    "horizontal_bar_chart": horizontal_bar_chart,
+    "line_chart": line_chart,
+    "heat_map": heat_map,
+}
+
+
+def render_charts(specs):
+    """Render and save many charts without displaying them.
+
+    Charts are drawn one at a time on a single reused figure that is not
+    managed by pyplot, so no interactive backend is needed and no figures are
+    left open.
+
+    Args:
+        specs (iterable): Dictionaries with a "kind" key naming a chart function
+            in CHART_FUNCTIONS and that function's arguments, including "save".
+
+    """
+    fig = matplotlib.figure.Figure()
+    try:
+        for spec in specs:
+            chart_args = dict(spec)
+            chart_function = CHART_FUNCTIONS[chart_args.pop("kind")]
+            chart_function(**chart_args, show=False, fig=fig)
+    finally:
+        fig.clear()
+
+
+def pack_marker_data(map_data: pd.DataFrame, decimals=MARKER_COORD_DECIMALS):
+    """Return compact JSON-serializable dict of marker map data.
+
+    Coordinates (the first two columns) are rounded to decimals places, sorted,
+    and stored as integer differences from the previous point. Numeric popup
+    fields are stored as values and other popup fields as codes into a list of
+    their unique values, in the same order as the points.
+
+    Args:
+        map_data (pd.DataFrame): Latitude, longitude, and popup field columns.
+        decimals (int): Decimal places of packed coordinates.
+
+    Returns:
+        dict: "scale" of the coordinates, "lat" and "long" differences, and
+            "fields" with "data" or "codes" and "values" for each popup field.
+
+    """
+    scale = 10**decimals
+    lat = np.round(map_data.iloc[:, 0].to_numpy(float) * scale).astype(np.int64)
+    long = np.round(map_data.iloc[:, 1].to_numpy(float) * scale).astype(np.int64)
+    order = np.lexsort((long, lat))
+    lat, long = lat[order], long[order]
+    fields = []
+    for _, series in map_data.iloc[:, 2:].items():
+        values = series.to_numpy()[order]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(
+            series
+        ):
+            fields.append({"data": values.tolist()})
+        else:
+            codes, uniques = pd.factorize(values)
+            fields.append({"codes": codes.tolist(), "values": uniques.tolist()})
+    return {
+        "scale": scale,
+        "lat": np.diff(lat, prepend=0).tolist(),
+        "long": np.diff(long, prepend=0).tolist(),
+        "fields": fields,
+    }
 
 
-def make_marker_map(map_data: pd.DataFrame, text_fmt: str, map_center=NYC_MAP_CENTER):
-    """Return a prepared Folium map."""
+class CompactMarkerCluster(folium.plugins.FastMarkerCluster):
+    """FastMarkerCluster with data packed by pack_marker_data.
+
+    Rows passed to the callback are unpacked in the browser and have the same
+    layout as FastMarkerCluster rows, with rounded coordinates.
+    """
+
+    _template = jinja2.Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                {{ this.callback }}
+
+                var packed = {{ this.data|tojson }};
+                var cluster = L.markerClusterGroup({{ this.options|tojson }});
+                {%- if this.icon_create_function is not none %}
+                cluster.options.iconCreateFunction =
+                    {{ this.icon_create_function.strip() }};
+                {%- endif %}
+
+                var markers = new Array(packed.lat.length);
+                var lat = 0;
+                var long = 0;
+                for (var i = 0; i < packed.lat.length; i++) {
+                    lat += packed.lat[i];
+                    long += packed.long[i];
+                    var row = [lat / packed.scale, long / packed.scale];
+                    for (var j = 0; j < packed.fields.length; j++) {
+                        var field = packed.fields[j];
+                        row.push(
+                            field.codes ? field.values[field.codes[i]] : field.data[i]
+                        );
+                    }
+                    markers[i] = callback(row);
+                }
+                cluster.addLayers(markers);
+
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, data, callback=None, decimals=MARKER_COORD_DECIMALS, **kwargs):
+        """Pack data for the layer, see FastMarkerCluster for other arguments."""
+        super().__init__(data=[], callback=callback, **kwargs)
+        self._name = "CompactMarkerCluster"
+        self.data = pack_marker_data(data, decimals)
+
+
+class TiledMarkerCluster(folium.plugins.MarkerCluster):
+    """Marker cluster layer that loads tiles of a pyramid from src.tiles.
+
+    Only tiles visible at the current zoom are loaded. Their clusters are drawn
+    as cluster icons that zoom in when clicked, and their points with the
+    callback, like FastMarkerCluster rows.
+    """
+
+    _template = jinja2.Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                {{ this.callback }}
+
+                var map = {{ this._parent.get_name() }};
+                var tilesUrl = {{ this.tiles_url|tojson }};
+                var points = L.markerClusterGroup({{ this.options|tojson }});
+                var clusters = L.layerGroup();
+                var pyramid = null;
+                // tile key -> cluster and point markers, null while loading
+                var tiles = {};
+
+                function clusterMarker(row) {
+                    var count = row[2];
+                    var size = count < 10 ? "small" : count < 100 ? "medium" : "large";
+                    var marker = L.marker(new L.LatLng(row[0], row[1]), {
+                        icon: L.divIcon({
+                            html: "<div><span>" + count + "</span></div>",
+                            className: "marker-cluster marker-cluster-" + size,
+                            iconSize: new L.Point(40, 40),
+                        }),
+                    });
+                    marker.on("click", function () {
+                        map.setView(marker.getLatLng(), map.getZoom() + 2);
+                    });
+                    return marker;
+                }
+
+                function tileXY(lat, long, zoom) {
+                    var n = Math.pow(2, zoom);
+                    var latRad = lat * Math.PI / 180;
+                    var y = (1 - Math.asinh(Math.tan(latRad)) / Math.PI) / 2;
+                    return [Math.floor((long + 180) / 360 * n), Math.floor(y * n)];
+                }
+
+                function visibleTiles() {
+                    var zoom = Math.min(
+                        Math.max(Math.round(map.getZoom()), pyramid.min_zoom),
+                        pyramid.leaf_zoom
+                    );
+                    var limits = pyramid.bounds[zoom];
+                    if (limits === undefined) {
+                        return [];
+                    }
+                    var bounds = map.getBounds();
+                    var min = tileXY(bounds.getNorth(), bounds.getWest(), zoom);
+                    var max = tileXY(bounds.getSouth(), bounds.getEast(), zoom);
+                    var xMin = Math.max(min[0], limits[0]);
+                    var xMax = Math.min(max[0], limits[2]);
+                    var yMin = Math.max(min[1], limits[1]);
+                    var yMax = Math.min(max[1], limits[3]);
+                    var keys = [];
+                    for (var x = xMin; x <= xMax; x++) {
+                        for (var y = yMin; y <= yMax; y++) {
+                            keys.push(zoom + "/" + x + "/" + y);
+                        }
+                    }
+                    return keys;
+                }
+
+                function render() {
+                    var markers = [];
+                    clusters.clearLayers();
+                    visibleTiles().forEach(function (key) {
+                        var tile = tiles[key];
+                        if (tile) {
+                            tile.clusters.forEach(function (marker) {
+                                clusters.addLayer(marker);
+                            });
+                            markers.push.apply(markers, tile.points);
+                        }
+                    });
+                    points.clearLayers();
+                    points.addLayers(markers);
+                }
+
+                function update() {
+                    if (pyramid === null) {
+                        return;
+                    }
+                    visibleTiles().forEach(function (key) {
+                        if (key in tiles) {
+                            return;
+                        }
+                        tiles[key] = null;
+                        fetch(tilesUrl + "/" + key + ".json")
+                            .then(function (response) {
+                                if (!response.ok) {
+                                    return {clusters: [], points: []};
+                                }
+                                return response.json();
+                            })
+                            .then(function (tile) {
+                                tiles[key] = {
+                                    clusters: tile.clusters.map(clusterMarker),
+                                    points: tile.points.map(callback),
+                                };
+                                render();
+                            })
+                            .catch(function () {
+                                delete tiles[key];
+                            });
+                    });
+                    render();
+                }
+
+                map.on("moveend", update);
+                fetch(tilesUrl + "/" + {{ this.pyramid_filename|tojson }})
+                    .then(function (response) {
+                        return response.json();
+                    })
+                    .then(function (metadata) {
+                        pyramid = metadata;
+                        update();
+                    });
+
+                return L.layerGroup([clusters, points]).addTo(map);
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, tiles_url: str, callback: str, **kwargs):
+        """Load the pyramid at tiles_url and draw points with callback."""
+        super().__init__(**kwargs)
+        self._name = "TiledMarkerCluster"
+        self.tiles_url = tiles_url.rstrip("/")
+        self.pyramid_filename = src.tiles.PYRAMID_FILENAME
+        self.callback = f"var callback = {callback};"
+
+
+def make_marker_map(
+    map_data: pd.DataFrame,
+    text_fmt: str,
+    map_center=NYC_MAP_CENTER,
+    compact=False,
+    tiles_url: str = None,
+    color_field: int = None,
+):
+    """Return a prepared Folium map.
+
+    If compact, marker data is packed with pack_marker_data, which makes the
+    saved map several times smaller. If tiles_url is given, map_data is not
+    used and the map loads visible tiles of the pyramid written to tiles_url
+    (relative to the saved map) by src.tiles.write_tile_pyramid instead. If
+    color_field is given, markers are colored from MARKER_COLORS by the integer
+    in that column of map_data, e.g. a cluster number, instead of red.
+    """
     fmap = folium.Map(location=map_center, zoom_start=10, tiles="OpenStreetMap")
+    if color_field is None:
+        marker_color = "'red'"
+    else:
+        marker_color = (
+            f"{json.dumps(MARKER_COLORS)}"
+            f"[row[{color_field}] % {len(MARKER_COLORS)}]"
+        )
     js_callback = (
         "function (row) {"
         "var marker = L.marker(new L.LatLng(row[0], row[1]));"
         "var icon = L.AwesomeMarkers.icon({"
         "icon: 'fa-exclamation',"
         "iconColor: 'white',"
-        "markerColor: 'red',"
+        f"markerColor: {marker_color},"
         "prefix: 'fa',"
         "});"
         "marker.setIcon(icon);"
         "var popup = L.popup({maxWidth: '300'});"
-        "const display_text = {text:"
-        + text_fmt
-        + "var poptext = $(`<div id='mytext' style='width: 100.0%; height: 100.0%;'> ${display_text.text}</div>`)[0];"
+        "const display_text = {text:" + text_fmt + "var poptext = $(`<div id='mytext' "
+        "style='width: 100.0%; height: 100.0%;'> ${display_text.text}</div>`)[0];"
         "popup.setContent(poptext);"
         "marker.bindPopup(popup);"
         "return marker};"
     )
-    folium.plugins.FastMarkerCluster(data=map_data, callback=js_callback).add_to(fmap)
+    if tiles_url is not None:
+        TiledMarkerCluster(tiles_url, callback=js_callback).add_to(fmap)
+    else:
+        cluster = CompactMarkerCluster if compact else folium.plugins.FastMarkerCluster
+        cluster(data=map_data, callback=js_callback).add_to(fmap)
     return fmap
 
 
@@ -440,6 +779,82 @@ def prep_choropleth_df(
     return gpd.GeoDataFrame(groupby_df, geometry=geoseries)
 
 
+def simplified_geometry(
+    geojson_path: str,
+    geojson_property: str,
+    name: str,
+    tolerance: float = CHOROPLETH_SIMPLIFY_TOLERANCE,
+    cache_dir: str = None,
+):
+    """Return gpd.GeoSeries of simplified geojson geometry by integer id.
+
+    If cache_dir is provided, simplified geometry is read from and saved to
+    the cache, keyed on the geojson contents, property, and tolerance.
+    """
+
+    def simplify():
+        geom_ids, geoms = src.utils.read_geojson(geojson_path, geojson_property)
+        return gpd.GeoSeries(
+            shapely.simplify(geoms, tolerance, preserve_topology=True),
+            index=pd.Index([int(x) for x in geom_ids], name=name),
+            crs=COORD_REF_SYSTEM,
+        )
+
+    key = src.cache.make_key(
+        "simplified geometry",
+        src.cache.file_digest(geojson_path),
+        geojson_property,
+        name,
+        tolerance,
+    )
+    return src.cache.cached(key, simplify, cache_dir)
+
+
+def choropleth_gdf(
+    totals: pd.DataFrame,
+    geoseries: gpd.GeoSeries,
+    flag: str = "all",
+    value: str = "count",
+    years=None,
+    divisor=1,
+    round_decimal=None,
+    value_col: str = None,
+):
+    """Return a gpd.GeoDataFrame prepared for a Folium Choropleth from totals.
+
+    Like prep_choropleth_df, but any flag and measure of collisions in years
+    is selected from src.cube.region_totals, which are computed once for all
+    choropleths of a region. Regions of geoseries without collisions are 0.
+
+    Args:
+        totals (pd.DataFrame): Region totals from src.cube.region_totals.
+        geoseries (gpd.GeoSeries): Region geometry by integer id.
+        flag (str): Flag of collisions, see src.cube.CUBE_FLAGS.
+        value (str): Measure, see src.cube.CUBE_MEASURES.
+        years (list): Years summed, default all.
+        divisor (float): Divisor of the sums, e.g. number of years.
+        round_decimal (int): Decimal places values are rounded to, default none.
+        value_col (str): Name of the value column, default value.
+
+    Returns:
+        gpd.GeoDataFrame: Column for region ids, value_col, and geometry.
+
+    """
+    values = totals[(flag, value)]
+    if years is not None:
+        values = values[values.index.get_level_values("year").isin(years)]
+    values = values.groupby(level=0, observed=True).sum()
+    values.index = values.index.to_numpy().astype(int)
+    values = values.reindex(geoseries.index, fill_value=0) / divisor
+    if round_decimal is not None:
+        values = values.round(decimals=round_decimal)
+        if round_decimal == 0:
+            values = values.astype(int)
+    gdf = values.to_frame(value_col or value)
+    gdf[geoseries.index.name] = gdf.index
+    return gpd.GeoDataFrame(gdf, geometry=geoseries)
+
+
 def add_choropleth(
     choro_map,
     gdf,
@@ -0,0 +1,136 @@
+"""Shared fixtures of collision and traffic data for tests."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import src.utils
+
+
+@pytest.fixture
+def gap_traffic():
+    """Return hourly traffic-like DataFrame with gaps in two plazas."""
+    return pd.DataFrame(
+        {
+            "PLAZA": pd.Categorical(["1", "1", "1", "2", "2"], categories=["1", "2"]),
+            "DIRECTION": ["I", "I", "I", "O", "O"],
+            "VEHICLES": [10, 20, 30, 40, 50],
+        },
+        index=pd.DatetimeIndex(
+            [
+                "2020-01-01 00:00",
+                "2020-01-01 01:00",
+                "2020-01-01 04:00",
+                "2020-01-01 01:00",
+                "2020-01-01 02:00",
+            ],
+            name="datetime",
+        ),
+    )
+
+
+@pytest.fixture
+def hourly_traffic():
+    """Return hourly traffic-like DataFrame sorted by time, with missing rows."""
+    rng = np.random.default_rng(0)
+    locations = ["Bridge A", "Tunnel B", "Bridge C", "Tunnel D"]
+    times = np.repeat(pd.date_range("2020-01-01", periods=200, freq="h"), 6)
+    traffic = pd.DataFrame(
+        {
+            "LOCATION": pd.Categorical(
+                rng.choice(locations, len(times)), categories=locations
+            ),
+            "VEHICLES": rng.integers(0, 1000, len(times)),
+        },
+        index=pd.DatetimeIndex(times, name="datetime"),
+    )
+    return traffic[rng.random(len(traffic)) < 0.8]
+
+
+@pytest.fixture
+def clustered_crashes():
+    """Return random collisions with a few dense areas and repeated locations."""
+    rng = np.random.default_rng(0)
+    centers = np.array([[40.70, -73.95], [40.80, -73.90], [40.65, -74.00]])
+    clustered = centers[rng.integers(0, 3, 600)] + rng.normal(0, 3e-4, (600, 2))
+    scattered = [40.5, -74.2] + rng.random((400, 2)) * [0.4, 0.5]
+    locations = np.concatenate([clustered, scattered]).round(5)
+    # repeated locations, like intersections
+    locations = np.concatenate([locations, locations[:200]])
+    return pd.DataFrame(
+        {
+            "LAT": locations[:, 0],
+            "LONG": locations[:, 1],
+            "DATE": "01/02/2023",
+            "TIME": "12:00",
+            "INJURED": rng.integers(0, 3, len(locations)),
+            "KILLED": (rng.random(len(locations)) < 0.05).astype(int),
+        }
+    )
+
+
+@pytest.fixture
+def processed_crashes():
+    """Return random processed-collision-like DataFrame."""
+    n = 500
+    rng = np.random.default_rng(0)
+    index = pd.DatetimeIndex(
+        pd.Timestamp("2019-01-01")
+        + pd.to_timedelta(rng.integers(0, 3 * 365 * 24, n), unit="h"),
+        name="datetime",
+    )
+    injured = rng.integers(0, 3, n).astype("int16")
+    killed = (rng.random(n) < 0.1).astype("int16")
+    pedestrian = rng.random(n) < 0.3
+    cyclist = rng.random(n) < 0.2
+    precinct = rng.choice(["1", "5", "10", None], n)
+    return pd.DataFrame(
+        {
+            "INJURED": injured,
+            "KILLED": killed,
+            "season": src.utils.dates_to_seasons(index),
+            "serious": (injured > 0) | (killed > 0),
+            "non-motorist": pedestrian | cyclist,
+            "cyclist": cyclist,
+            "pedestrian": pedestrian,
+            "precinct": pd.Categorical(precinct, categories=["1", "10", "5"]),
+            "district": pd.Categorical(rng.choice(["3", "33"], n)),
+        },
+        index=index,
+    )
+
+
+@pytest.fixture
+def stored_crashes():
+    """Return small processed-collision-like GeoDataFrame spanning several years."""
+    index = pd.DatetimeIndex(
+        ["2013-01-05", "2013-07-01", "2014-03-03", "2015-12-31", "2016-06-15"],
+        name="datetime",
+    )
+    df = pd.DataFrame(
+        {
+            "ID": np.arange(5, dtype="int32"),
+            "LAT": [40.7, 40.8, np.nan, 40.6, 40.75],
+            "LONG": [-73.9, -73.95, np.nan, -74.0, -73.85],
+            "KILLED": np.array([0, 1, 0, 2, 0], dtype="int16"),
+            "serious": [False, True, False, True, True],
+            "precinct": pd.Categorical(["1", "10", None, "2", "10"]),
+        },
+        index=index,
+    )
+    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["LONG"], df["LAT"]))
+
+
+@pytest.fixture
+def stored_traffic():
+    """Return small unsorted traffic-like DataFrame with a repeated datetime."""
+    return pd.DataFrame(
+        {
+            "PLAZA": pd.Categorical(["1", "30", "1", "1"], categories=["1", "30"]),
+            "VEHICLES": np.array([10, 20, 30, 40], dtype="int32"),
+        },
+        index=pd.DatetimeIndex(
+            ["2021-01-01 05:00", "2020-06-01 00:00", "2020-06-01 00:00", "2019-03-01"],
+            name="datetime",
+        ),
+    )
@@ -0,0 +1,95 @@
+"""Tests for site build functions."""
+
+import os.path
+import build_site
+import src.cube
+
+
+def write_text(path, text):
+    """Build target by writing text."""
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(text)
+
+
+def append_text(path, text):
+    """Append text to file at path."""
+    with open(path, "a", encoding="utf-8") as fp:
+        fp.write(text)
+
+
+def test_build_site_only_stale_targets(tmp_path):
+    """Only missing targets or targets whose inputs changed should be built."""
+    dep_a = tmp_path / "a.txt"
+    dep_b = tmp_path / "b.txt"
+    dep_a.write_text("a")
+    dep_b.write_text("b")
+    targets = {
+        str(tmp_path / "site" / "a.out"): {
+            "build": write_text,
+            "deps": [str(dep_a)],
+            "params": {"text": "A"},
+        },
+        str(tmp_path / "site" / "b.out"): {
+            "build": write_text,
+            "deps": [str(dep_b)],
+            "params": {"text": "B"},
+        },
+    }
+    manifest = str(tmp_path / "manifest.json")
+    path_a, path_b = targets
+
+    assert sorted(build_site.build_site(targets, 2, manifest_path=manifest)) == [
+        path_a,
+        path_b,
+    ]
+    assert (tmp_path / "site" / "b.out").read_text() == "B"
+    assert not build_site.build_site(targets, 2, manifest_path=manifest)
+
+    dep_a.write_text("changed")
+    assert build_site.build_site(targets, 2, manifest_path=manifest) == [path_a]
+    targets[path_b]["params"]["text"] = "new"
+    assert build_site.build_site(targets, 2, manifest_path=manifest) == [path_b]
+    assert (tmp_path / "site" / "b.out").read_text() == "new"
+    (tmp_path / "site" / "a.out").unlink()
+    assert build_site.build_site(targets, 2, manifest_path=manifest) == [path_a]
+    assert len(build_site.build_site(targets, 2, True, manifest)) == 2
+
+
+def test_build_site_prepare_once(tmp_path):
+    """Prepare steps shared by stale targets should be called once, before builds."""
+    shared = str(tmp_path / "shared.txt")
+    targets = {
+        str(tmp_path / f"{name}.out"): {
+            "build": write_text,
+            "deps": [],
+            "prepare": [(append_text, shared, "x")],
+            "params": {"text": name},
+        }
+        for name in ["a", "b", "c"]
+    }
+    manifest = str(tmp_path / "manifest.json")
+
+    assert len(build_site.build_site(targets, 2, manifest_path=manifest)) == 3
+    assert (tmp_path / "shared.txt").read_text() == "x"
+    assert not build_site.build_site(targets, 2, manifest_path=manifest)
+    assert (tmp_path / "shared.txt").read_text() == "x"
+
+
+def test_build_average_bar_chart_labels(monkeypatch, processed_crashes):
+    """Charts should use their own legend labels and bar label style."""
+    cube = src.cube.build_cube(processed_crashes)
+    monkeypatch.setattr(src.cube, "read_cube", lambda path: cube)
+    specs = []
+    monkeypatch.setattr(build_site.viz, "render_charts", specs.extend)
+    targets = build_site.site_targets()
+    for name in ["yearly_collisions.png", "weekly.png"]:
+        path = os.path.join(build_site.SITE_CONTENT_DIR, "trends", "images", name)
+        build_site.build_average_bar_chart(path, **targets[path]["params"])
+    yearly, weekly = specs
+    assert yearly["legend_labels"] == [
+        "Collisions with Injuries\nor Deaths",
+        "Collisions with\nPedestrians and Cyclists",
+    ]
+    assert yearly["bar_label_bbox"]["facecolor"] == "white"
+    assert weekly["legend_labels"] == list(build_site.FLAG_LABELS.values())
+    assert "bar_label_bbox" not in weekly
@@ -0,0 +1,69 @@
+"""Tests for cache functions."""
+
+import os
+import src.cache
+
+
+def test_cached_computes_once(tmp_path):
+    """Value should only be computed on the first call for a key."""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"a": [1, 2, 3]}
+
+    key = src.cache.make_key("stage", "param", 1)
+    for _ in range(3):
+        assert src.cache.cached(key, compute, str(tmp_path)) == {"a": [1, 2, 3]}
+    assert len(calls) == 1
+
+
+def test_cached_without_cache_dir(tmp_path):
+    """Value should be computed every call and nothing written without cache_dir."""
+    calls = []
+    for _ in range(2):
+        src.cache.cached("key", lambda: calls.append(1) or "value", None)
+    assert len(calls) == 2
+    assert not os.listdir(tmp_path)
+
+
+def test_make_key_depends_on_params():
+    """Different stages or parameters should have different keys."""
+    keys = {
+        src.cache.make_key("stage", 1),
+        src.cache.make_key("stage", 2),
+        src.cache.make_key("other", 1),
+        src.cache.make_key("stage", 1, None),
+    }
+    assert len(keys) == 4
+    assert src.cache.make_key("stage", 1) == src.cache.make_key("stage", 1)
+
+
+def test_file_digest_depends_on_contents(tmp_path):
+    """File digest should change when file contents change."""
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n", encoding="utf-8")
+    first = src.cache.file_digest(str(path))
+    path.write_text("a,b\n1,3\n", encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    assert src.cache.file_digest(str(path)) != first
+
+
+def test_evict_least_recently_used(tmp_path):
+    """Oldest entries should be evicted first until cache fits in max bytes."""
+    cache_dir = str(tmp_path)
+    for i, key in enumerate(["old", "mid", "new"]):
+        src.cache.store(key, b"x" * 1000, cache_dir)
+        os.utime(os.path.join(cache_dir, key + src.cache.CACHE_EXT), (i, i))
+    src.cache.evict(cache_dir, max_bytes=2500)
+    assert src.cache.load("old", cache_dir) is None
+    assert src.cache.load("mid", cache_dir) == b"x" * 1000
+    assert src.cache.load("new", cache_dir) == b"x" * 1000
+
+
+def test_clear(tmp_path):
+    """All entries should be removed."""
+    cache_dir = str(tmp_path)
+    src.cache.store("key", 1, cache_dir)
+    src.cache.clear(cache_dir)
+    assert src.cache.load("key", cache_dir) is None
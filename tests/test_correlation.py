@@ -0,0 +1,51 @@
+"""Tests for streaming correlation functions."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import src.correlation
+
+
+def test_merge_moments():
+    """Merged moments should equal moments of the stacked tables."""
+    rng = np.random.default_rng(0)
+    first, second = rng.random((10, 3)), rng.random((25, 3)) * 5
+    n, means, cross = src.correlation.merge_moments(
+        src.correlation.pivot_moments(first), src.correlation.pivot_moments(second)
+    )
+    expected = src.correlation.pivot_moments(np.vstack([first, second]))
+    assert n == expected[0]
+    assert means == pytest.approx(expected[1])
+    assert cross.ravel() == pytest.approx(expected[2].ravel())
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 100, 10_000])
+def test_streaming_corr_matches_pivot_table(chunksize, hourly_traffic):
+    """Streaming correlation should match the correlation of the pivot table."""
+    table = pd.pivot_table(
+        hourly_traffic,
+        values="VEHICLES",
+        index=hourly_traffic.index,
+        columns="LOCATION",
+        aggfunc="sum",
+        fill_value=0,
+        observed=True,
+    )
+    expected = table.corr()
+    chunks = (
+        hourly_traffic.iloc[i : i + chunksize]
+        for i in range(0, len(hourly_traffic), chunksize)
+    )
+    result = src.correlation.streaming_corr(chunks)
+    assert result.index.tolist() == sorted(expected.index)
+    assert result.columns.tolist() == sorted(expected.columns)
+    expected = expected.loc[result.index, result.columns]
+    assert result.to_numpy().ravel() == pytest.approx(expected.to_numpy().ravel())
+
+
+def test_streaming_corr_unsorted(hourly_traffic):
+    """Chunks out of time order should raise ValueError."""
+    with pytest.raises(ValueError):
+        src.correlation.streaming_corr(
+            [hourly_traffic.iloc[100:], hourly_traffic.iloc[:100]]
+        )
@@ -0,0 +1,95 @@
+"""Tests for aggregation cube functions."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import src.cube
+import src.utils
+
+
+def test_crosstab_matches_pd_crosstab(tmp_path, processed_crashes):
+    """Cube crosstabs should match crosstabs of the processed collisions."""
+    path = str(tmp_path / "cube.parquet")
+    src.cube.write_cube(src.cube.build_cube(processed_crashes), path)
+    cube = src.cube.read_cube(path)
+
+    result = src.cube.crosstab(cube, "dayofweek", "hour")
+    expected = pd.crosstab(
+        processed_crashes.index.dayofweek, processed_crashes.index.hour
+    )
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+
+    fatal = processed_crashes[processed_crashes["KILLED"] > 0]
+    result = src.cube.crosstab(cube, "season", "precinct", flag="fatal")
+    expected = pd.crosstab(fatal["season"], fatal["precinct"])
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+
+    selected = processed_crashes[
+        processed_crashes["pedestrian"] & (processed_crashes.index.year == 2020)
+    ]
+    selected = selected[selected["precinct"].isin(["1", "5"])]
+    result = src.cube.crosstab(
+        cube,
+        ["month"],
+        "season",
+        flag="pedestrian",
+        value="injured",
+        year=2020,
+        precinct=["1", "5"],
+    )
+    expected = pd.crosstab(
+        selected.index.month,
+        selected["season"],
+        values=selected["INJURED"].to_numpy(),
+        aggfunc="sum",
+    ).fillna(0)
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+
+
+def test_build_cube_totals(processed_crashes):
+    """Cube totals should match the processed collisions for every flag."""
+    cube = src.cube.build_cube(processed_crashes)
+    for part in src.cube.CUBE_PARTS:
+        totals = (
+            cube[cube["part"] == part]
+            .groupby("flag", observed=True)[["count", "killed"]]
+            .sum()
+        )
+        assert totals.loc["all", "count"] == len(processed_crashes)
+        assert totals.loc["all", "killed"] == processed_crashes["KILLED"].sum()
+        assert totals.loc["serious", "count"] == processed_crashes["serious"].sum()
+        assert totals.loc["fatal", "count"] == (processed_crashes["KILLED"] > 0).sum()
+    # dimensions that are not in a part are missing
+    for part, dims in src.cube.CUBE_PARTS.items():
+        other_dims = [dim for dim in src.cube.CUBE_DIMS if dim not in dims]
+        assert cube.loc[cube["part"] == part, other_dims].isna().all().all()
+
+
+def test_crosstab_unknown_names(processed_crashes):
+    """Unknown flags, values, or dimensions should raise ValueError."""
+    cube = src.cube.build_cube(processed_crashes)
+    with pytest.raises(ValueError):
+        src.cube.crosstab(cube, "dayofweek", "hour", flag="motorist")
+    with pytest.raises(ValueError):
+        src.cube.crosstab(cube, "dayofweek", "hour", value="total")
+    with pytest.raises(ValueError):
+        src.cube.crosstab(cube, "dayofweek", "minute")
+    with pytest.raises(ValueError):
+        src.cube.crosstab(cube, "precinct", "district")
+    with pytest.raises(ValueError):
+        src.cube.crosstab(cube, "hour", "precinct")
+
+
+def test_region_totals(processed_crashes):
+    """Region totals should sum every flag and measure by region and year."""
+    totals = src.cube.region_totals(processed_crashes, "precinct")
+    assert totals.index.names == ["precinct", "year"]
+    assert totals[("all", "count")].sum() == processed_crashes["precinct"].notna().sum()
+
+    cyclist = processed_crashes[
+        processed_crashes["cyclist"] & (processed_crashes.index.year == 2020)
+    ]
+    expected = cyclist.groupby("precinct", observed=True)["INJURED"].sum()
+    result = totals.xs(2020, level="year")[("cyclist", "injured")]
+    assert result.to_dict() == expected.to_dict()
@@ -0,0 +1,80 @@
+"""Tests for exposure-normalized collision rate functions."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import src.exposure
+
+PLAZAS = pd.DataFrame(
+    {
+        "LOCATION": ["Bridge A", "Bridge A", "Tunnel B"],
+        "LAT": [40.70, 40.70, 40.80],
+        "LONG": [-73.90, -73.90, -73.95],
+    },
+    index=pd.Index([1, 2, 3], name="Plaza ID"),
+)
+
+
+def test_align_hourly():
+    """Collisions near plazas should be counted in hours with traffic counts."""
+    traffic = pd.DataFrame(
+        {
+            "LOCATION": pd.Categorical(
+                ["Bridge A", "Bridge A", "Tunnel B", "Bridge A"]
+            ),
+            "VEHICLES": [100, 50, 200, 300],
+        },
+        index=pd.DatetimeIndex(
+            [
+                "2020-01-06 08:00",
+                "2020-01-06 08:00",
+                "2020-01-06 08:00",
+                "2020-01-06 09:00",
+            ],
+            name="datetime",
+        ),
+    )
+    crashes = pd.DataFrame(
+        {
+            # near A, near A, near A without traffic counts, far, near B, missing
+            "LAT": [40.701, 40.699, 40.70, 40.60, 40.80, np.nan],
+            "LONG": [-73.90, -73.901, -73.90, -73.90, -73.951, np.nan],
+        },
+        index=pd.DatetimeIndex(
+            [
+                "2020-01-06 08:15",
+                "2020-01-06 09:59",
+                "2020-01-06 10:30",
+                "2020-01-06 08:30",
+                "2020-01-06 08:00",
+                "2020-01-06 08:00",
+            ],
+            name="datetime",
+        ),
+    )
+    aligned = src.exposure.align_hourly(crashes, traffic, PLAZAS, radius=500)
+    assert aligned.index.tolist() == [
+        ("Bridge A", pd.Timestamp("2020-01-06 08:00")),
+        ("Bridge A", pd.Timestamp("2020-01-06 09:00")),
+        ("Tunnel B", pd.Timestamp("2020-01-06 08:00")),
+    ]
+    assert aligned["VEHICLES"].tolist() == [150, 300, 200]
+    assert aligned["COLLISIONS"].tolist() == [1, 1, 1]
+
+    rates = src.exposure.rate_table(aligned, scale=100)
+    assert rates.loc[0, 8] == pytest.approx(2 / 350 * 100)
+    assert rates.loc[0, 9] == pytest.approx(1 / 300 * 100)
+    rates = src.exposure.rate_table(aligned, location="Tunnel B", scale=100)
+    assert rates.loc[0, 8] == pytest.approx(0.5)
+
+
+def test_rate_table_unknown_field():
+    """Unknown time fields should raise ValueError."""
+    aligned = pd.DataFrame(
+        {"VEHICLES": [1], "COLLISIONS": [0]},
+        index=pd.MultiIndex.from_tuples(
+            [("Bridge A", pd.Timestamp("2020-01-01"))], names=["LOCATION", "datetime"]
+        ),
+    )
+    with pytest.raises(ValueError):
+        src.exposure.rate_table(aligned, index="minute")
@@ -0,0 +1,92 @@
+"""Tests for time series gap functions."""
+
+import numpy as np
+import pandas as pd
+import src.gaps
+
+
+def test_find_gaps(gap_traffic):
+    """Gaps of every group should match looping over groups."""
+    gaps = src.gaps.find_gaps(
+        gap_traffic.index, "1h", gap_traffic[["PLAZA", "DIRECTION"]]
+    )
+    assert gaps["PLAZA"].tolist() == ["1"]
+    assert gaps["DIRECTION"].tolist() == ["I"]
+    assert gaps["start"].tolist() == [pd.Timestamp("2020-01-01 02:00")]
+    assert gaps["end"].tolist() == [pd.Timestamp("2020-01-01 04:00")]
+    assert gaps["missing"].tolist() == [2]
+
+    gaps = src.gaps.find_gaps(
+        gap_traffic.index,
+        "1h",
+        gap_traffic["PLAZA"],
+        start="2020-01-01 00:00",
+        end="2020-01-01 04:00",
+    )
+    assert gaps["PLAZA"].tolist() == ["1", "2", "2"]
+    assert gaps["start"].dt.hour.tolist() == [2, 0, 3]
+    assert gaps["end"].dt.hour.tolist() == [4, 1, 5]
+    assert gaps["missing"].tolist() == [2, 1, 2]
+
+    # irregular times, as for collisions, have gaps of days without any
+    rng = np.random.default_rng(0)
+    times = pd.DatetimeIndex(
+        pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 60, 500), "D")
+    ) + pd.to_timedelta(rng.integers(0, 24 * 60, 500), "min")
+    times = times[(times < "2020-01-10") | (times >= "2020-01-13")]
+    gaps = src.gaps.find_gaps(times, "1D")
+    counts = pd.Series(1, index=times).resample("D").count()
+    assert gaps["missing"].sum() == (counts == 0).sum()
+    assert pd.Timestamp("2020-01-10") in gaps["start"].tolist()
+
+
+def test_coverage(gap_traffic):
+    """Coverage should count observed and missing periods of each group."""
+    table = src.gaps.coverage(
+        gap_traffic.index, "1h", gap_traffic["PLAZA"], end="2020-01-01 04:00"
+    )
+    assert table.index.tolist() == ["1", "2"]
+    assert table["observed"].tolist() == [3, 2]
+    assert table["missing"].tolist() == [2, 2]
+    assert table["coverage"].tolist() == [0.6, 0.5]
+    assert table["first"].dt.hour.tolist() == [0, 1]
+
+
+def test_fill_gaps(gap_traffic):
+    """Missing periods should be added as flagged rows with group values."""
+    filled = src.gaps.fill_gaps(gap_traffic, "1h", ["PLAZA", "DIRECTION"], fill_value=0)
+    assert len(filled) == len(gap_traffic) + 2
+    added = filled[filled["GAP"]]
+    assert added.index.hour.tolist() == [2, 3]
+    assert added["PLAZA"].tolist() == ["1", "1"]
+    assert added["DIRECTION"].tolist() == ["I", "I"]
+    assert added["VEHICLES"].tolist() == [0, 0]
+    assert filled["PLAZA"].dtype == gap_traffic["PLAZA"].dtype
+    assert filled.index.is_monotonic_increasing
+    assert filled.loc[~filled["GAP"], "VEHICLES"].sum() == gap_traffic["VEHICLES"].sum()
+
+    filled = src.gaps.fill_gaps(gap_traffic, "1h", flag=None)
+    assert "GAP" not in filled
+    assert filled.index.hour.tolist() == [0, 1, 1, 2, 3, 4]
+    assert filled["VEHICLES"].isna().sum() == 1
+
+
+def test_coverage_missing_times():
+    """Groups with only missing times should not get rows from other groups."""
+    times = pd.DatetimeIndex(
+        ["2020-01-01 00:00", "2020-01-01 02:00", pd.NaT, "2020-01-01 05:00"]
+    )
+    table = src.gaps.coverage(times, "1h", pd.Series(["a", "a", "b", "c"]))
+    assert table.index.tolist() == ["a", "c"]
+    assert table["first"].dt.hour.tolist() == [0, 5]
+    assert table["last"].dt.hour.tolist() == [2, 5]
+    assert table["observed"].tolist() == [2, 1]
+    assert table["missing"].tolist() == [1, 0]
+
+
+def test_coverage_no_times():
+    """Empty times should give an empty table."""
+    times = pd.DatetimeIndex([])
+    assert src.gaps.coverage(times, "1h").empty
+    assert src.gaps.coverage(times, "1h", pd.Series([], dtype=str)).empty
+    assert src.gaps.find_gaps(times, "1h").empty
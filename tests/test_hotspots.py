@@ -0,0 +1,53 @@
+"""Tests for hotspot functions."""
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import DBSCAN
+import src.hotspots
+
+
+def test_find_hotspots_matches_dbscan(clustered_crashes):
+    """Hotspots should have the same noise and core clusters as sklearn DBSCAN."""
+    labels = src.hotspots.find_hotspots(clustered_crashes, eps=50, min_samples=10)
+    xy = src.hotspots.project_meters(
+        clustered_crashes["LAT"], clustered_crashes["LONG"]
+    )
+    expected = DBSCAN(eps=50, min_samples=10).fit(xy).labels_
+    np.testing.assert_array_equal(labels == src.hotspots.NOISE, expected == -1)
+    clustered = labels.to_numpy() != src.hotspots.NOISE
+    assert len(set(labels[clustered])) == len(set(expected[clustered])) == 3
+
+
+def test_rank_clusters_and_map_data(clustered_crashes):
+    """Ranked clusters should sum their collisions and map data should use ranks."""
+    labels = src.hotspots.find_hotspots(clustered_crashes, eps=50, min_samples=10)
+    clusters = src.hotspots.rank_clusters(clustered_crashes, labels, top=2)
+    assert list(clusters["RANK"]) == [1, 2]
+    assert clusters["INJURED"].is_monotonic_decreasing
+    for label, cluster in clusters.iterrows():
+        assert (
+            cluster["INJURED"]
+            == clustered_crashes.loc[labels == label, "INJURED"].sum()
+        )
+
+    map_data = src.hotspots.cluster_map_data(clustered_crashes, labels, clusters)
+    assert list(map_data.columns) == src.hotspots.CLUSTER_MAP_FIELDS
+    assert set(map_data["CLUSTER"]) == {1, 2}
+    assert len(map_data) == clusters["COLLISIONS"].sum()
+
+
+def test_rank_points():
+    """Top points should sum collisions at the same location."""
+    crashes = pd.DataFrame(
+        {
+            "LAT": [40.7, 40.7, 40.8, 40.9],
+            "LONG": [-73.9, -73.9, -73.8, -73.7],
+            "INJURED": [1, 2, 2, 0],
+            "KILLED": [0, 1, 0, 0],
+        }
+    )
+    points = src.hotspots.rank_points(crashes, top=2)
+    assert points.to_dict("records") == [
+        {"LAT": 40.7, "LONG": -73.9, "INJURED": 3, "KILLED": 1, "COLLISIONS": 2},
+        {"LAT": 40.8, "LONG": -73.8, "INJURED": 2, "KILLED": 0, "COLLISIONS": 1},
+    ]
@@ -0,0 +1,73 @@
+"""Tests for collision data processing functions."""
+
+import pandas as pd
+import shapely
+from shapely.strtree import STRtree
+import process_raw_data
+
+COLLISIONS_FIXTURE = "tests/fixtures/collisions.csv"
+
+
+def make_locations():
+    """Return read_locations-like dictionary of two precincts and two districts."""
+    precincts = [
+        shapely.box(-74.3, 40.45, -73.9, 40.95),
+        shapely.box(-73.9, 40.45, -73.7, 40.95),
+    ]
+    districts = [
+        shapely.box(-74.3, 40.45, -73.7, 40.7),
+        shapely.box(-74.3, 40.7, -73.7, 40.95),
+    ]
+    return {
+        "precinct": (STRtree(precincts), ["1", "2"], "precinct source"),
+        "district": (STRtree(districts), ["10", "20"], "district source"),
+    }
+
+
+def process_file(path, chunksize=None):
+    """Return collisions in path processed like process_data, without the cache."""
+    locations = make_locations()
+    chunks = [
+        process_raw_data.add_features(chunk, locations)
+        for chunk in process_raw_data.read_collisions(path, chunksize)
+    ]
+    return process_raw_data.combine_chunks(chunks, locations)
+
+
+def test_merge_collisions(tmp_path, monkeypatch):
+    """Changed and new collisions should be processed and deleted ones dropped."""
+    previous = process_file(COLLISIONS_FIXTURE)
+    # previously processed data may have been read back with wider dtypes
+    previous = previous.astype({"ID": "int64", "INJURED": "int64"})
+
+    raw = pd.read_csv(COLLISIONS_FIXTURE, dtype=str, keep_default_na=False)
+    changed = raw["COLLISION_ID"] == "4002"
+    raw.loc[changed, "NUMBER OF MOTORIST INJURED"] = "4"
+    raw = raw[raw["COLLISION_ID"] != "4008"]  # deleted
+    new = raw.iloc[[0]].assign(COLLISION_ID="4009", LATITUDE="40.9")
+    raw = pd.concat([raw.iloc[:3], new, raw.iloc[3:]])
+    raw_path = tmp_path / "collisions.csv"
+    raw.to_csv(raw_path, index=False)
+    monkeypatch.setattr(process_raw_data, "COLLISION_DATA_LOC", raw_path)
+
+    merged = process_raw_data.merge_collisions(
+        previous, chunksize=2, locations=make_locations()
+    )
+    expected = process_file(raw_path)
+    assert merged["ID"].tolist() == [4001, 4002, 4003, 4009, 4004, 4005, 4006, 4007]
+    assert merged.loc[merged["ID"] == 4002, "INJURED"].item() == 5
+    assert merged.loc[merged["ID"] == 4009, "district"].item() == "20"
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(merged), pd.DataFrame(expected), check_dtype=False
+    )
+
+
+def test_chunked_processing():
+    """Chunked processing should give the same frame as processing all at once."""
+    whole = process_file(COLLISIONS_FIXTURE)
+    chunked = process_file(COLLISIONS_FIXTURE, chunksize=3)
+    assert len(whole) == 8
+    pd.testing.assert_frame_equal(pd.DataFrame(chunked), pd.DataFrame(whole))
+    for column in ["season", "precinct", "district"]:
+        assert isinstance(chunked[column].dtype, pd.CategoricalDtype)
+        assert chunked[column].cat.categories.equals(whole[column].cat.categories)
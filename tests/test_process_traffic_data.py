@@ -0,0 +1,68 @@
+"""Tests for traffic data processing functions."""
+
+import pandas as pd
+import pytest
+import process_traffic_data
+import src.storage
+
+RAW_TRAFFIC = """Plaza ID,Date,Hour,Direction,# Vehicles - E-ZPass,# Vehicles - VToll
+21,05/30/2024,0,I,2021,413
+1,05/30/2024,23,O,1187,281
+30,12/31/2023,5,I,880,218
+99,01/01/2010,12,O,10,1
+"""
+
+
+def test_read_traffic(tmp_path):
+    """Chunks should be parsed into datetimes, plazas, locations, and vehicles."""
+    path = tmp_path / "traffic.csv"
+    path.write_text(RAW_TRAFFIC)
+    plazas = process_traffic_data.read_plazas(process_traffic_data.PLAZA_MAPPING_LOC)
+    with pytest.warns(UserWarning, match="1 traffic rows"):
+        chunks = list(process_traffic_data.read_traffic(path, plazas, chunksize=3))
+    traffic = pd.concat(chunks)
+    assert list(traffic.index) == list(
+        pd.to_datetime(
+            [
+                "2024-05-30 00:00",
+                "2024-05-30 23:00",
+                "2023-12-31 05:00",
+                "2010-01-01 12:00",
+            ]
+        )
+    )
+    assert list(traffic["PLAZA"].astype(object)) == ["21", "1", "30", "99"]
+    assert list(traffic["LOCATION"].astype(object).fillna("")) == [
+        "Robert F. Kennedy Bridge",
+        "Robert F. Kennedy Bridge",
+        "Verrazzano-Narrows Bridge (VNB)",
+        "",
+    ]
+    assert list(traffic["VEHICLES"]) == [2434, 1468, 1098, 11]
+    assert traffic["DIRECTION"].dtype == "category"
+    # unmapped plazas are added to the categories of their chunk
+    assert chunks[0]["PLAZA"].dtype == "category"
+    assert "99" not in chunks[0]["PLAZA"].cat.categories
+    assert chunks[1]["PLAZA"].cat.categories[-1] == "99"
+
+    with pytest.warns(UserWarning):
+        whole = next(process_traffic_data.read_traffic(path, plazas))
+    pd.testing.assert_frame_equal(
+        traffic.astype({"PLAZA": str}), whole.astype({"PLAZA": str})
+    )
+
+
+def test_process_traffic(tmp_path, monkeypatch):
+    """Chunks should be written to a dataset sorted by datetime and plaza."""
+    raw_path = tmp_path / "traffic.csv"
+    raw_path.write_text(RAW_TRAFFIC)
+    processed_path = str(tmp_path / "traffic")
+    monkeypatch.setattr(process_traffic_data, "TRAFFIC_DATA_LOC", raw_path)
+    monkeypatch.setattr(process_traffic_data, "PROCESSED_TRAFFIC_LOC", processed_path)
+    with pytest.warns(UserWarning):
+        process_traffic_data.process_traffic(chunksize=2)
+    result = src.storage.read_traffic(processed_path)
+    assert list(result["VEHICLES"]) == [11, 1098, 2434, 1468]
+    assert list(result["PLAZA"].astype(str)) == ["99", "30", "21", "1"]
+    assert result["PLAZA"].dtype == "category"
+    assert result.index.is_monotonic_increasing
@@ -1,5 +1,12 @@
 """Tests for scrape_city_council functions."""
 
+import csv
+import http.server
+import os.path
+import threading
+import time
+import pandas as pd
+import pytest
 import src.scrape_city_council as scc
 
 
@@ -105,3 +112,184 @@ def test_parse_cc_email():
     ]
     for case in test_cases:
         assert scc.parse_cc_email(case[0], district_num) == case[1]
+
+
+class _DistrictPageHandler(http.server.BaseHTTPRequestHandler):
+    """Serve minimal district pages with ETags.
+
+    District 2 fails once before succeeding. The peak number of pages served at
+    once is recorded in max_in_flight.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    failed = set()
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Respond with district page, or 503 on first request for district 2."""
+        num = int(self.path.rsplit("-", 1)[1])
+        etag = f'"page-{num}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        if num == 2 and num not in self.failed:
+            self.failed.add(num)
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.2)
+        with cls.lock:
+            cls.in_flight -= 1
+        body = (
+            f"<html><head><title>District {num} - Member {num}</title></head><body>"
+            '<div aria-label="District office contact information">'
+            f"<p>{num} Spooner St.\nQuahog RI 02940\n(212) 555-{1000 + num}</p></div>"
+            f'<a aria-label="Email" href="mailto:member{num}@council.nyc.gov">x</a>'
+            "</body></html>"
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Silence request logging."""
+
+
+@pytest.fixture(name="district_server")
+def fixture_district_server(monkeypatch):
+    """Serve district pages locally and point the scraper at them."""
+    _DistrictPageHandler.failed = set()
+    _DistrictPageHandler.max_in_flight = 0
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _DistrictPageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    monkeypatch.setattr(scc, "BASE_DISTRICTS_URL", f"http://{host}:{port}/district-")
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def test_scrape_districts_info(district_server, tmp_path):
+    """Pages should be requested concurrently, retried, and written in order."""
+    # pylint: disable=unused-argument
+    district_nums = list(range(1, 11))
+    districts_info = scc.scrape_districts_info(district_nums, workers=10)
+    assert _DistrictPageHandler.max_in_flight > 1
+    assert districts_info[2]["Council Member"] == "Member 2"
+    assert districts_info[7] == {
+        "District Number": 7,
+        "Council Member": "Member 7",
+        "District Office Address": "7 Spooner St.\nQuahog RI 02940",
+        "District Office Phone": "212-555-1007",
+        "District Email": "member7@council.nyc.gov",
+    }
+
+    path = tmp_path / scc.SAVE_NAME
+    scc.write_districts_info(districts_info, path)
+    with open(path, encoding="utf-8") as fp:
+        rows = list(csv.DictReader(fp))
+    assert [int(row["District Number"]) for row in rows] == district_nums
+
+
+def test_scrape_districts_info_cache(district_server, tmp_path, monkeypatch):
+    """Cached pages should not be parsed again and should work offline."""
+    # pylint: disable=unused-argument
+    district_nums = [1, 2, 3]
+    cache_dir = str(tmp_path)
+    districts_info = scc.scrape_districts_info(district_nums, 3, cache_dir)
+
+    def fail(*args):
+        raise AssertionError("unexpected call")
+
+    monkeypatch.setattr(scc, "parse_district_page", fail)
+    assert scc.scrape_districts_info(district_nums, 3, cache_dir) == districts_info
+    monkeypatch.setattr(scc, "request_district_page", fail)
+    offline_info = scc.scrape_districts_info(district_nums, 3, cache_dir, True)
+    assert offline_info == districts_info
+    with pytest.raises(FileNotFoundError):
+        scc.scrape_districts_info([4], cache_dir=cache_dir, offline=True)
+    # pages parsed by an older parser are not used
+    monkeypatch.setattr(scc, "PARSER_VERSION", scc.PARSER_VERSION + 1)
+    with pytest.raises(FileNotFoundError):
+        scc.scrape_districts_info([1], cache_dir=cache_dir, offline=True)
+
+
+def test_parse_district_page_targeted():
+    """Targeted parsing of saved pages should match parsing the full page."""
+    fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures", "district_pages")
+    expected = {
+        1: ("Peter Griffin", "31 Spooner Street\nQuahog, RI 02940", "212-555-1101"),
+        2: (
+            "Glenn Quagmire",
+            "29 Spooner Street\nSuite 2\nQuahog, RI 02940",
+            "212-555-1102",
+        ),
+        3: ("Cleveland Brown", None, None),
+    }
+    for district_num, (name, address, phone) in expected.items():
+        path = os.path.join(fixtures_dir, f"district-{district_num}.html")
+        with open(path, encoding="utf-8") as fp:
+            text = fp.read()
+        district_info = scc.parse_district_page(text, district_num, targeted=True)
+        assert district_info == scc.parse_district_page(text, district_num, False)
+        assert district_info["Council Member"] == name
+        assert district_info["District Office Address"] == address
+        assert district_info["District Office Phone"] == phone
+
+
+def test_parse_district_texts_batch():
+    """Batch parsing should match parsing one text at a time."""
+    titles = [
+        "district 1 - Peter Griffin",
+        "district 2-Glenn Quagmire",
+        None,
+    ]
+    contacts = [
+        "31 Spooner St.\nQuahog RI 02940\nPhone: 212-555-5555",
+        "31 Spooner St.\r\nMeg's Room\r\n(212)-55-5555",
+        None,
+    ]
+    hrefs = ["mailto:gquagmire@council.nyc.gov", "adamwest@council.nyc.gov", None]
+    district_nums = [1, 2, 3]
+    index = pd.Index(["a", "b", "c"])
+    parsed = scc.parse_district_texts(
+        district_nums, pd.Series(titles, index=index), contacts, hrefs
+    )
+    assert list(parsed.columns) == scc.FIELDNAMES
+    assert list(parsed.index) == list(index)
+    for i, num in enumerate(district_nums):
+        expected = scc.empty_district_info(num)
+        if titles[i] is not None:
+            expected["Council Member"] = scc.parse_cc_member_name(titles[i])
+        if contacts[i] is not None:
+            expected["District Office Address"] = scc.parse_address(contacts[i])
+            expected["District Office Phone"] = scc.parse_phone_number(contacts[i])
+        email_tag = None if hrefs[i] is None else {"href": hrefs[i]}
+        expected["District Email"] = scc.parse_cc_email(email_tag, num)
+        assert parsed.iloc[i].to_dict() == expected
+
+
+def test_parse_district_pages():
+    """Batch page parsing should match parsing one page at a time."""
+    fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures", "district_pages")
+    pages = {}
+    for district_num in (1, 2, 3):
+        path = os.path.join(fixtures_dir, f"district-{district_num}.html")
+        with open(path, encoding="utf-8") as fp:
+            pages[district_num] = fp.read()
+    parsed = scc.parse_district_pages(pd.Series(pages), list(pages))
+    for district_num, text in pages.items():
+        expected = scc.parse_district_page(text, district_num)
+        assert parsed.loc[district_num].to_dict() == expected
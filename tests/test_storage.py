@@ -0,0 +1,60 @@
+"""Tests for storage functions."""
+
+import pandas as pd
+import src.storage
+
+
+def test_write_read_crashes_round_trip(tmp_path, stored_crashes):
+    """All fields, dtypes, and the datetime index should survive a round trip."""
+    path = str(tmp_path / "stored_crashes")
+    src.storage.write_crashes(stored_crashes, path)
+    src.storage.write_crashes(stored_crashes, path)  # existing dataset is replaced
+    result = src.storage.read_crashes(path).sort_index()
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(result.drop(columns="geometry")),
+        pd.DataFrame(stored_crashes.drop(columns="geometry")),
+    )
+    assert list(result.geometry.to_wkt()) == list(stored_crashes.geometry.to_wkt())
+
+
+def test_read_crashes_filters_and_columns(tmp_path, stored_crashes):
+    """Filters should be applied and only requested columns returned."""
+    path = str(tmp_path / "stored_crashes")
+    src.storage.write_crashes(stored_crashes, path)
+    result = src.storage.read_crashes(
+        path,
+        columns=["ID"],
+        start=pd.Timestamp("2013-02-01"),
+        end=pd.Timestamp("2016-06-15"),
+        precincts=[2, 10],
+        flags=["serious"],
+        geometry=False,
+    )
+    assert list(result.columns) == ["ID"]
+    assert sorted(result["ID"]) == [1, 3]
+
+
+def test_write_read_traffic(tmp_path, stored_traffic):
+    """Traffic should be read back sorted by datetime and plaza, with filters."""
+    path = str(tmp_path / "traffic")
+    src.storage.write_traffic(stored_traffic, path)
+    result = src.storage.read_traffic(path)
+    assert list(result["VEHICLES"]) == [40, 30, 20, 10]
+    assert result["PLAZA"].dtype == stored_traffic["PLAZA"].dtype
+
+    result = src.storage.read_traffic(
+        path, start=pd.Timestamp("2020-01-01"), plazas=[1]
+    )
+    assert list(result["VEHICLES"]) == [30, 10]
+
+
+def test_iter_traffic(tmp_path, stored_traffic):
+    """Traffic batches should be read in datetime and plaza order."""
+    path = str(tmp_path / "traffic")
+    src.storage.write_traffic(stored_traffic, path)
+    batches = list(src.storage.iter_traffic(path, ["VEHICLES"], batch_size=1))
+    assert len(batches) == 4
+    result = pd.concat(batches)
+    assert list(result.columns) == ["VEHICLES"]
+    assert list(result["VEHICLES"]) == [40, 30, 20, 10]
+    assert result.index.equals(stored_traffic.index.sort_values())
@@ -0,0 +1,50 @@
+"""Tests for tile pyramid functions."""
+
+import json
+import numpy as np
+import pandas as pd
+import src.tiles
+
+
+def make_map_data(n=1000, seed=0):
+    """Return random marker map data around NYC."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "LAT": 40.5 + rng.random(n) * 0.4,
+            "LONG": -74.2 + rng.random(n) * 0.5,
+            "DATE": rng.choice(["01/02/2023", "01/03/2023"], n),
+            "INJURED": rng.integers(0, 3, n),
+        }
+    )
+
+
+def test_build_tile_pyramid_counts():
+    """Every zoom should have each point once, in a cluster or as a point."""
+    map_data = make_map_data()
+    tiles = src.tiles.build_tile_pyramid(map_data, min_zoom=9, leaf_zoom=14)
+    for zoom in range(9, 15):
+        zoom_tiles = [tile for (z, _, _), tile in tiles.items() if z == zoom]
+        counts = sum(row[2] for tile in zoom_tiles for row in tile["clusters"])
+        counts += sum(len(tile["points"]) for tile in zoom_tiles)
+        assert counts == len(map_data)
+    leaf_points = [
+        row for (z, _, _), t in tiles.items() if z == 14 for row in t["points"]
+    ]
+    assert sorted(leaf_points) == sorted(
+        [round(lat, 5), round(long, 5), date, injured]
+        for lat, long, date, injured in map_data.itertuples(index=False)
+    )
+
+
+def test_write_tile_pyramid(tmp_path):
+    """Tiles should be written where the metadata bounds say they are."""
+    path = tmp_path / "tiles"
+    src.tiles.write_tile_pyramid(make_map_data(n=50), str(path), 10, 12)
+    metadata = json.loads((path / src.tiles.PYRAMID_FILENAME).read_text())
+    assert metadata["min_zoom"] == 10 and metadata["leaf_zoom"] == 12
+    x_min, y_min, x_max, y_max = metadata["bounds"]["12"]
+    for tile_path in (path / "12").glob("*/*.json"):
+        x, y = int(tile_path.parent.name), int(tile_path.stem)
+        assert x_min <= x <= x_max and y_min <= y <= y_max
+        assert json.loads(tile_path.read_text())["points"]
@@ -3,9 +3,94 @@
 from datetime import datetime
 import numpy as np
 import pandas as pd
+import pytest
 from shapely.geometry import Point, Polygon
 from shapely.strtree import STRtree
 import src.utils
+from src.constants import SEASONS
+
+
+def make_crosstab_data():
+    """Return categories, index, columns, and values for crosstab tests."""
+    rng = np.random.default_rng(0)
+    size = 2000
+    cats = pd.Series(rng.choice(["a", "b", "c"], size))
+    idx = pd.Series(rng.integers(0, 7, size), name="day")
+    cols = pd.Series(rng.integers(0, 24, size), name="hour")
+    cols[cats == "c"] = cols[cats == "c"] % 3  # category with fewer columns
+    values = rng.integers(0, 100, size).astype(float)
+    return cats, idx, cols, values
+
+
+def test_crosstabs_across_categories_match_pd_crosstab():
+    """Crosstab for each category should match pd.crosstab of category rows."""
+    cats, idx, cols, values = make_crosstab_data()
+    for aggfunc, vals in [(None, None), ("sum", values), ("mean", values)]:
+        _, _, tables = src.utils.crosstabs_across_categories(
+            ["a", "c"], cats, idx, cols, vals, aggfunc, divisor=2
+        )
+        for cat, table in tables.items():
+            is_cat = (cats == cat).to_numpy()
+            expected = pd.crosstab(
+                index=idx[is_cat],
+                columns=cols[is_cat],
+                values=None if vals is None else vals[is_cat],
+                aggfunc=aggfunc,
+            )
+            pd.testing.assert_frame_equal(table, expected / 2, check_dtype=False)
+
+
+def test_crosstabs_across_categories_missing_values():
+    """Cells, rows, and columns without values should match pd.crosstab."""
+    cats = pd.Series(["a"] * 6 + ["b"] * 3)
+    idx = pd.Series(["x", "x", "y", "y", "z", "z", "x", "y", "y"])
+    cols = pd.Series(["u", "v", "u", "v", "u", "v", "u", "u", "v"])
+    values = pd.Series([1, np.nan, np.nan, 4, np.nan, np.nan, 2, np.nan, 5])
+    for aggfunc in src.utils.CROSSTAB_AGGFUNCS:
+        _, _, tables = src.utils.crosstabs_across_categories(
+            ["a", "b"], cats, idx, cols, values, aggfunc
+        )
+        for cat, table in tables.items():
+            is_cat = (cats == cat).to_numpy()
+            expected = pd.crosstab(
+                index=idx[is_cat],
+                columns=cols[is_cat],
+                values=values[is_cat],
+                aggfunc=aggfunc,
+            )
+            pd.testing.assert_frame_equal(table, expected, check_dtype=False)
+
+    for aggfunc in ["min", "max"]:
+        result = src.utils.min_max_across_crosstabs(
+            ["a", "b"], cats, idx, cols, values, aggfunc
+        )
+        assert result == (1.0, 5.0)
+
+
+def test_min_max_across_crosstabs():
+    """Min and max should be taken across the crosstabs of all categories."""
+    cats, idx, cols, values = make_crosstab_data()
+    tables = [
+        pd.crosstab(
+            index=idx[cats == cat],
+            columns=cols[cats == cat],
+            values=values[cats == cat],
+            aggfunc="sum",
+        )
+        for cat in ("a", "b")
+    ]
+    expected = (min(t.min().min() for t in tables), max(t.max().max() for t in tables))
+    result = src.utils.min_max_across_crosstabs(
+        ["a", "b"], cats, idx, cols, values, aggfunc="sum"
+    )
+    assert result == expected
+
+
+def test_min_max_across_crosstabs_requires_aggfunc():
+    """Values without an aggregation function should raise TypeError."""
+    cats, idx, cols, values = make_crosstab_data()
+    with pytest.raises(TypeError):
+        src.utils.min_max_across_crosstabs(["a"], cats, idx, cols, values)
 
 
 def test_date_to_season():
@@ -40,6 +125,24 @@ def test_date_to_season():
         assert src.utils.date_to_season(k) == v
 
 
+def test_dates_to_seasons_matches_date_to_season():
+    """Vectorized seasons should match date_to_season for leap and non-leap years."""
+    dates = pd.date_range("1999-01-01", "2001-01-01", freq="D")
+    expected = [src.utils.date_to_season(x) for x in dates]
+    seasons = src.utils.dates_to_seasons(dates)
+    assert list(seasons) == expected
+    assert tuple(seasons.categories) == SEASONS
+
+
+def test_dates_to_seasons_missing_dates():
+    """Missing dates should be missing seasons."""
+    dates = np.array(["2000-03-21", "NaT", "1900-03-20"], dtype="datetime64[ns]")
+    seasons = src.utils.dates_to_seasons(dates)
+    assert seasons[0] == "Spring"
+    assert pd.isna(seasons[1])
+    assert seasons[2] == "Winter"
+
+
 def create_squares(start, end, increment):
     """Return R tree constructed from square shapely geometries and list of ids."""
     shapes = []
@@ -76,3 +179,48 @@ def test_id_nearest_shape_point_invalid():
     rtree, shape_ids = create_squares(0, 10, 2)
     invalid = Point(np.nan, np.nan)
     assert src.utils.id_nearest_shape(invalid, rtree, shape_ids) is None
+
+
+def test_ids_nearest_shapes_matches_id_nearest_shape():
+    """Bulk lookup should match the per-geometry lookup, including invalid points."""
+    rtree, shape_ids = create_squares(0, 10, 2)
+    points = [Point(x, x) for x in np.arange(0.5, 10, 2)]
+    points += [Point(x - 0.1, x - 0.1) for x in np.arange(0, 10, 2)]
+    points += [Point(np.nan, np.nan), Point(), None]
+    expected = [src.utils.id_nearest_shape(p, rtree, shape_ids) for p in points[:-1]]
+    expected.append(None)
+    assert list(src.utils.ids_nearest_shapes(points, rtree, shape_ids)) == expected
+
+
+def test_ids_nearest_shapes_workers():
+    """Lookup split across worker processes should match single-process lookup."""
+    rtree, shape_ids = create_squares(0, 10, 2)
+    points = [Point(x, x) for x in np.arange(-1, 11, 0.25)]
+    points[::5] = [Point()] * len(points[::5])
+    expected = src.utils.ids_nearest_shapes(points, rtree, shape_ids)
+    with src.utils.nearest_shapes_pool({"squares": rtree}, workers=3) as executor:
+        result = src.utils.ids_nearest_shapes(
+            points, rtree, shape_ids, executor, "squares"
+        )
+        # the pool is reused for further lookups
+        again = src.utils.ids_nearest_shapes(
+            points[::-1], rtree, shape_ids, executor, "squares"
+        )
+    assert list(result) == list(expected)
+    assert list(again) == list(expected[::-1])
+
+
+def test_ids_nearest_shapes_all_invalid():
+    """Input with no valid geometries should return all None."""
+    rtree, shape_ids = create_squares(0, 10, 2)
+    points = [Point(np.nan, np.nan), Point()]
+    assert list(src.utils.ids_nearest_shapes(points, rtree, shape_ids)) == [None, None]
+
+
+def test_points_from_lat_long():
+    """Points should be (long, lat) and missing coordinates should be empty."""
+    lat = pd.Series([40.7, np.nan, 40.8, np.nan])
+    long = pd.Series([-73.9, -74.0, np.nan, np.nan])
+    points = src.utils.points_from_lat_long(lat, long)
+    assert points[0].equals(Point(-73.9, 40.7))
+    assert all(p.is_empty for p in points[1:])
@@ -0,0 +1,107 @@
+"""Tests for visualization functions."""
+
+import geopandas as gpd
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import shapely
+import src.cube
+import src.visualizations as viz
+
+
+def test_render_charts(tmp_path):
+    """Charts should be saved without opening any pyplot figures."""
+    plt.close("all")
+    df = pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]}, index=["x", "y", "z"])
+    crosstab = pd.DataFrame(np.arange(12.0).reshape(3, 4))
+    labels = {"title": "", "x_label": "", "y_label": "", "cbar_label": ""}
+    specs = [
+        {"kind": "grouped_bar_chart", "df": df, "figsize": (4, 3)},
+        {"kind": "heat_map", "pd_ct": crosstab, "labels": labels, "fig_size": (4, 3)},
+        {"kind": "line_chart", "list_x_y_tuples": [([0, 1], [1, 0])]},
+    ]
+    for i, spec in enumerate(specs):
+        spec["save"] = tmp_path / f"chart-{i}.png"
+    viz.render_charts(specs)
+    assert all(spec["save"].stat().st_size > 0 for spec in specs)
+    assert not plt.get_fignums()
+
+
+def test_chart_not_shown_is_closed(tmp_path):
+    """Charts that are not shown should be closed after saving."""
+    plt.close("all")
+    viz.horizontal_bar_chart(
+        ["a", "b"], [1, 2], save=tmp_path / "chart.png", show=False, figsize=(4, 3)
+    )
+    assert (tmp_path / "chart.png").exists()
+    assert not plt.get_fignums()
+
+
+def test_pack_marker_data():
+    """Packed marker data should unpack to the rounded map data rows."""
+    map_data = pd.DataFrame(
+        {
+            "LAT": [40.712345678, 40.6, 40.8],
+            "LONG": [-73.9, -74.01234567, -73.95],
+            "DATE": ["01/02/2023", "01/03/2023", "01/02/2023"],
+            "INJURED": [1, 0, 2],
+        }
+    )
+    packed = viz.pack_marker_data(map_data)
+    lat = np.cumsum(packed["lat"]) / packed["scale"]
+    long = np.cumsum(packed["long"]) / packed["scale"]
+    dates = packed["fields"][0]
+    injured = packed["fields"][1]
+    rows = {
+        (lat[i], long[i], dates["values"][dates["codes"][i]], injured["data"][i])
+        for i in range(len(map_data))
+    }
+    assert rows == {
+        (40.71235, -73.9, "01/02/2023", 1),
+        (40.6, -74.01235, "01/03/2023", 0),
+        (40.8, -73.95, "01/02/2023", 2),
+    }
+    assert dates["values"] == ["01/03/2023", "01/02/2023"]
+
+
+def test_choropleth_gdf_matches_prep_choropleth_df():
+    """Choropleth values from region totals should match prep_choropleth_df."""
+    index = pd.date_range("2020-01-01", periods=6, freq="90D", name="datetime")
+    crashes = pd.DataFrame(
+        {
+            "ID": range(6),
+            "INJURED": [1, 0, 2, 0, 1, 0],
+            "KILLED": [0, 0, 1, 0, 0, 0],
+            "serious": [True, False, True, False, True, False],
+            "non-motorist": False,
+            "cyclist": False,
+            "pedestrian": [True, False, False, False, True, False],
+            "precinct": pd.Categorical(["1", "1", "5", "5", "5", "1"]),
+        },
+        index=index,
+    )
+    geoseries = gpd.GeoSeries(
+        [shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1), shapely.box(2, 0, 3, 1)],
+        index=pd.Index([1, 5, 10], name="precinct"),
+    )
+    serious = crashes[crashes["serious"]]
+    expected = viz.prep_choropleth_df(
+        serious,
+        pd.Series(True, index=serious.index),
+        "precinct",
+        "ID",
+        geoseries,
+        divisor=2,
+        round_agg_values=True,
+        round_decimal=1,
+    )
+    totals = src.cube.region_totals(crashes, "precinct")
+    result = viz.choropleth_gdf(
+        totals, geoseries, "serious", divisor=2, round_decimal=1, value_col="ID"
+    )
+    assert list(result.columns) == list(expected.columns)
+    assert result["ID"].to_dict() == {1: 0.5, 5: 1.0, 10: 0.0}
+    assert result.loc[[1, 5], "ID"].tolist() == expected["ID"].tolist()
+
+    result = viz.choropleth_gdf(totals, geoseries, "pedestrian", years=[2020])
+    assert result["count"].to_dict() == {1: 1, 5: 1, 10: 0}